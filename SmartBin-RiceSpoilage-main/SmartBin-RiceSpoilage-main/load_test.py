@@ -0,0 +1,264 @@
+"""
+GrainHero ML Service - Load Test
+How many silos can one main.py instance serve?
+
+Replays simulated sensor traffic: N silos each report once every --cadence
+seconds (at a random phase), so the offered load is N / cadence requests per
+second. The silo count is stepped up until the service saturates, and each
+step reports offered vs achieved throughput, latency percentiles and the
+error rate. Latency is measured from the scheduled send time, so time spent
+queueing behind a saturated service is counted.
+
+A step is saturated when achieved throughput falls below 90% of the offered
+rate, p99 latency exceeds --slo-ms, or the error rate exceeds --max-error-rate.
+The first such step is the saturation point; the step before it is the
+reported capacity.
+
+Targets (both offline):
+  - in-process (default): the FastAPI app from main.py through httpx's ASGI
+    transport; sync handlers run in the same threadpool uvicorn would use,
+    but the load generator shares the process (and CPU) with the service
+  - --url http://127.0.0.1:8000: a locally started `uvicorn main:app`
+
+Readings come from the farmHomeBackend silo simulator (silo_simulator.py)
+when it is found next to this repo, otherwise from a small built-in random
+walk.
+
+Requires httpx (listed in requirements.txt; fastapi and uvicorn do not
+install it).
+
+Usage:
+  python load_test.py [--silos 100 500 1000 2000] [--cadence 1] [--duration 10]
+  python load_test.py --url http://127.0.0.1:8000 --output load_test.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import httpx
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SIMULATOR_DIR = os.path.join(HERE, "..", "..", "farmHomeBackend-main", "ml")
+DEFAULT_SILOS = [50, 100, 200, 500, 1000, 2000, 5000]
+GRAIN_NAMES = {1: "Rice", 2: "Wheat", 3: "Maize", 4: "Sorghum", 5: "Barley"}
+
+
+# ── Simulated traffic ───────────────────────────────────────────────────────
+def _simulated_readings(rows, seed):
+    """Readings from the silo simulator, or None if it is not available."""
+    if SIMULATOR_DIR not in sys.path:
+        sys.path.append(SIMULATOR_DIR)
+    try:
+        from silo_simulator import standard_workload
+    except ImportError:
+        return None
+    df = standard_workload(rows, seed=seed)
+    return [
+        {
+            "grain_type": GRAIN_NAMES.get(int(r.Grain_Type), "Wheat"),
+            "temperature": round(float(r.Temperature), 2),
+            "humidity": round(float(r.Humidity), 2),
+            "moisture_content": round(float(r.Grain_Moisture), 2),
+            "dew_point": round(float(r.Dew_Point), 2),
+            "days_in_storage": float(r.Storage_Days),
+            "light_exposure": round(float(r.Ambient_Light), 2),
+        }
+        for r in df.itertuples(index=False)
+    ]
+
+
+def _random_walk_readings(rows, seed):
+    """Fallback traffic: bounded random walks around typical silo conditions."""
+    rng = np.random.default_rng(seed)
+    temp = np.clip(25 + np.cumsum(rng.normal(0, 0.3, rows)), 5, 45)
+    hum = np.clip(60 + np.cumsum(rng.normal(0, 0.8, rows)), 20, 98)
+    moist = np.clip(13 + np.cumsum(rng.normal(0, 0.05, rows)), 8, 25)
+    return [
+        {"grain_type": "Rice", "temperature": round(float(t), 2), "humidity": round(float(h), 2),
+         "moisture_content": round(float(m), 2)}
+        for t, h, m in zip(temp, hum, moist)
+    ]
+
+
+def load_readings(rows=20_000, seed=42):
+    readings = _simulated_readings(rows, seed)
+    source = "silo_simulator"
+    if readings is None:
+        readings, source = _random_walk_readings(rows, seed), "random_walk"
+    return readings, source
+
+
+def schedule(n_silos, cadence, duration, seed=0):
+    """Send offsets (seconds) and silo ids: each silo reports every `cadence` s."""
+    rng = np.random.default_rng(seed)
+    phases = rng.uniform(0, cadence, n_silos)
+    reports = int(np.ceil(duration / cadence))
+    offsets = (phases[:, None] + cadence * np.arange(reports)[None, :]).ravel()
+    silos = np.repeat(np.arange(n_silos), reports)
+    keep = offsets < duration
+    order = np.argsort(offsets[keep], kind="stable")
+    return offsets[keep][order], silos[keep][order]
+
+
+# ── Load generation ─────────────────────────────────────────────────────────
+def _client(url, timeout):
+    if url:
+        return httpx.AsyncClient(base_url=url, timeout=timeout)
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    # main.py resolves MODEL_PATH against the working directory
+    os.environ.setdefault("MODEL_PATH", os.path.join(HERE, "smartbin_model.pkl"))
+    from main import app
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest",
+                             timeout=timeout)
+
+
+async def run_step(client, endpoint, readings, n_silos, cadence, duration, max_in_flight, seed=0):
+    """Offer n_silos / cadence requests per second for `duration` seconds."""
+    offsets, silos = schedule(n_silos, cadence, duration, seed)
+    latencies, errors = [], {}
+    limit = asyncio.Semaphore(max_in_flight)
+
+    async def send(due, silo, k):
+        reading = readings[(int(silo) + k * n_silos) % len(readings)]
+        async with limit:
+            try:
+                response = await client.post(endpoint, json={"features": reading})
+                ok = response.status_code == 200
+                key = None if ok else str(response.status_code)
+            except httpx.HTTPError as exc:
+                key = type(exc).__name__
+        if key is None:
+            latencies.append(time.perf_counter() - due)
+        else:
+            errors[key] = errors.get(key, 0) + 1
+
+    start = time.perf_counter()
+    tasks = []
+    for k, (offset, silo) in enumerate(zip(offsets, silos)):
+        due = start + offset
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(due, silo, k)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    sent = len(offsets)
+    failed = sum(errors.values())
+    lat = np.asarray(latencies) * 1000 if latencies else np.array([np.nan])
+    return {
+        "silos": n_silos,
+        "requests": sent,
+        "offered_rps": round(sent / duration, 1),
+        "achieved_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(lat, 50)), 2),
+        "p95_ms": round(float(np.percentile(lat, 95)), 2),
+        "p99_ms": round(float(np.percentile(lat, 99)), 2),
+        "max_ms": round(float(lat.max()), 2),
+        "error_rate": round(failed / sent, 4) if sent else 0.0,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def saturated(step, slo_ms, max_error_rate):
+    """Reasons this step counts as saturated (empty if it kept up)."""
+    reasons = []
+    if step["achieved_rps"] < 0.9 * step["offered_rps"]:
+        reasons.append("throughput")
+    if not step["p99_ms"] <= slo_ms:
+        reasons.append("latency")
+    if step["error_rate"] > max_error_rate:
+        reasons.append("errors")
+    return reasons
+
+
+async def run(args):
+    readings, source = load_readings(seed=args.seed)
+    target = args.url or "in-process"
+    print(f"Target: {target}{args.endpoint}  cadence={args.cadence}s  duration={args.duration}s  "
+          f"readings={source}")
+    steps, saturation = [], None
+    async with _client(args.url, args.timeout) as client:
+        health = await client.get("/health")
+        print(f"Health: {health.json()}")
+        # Warm up connections, the threadpool and the model
+        for reading in readings[:20]:
+            await client.post(args.endpoint, json={"features": reading})
+
+        print(f"\n{'silos':>7} {'offered':>9} {'achieved':>9} {'p50 ms':>9} {'p95 ms':>9} "
+              f"{'p99 ms':>9} {'errors':>7}")
+        for i, n_silos in enumerate(sorted(args.silos)):
+            step = await run_step(client, args.endpoint, readings, n_silos, args.cadence,
+                                  args.duration, args.max_in_flight, seed=args.seed + i)
+            step["saturated"] = saturated(step, args.slo_ms, args.max_error_rate)
+            steps.append(step)
+            print(f"{n_silos:>7} {step['offered_rps']:>9.1f} {step['achieved_rps']:>9.1f} "
+                  f"{step['p50_ms']:>9.2f} {step['p95_ms']:>9.2f} {step['p99_ms']:>9.2f} "
+                  f"{step['error_rate']:>7.2%}  {', '.join(step['saturated'])}")
+            if step["saturated"]:
+                saturation = saturation or step
+                if not args.keep_going:
+                    break
+
+    capacity = next((s for s in reversed(steps) if not s["saturated"] and
+                     (saturation is None or s["silos"] < saturation["silos"])), None)
+    if capacity:
+        print(f"\nCapacity: {capacity['silos']} silos at a {args.cadence}s cadence "
+              f"({capacity['achieved_rps']} req/s, p99 {capacity['p99_ms']} ms)")
+    else:
+        print("\nCapacity: saturated at the smallest step")
+    if saturation:
+        print(f"Saturation: {saturation['silos']} silos ({', '.join(saturation['saturated'])})")
+    else:
+        print("Saturation: not reached - try larger --silos")
+
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "target": target,
+        "endpoint": args.endpoint,
+        "cadence_s": args.cadence,
+        "duration_s": args.duration,
+        "slo_ms": args.slo_ms,
+        "max_error_rate": args.max_error_rate,
+        "readings": source,
+        "steps": steps,
+        "capacity": capacity,
+        "saturation": saturation,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for the GrainHero ML service.")
+    parser.add_argument("--url", help="base URL of a running service (default: run main.py in-process)")
+    parser.add_argument("--endpoint", default="/predict")
+    parser.add_argument("--silos", nargs="+", type=int, default=DEFAULT_SILOS,
+                        help="silo counts to step through")
+    parser.add_argument("--cadence", type=float, default=1.0,
+                        help="seconds between two reports from the same silo")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per step")
+    parser.add_argument("--max-in-flight", type=int, default=256,
+                        help="concurrent requests the load generator allows")
+    parser.add_argument("--timeout", type=float, default=10.0, help="per-request timeout (s)")
+    parser.add_argument("--slo-ms", type=float, default=500.0, help="p99 latency objective")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--keep-going", action="store_true", help="run every step even after saturation")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results: {args.output}")
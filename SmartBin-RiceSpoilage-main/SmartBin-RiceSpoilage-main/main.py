@@ -7,28 +7,198 @@ and outputs one of 3 classes: Safe (0), Risky (1), Spoiled (2).
 """
 
 import os
+import sys
 import math
+import time
+import functools
+import threading
+import json
 import joblib
 import numpy as np
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from typing import Optional
 
-# ── Load model once at startup ──────────────────────────────────────────────
+from metrics import registry, StageTimer, CONTENT_TYPE, BATCH_BUCKETS, process_rss_bytes
+
+# ── Shared GrainHero ML modules ─────────────────────────────────────────────
+# Profiling, drift monitoring, the prediction log and the per-estimator
+# memory breakdown use modules from farmHomeBackend-main/ml. They are only
+# imported when GRAINHERO_ML_DIR points at that directory; requesting
+# profiling or the prediction log without it stops the service at startup.
+ML_DIR = os.getenv("GRAINHERO_ML_DIR")
+if ML_DIR:
+    ML_DIR = os.path.abspath(ML_DIR)
+    if not os.path.isdir(ML_DIR):
+        raise RuntimeError(f"GRAINHERO_ML_DIR={ML_DIR} is not a directory")
+    sys.path.append(ML_DIR)
+
+
+def require_ml_dir(setting):
+    """Stop startup if `setting` is used without GRAINHERO_ML_DIR."""
+    if not ML_DIR:
+        raise RuntimeError(f"{setting} needs GRAINHERO_ML_DIR (the farmHomeBackend-main/ml directory)")
+
+
+# ── Optional profiling ──────────────────────────────────────────────────────
+# GRAINHERO_PROFILE_DIR=<dir> profiles each handler call with cProfile and
+# tracemalloc (see profiling_hooks.py in GRAINHERO_ML_DIR).
+# When unset the handlers are not wrapped at all.
+PROFILE_DIR = os.getenv("GRAINHERO_PROFILE_DIR")
+
+
+def profiled(name=None):
+    return lambda fn: fn
+
+
+if PROFILE_DIR:
+    require_ml_dir("GRAINHERO_PROFILE_DIR")
+    from profiling_hooks import profiled
+    print(f"[ML] Profiling handlers into {PROFILE_DIR}")
+
+
+# ── Model cache ─────────────────────────────────────────────────────────────
+# Loaded at startup and kept until the file changes: every request compares
+# the file's (mtime, size) with those of the loaded copy (one stat call) and
+# reloads on a mismatch, so a retrained model is served without a restart.
+# Lookups are counted in grainhero_cache_lookups_total{cache="model"}.
 MODEL_PATH = os.getenv("MODEL_PATH", "smartbin_model.pkl")
 
-try:
-    model = joblib.load(MODEL_PATH)
-    MODEL_LOADED = True
-    print(f"[ML] Model loaded successfully from {MODEL_PATH}")
-except Exception as exc:
-    model = None
-    MODEL_LOADED = False
-    print(f"[ML] WARNING: Could not load model from {MODEL_PATH}: {exc}")
+
+class ModelCache:
+    """The model loaded from `path`, reloaded by get() when the file changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.model = None
+        self.stamp = None          # (mtime_ns, size) of the loaded file
+        self.failed = None         # stamp of a file that did not load
+        self.load_seconds = None
+        self.resident_bytes = None
+        self._lock = threading.Lock()
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def load(self, stamp=None):
+        """(Re)load the model; on failure the previously loaded one stays."""
+        stamp = stamp or self._file_stamp()
+        try:
+            # Import the model library first so the RSS delta below is the model alone
+            import xgboost  # noqa: F401
+            rss_before = process_rss_bytes()
+            load_start = time.perf_counter()
+            self.model = joblib.load(self.path)
+            self.load_seconds = time.perf_counter() - load_start
+            if rss_before is not None:
+                self.resident_bytes = max(0, process_rss_bytes() - rss_before)
+            self.stamp = stamp
+            print(f"[ML] Model loaded successfully from {self.path}")
+        except Exception as exc:
+            self.failed = stamp
+            print(f"[ML] WARNING: Could not load model from {self.path}: {exc}")
+
+    def get(self):
+        """The current model (None if none could be loaded)."""
+        stamp = self._file_stamp()
+        if stamp is not None and stamp != self.stamp and stamp != self.failed:
+            with self._lock:
+                if stamp != self.stamp:
+                    self.load(stamp)
+                    registry.inc("grainhero_cache_lookups_total", (("cache", "model"), ("result", "miss")))
+                    return self.model
+        registry.inc("grainhero_cache_lookups_total", (("cache", "model"), ("result", "hit")))
+        return self.model
+
+
+model_cache = ModelCache(MODEL_PATH)
+model_cache.load()
 
 LABEL_MAP = {0: "Safe", 1: "Risky", 2: "Spoiled"}
 
+
+# ── Optional drift monitoring ───────────────────────────────────────────────
+# With GRAINHERO_ML_DIR set, readings are counted per grain against the
+# training-data histograms stored as "drift_reference" in the model's metadata
+# JSON, written at training time or with `python drift_monitor.py
+# --build-reference <training csv> --metadata <model>_metadata.json` (in
+# GRAINHERO_ML_DIR). Counts live in memory; scores are served by /drift and
+# /metrics.
+SERVICE_FEATURES = ["Temperature", "Humidity", "Grain_Moisture", "Dew_Point"]
+MODEL_METADATA_PATH = os.getenv("MODEL_METADATA_PATH", os.path.splitext(MODEL_PATH)[0] + "_metadata.json")
+
+drift = None
+DRIFT_REFERENCE = None
+if ML_DIR and os.path.exists(MODEL_METADATA_PATH):
+    from drift_monitor import DriftMonitor
+    try:
+        with open(MODEL_METADATA_PATH) as f:
+            DRIFT_REFERENCE = json.load(f).get("drift_reference")
+        if DRIFT_REFERENCE:
+            drift = DriftMonitor(state_dir=None)
+            print(f"[ML] Drift monitoring against {MODEL_METADATA_PATH}")
+    except (OSError, ValueError) as exc:
+        print(f"[ML] WARNING: drift monitoring unavailable: {exc}")
+
+
+# ── Optional prediction log ─────────────────────────────────────────────────
+# GRAINHERO_PREDICTION_LOG=<dir> (or --prediction-log) records each reading,
+# its class probabilities and the model file's hash in the binary log of
+# prediction_logger.py (in GRAINHERO_ML_DIR). Requests only queue the
+# record; a background thread writes it.
+PREDICTION_LOG_DIR = os.getenv("GRAINHERO_PREDICTION_LOG")
+
+prediction_log = None
+if PREDICTION_LOG_DIR:
+    require_ml_dir("GRAINHERO_PREDICTION_LOG")
+    import prediction_logger
+    prediction_log = prediction_logger.PredictionLogger(PREDICTION_LOG_DIR, SERVICE_FEATURES)
+    print(f"[ML] Logging predictions of model {prediction_logger.model_fingerprint(MODEL_PATH)} "
+          f"to {PREDICTION_LOG_DIR}")
+
+
+# ── Model memory accounting ─────────────────────────────────────────────────
+# Sizes come from model_footprint.py in GRAINHERO_ML_DIR (shared with
+# smartbin_predict.py --memory); without GRAINHERO_ML_DIR /memory reports no
+# per-estimator breakdown.
+if ML_DIR:
+    from model_footprint import estimator_memory
+else:
+    estimator_memory = None
+
+
+def model_memory():
+    """Memory report for the loaded model (computed once per loaded file)."""
+    if model_cache.model is None:
+        return None
+    return _model_memory(model_cache.stamp)
+
+
+@functools.lru_cache(maxsize=1)
+def _model_memory(stamp):
+    return {
+        "model_path": MODEL_PATH,
+        "serialized_bytes": stamp[1],
+        "rss_delta_bytes": model_cache.resident_bytes,
+        "load_seconds": round(model_cache.load_seconds, 3),
+        "estimators": estimator_memory(model_cache.model) if estimator_memory else None,
+    }
+
+
+def _structure_bytes():
+    report = model_memory()
+    if report is None or report["estimators"] is None:
+        return None
+    top = report["estimators"]
+    parts = top.get("estimators") or {"model": top}
+    return {(("estimator", name), ("type", p["type"])): p["bytes"] for name, p in parts.items()}
+
 # ── Risk score mapping ──────────────────────────────────────────────────────
 # Convert the class prediction + probabilities into a 0-100 risk score
 # that the Node.js backend expects.
@@ -61,6 +231,82 @@ app.add_middleware(
 )
 
 
+# ── Metrics (/metrics) ──────────────────────────────────────────────────────
+ENDPOINTS = {"/", "/health", "/predict", "/metrics", "/memory", "/drift"}
+KNOWN_GRAINS = {"rice", "wheat", "maize", "sorghum", "barley"}
+
+
+def _cache_hit_ratio():
+    lookups = registry.counter_values("grainhero_cache_lookups_total")
+    ratios = {}
+    for cache in {dict(labels)["cache"] for labels in lookups}:
+        hits = lookups.get((("cache", cache), ("result", "hit")), 0)
+        total = hits + lookups.get((("cache", cache), ("result", "miss")), 0)
+        ratios[(("cache", cache),)] = hits / total if total else None
+    return ratios
+
+
+def _drift_psi():
+    if drift is None:
+        return None
+    return {(("grain", grain), ("feature", feature)): s["psi"]
+            for grain, scores in drift.scores().items() for feature, s in scores["features"].items()}
+
+
+registry.counter("grainhero_http_requests_total", "HTTP requests by endpoint, method and status")
+registry.histogram("grainhero_http_request_duration_seconds", "End-to-end request latency by endpoint")
+registry.counter("grainhero_predictions_total", "Prediction requests by grain and outcome")
+registry.histogram("grainhero_predict_stage_duration_seconds",
+                   "Time spent in each /predict stage (validation includes body parsing)")
+registry.histogram("grainhero_predict_batch_size", "Readings scored per model call", BATCH_BUCKETS)
+registry.gauge("grainhero_model_load_seconds", "Time taken by the last model load",
+               lambda: model_cache.load_seconds)
+registry.gauge("grainhero_model_resident_bytes", "Resident memory added by the last model load",
+               lambda: model_cache.resident_bytes)
+registry.gauge("grainhero_model_serialized_bytes", "Size of the model file",
+               lambda: model_memory() and model_memory()["serialized_bytes"])
+registry.gauge("grainhero_model_structure_bytes", "Learned structures per estimator (booster, tree arrays)",
+               _structure_bytes)
+registry.gauge("grainhero_process_resident_bytes", "Resident memory of the service process",
+               process_rss_bytes)
+registry.counter("grainhero_cache_lookups_total", "Cache lookups by cache and result")
+registry.gauge("grainhero_cache_hit_ratio", "Cache hits / lookups", _cache_hit_ratio)
+registry.gauge("grainhero_feature_drift_psi", "Population stability index of recent readings vs training data",
+               _drift_psi)
+
+
+class MetricsMiddleware:
+    """Counts requests and times them end to end (plain ASGI, no extra task per request)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        scope.setdefault("state", {})["request_start"] = start
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            endpoint = scope["path"] if scope["path"] in ENDPOINTS else "other"
+            registry.inc("grainhero_http_requests_total",
+                         (("endpoint", endpoint), ("method", scope["method"]), ("status", str(status[0]))))
+            registry.observe("grainhero_http_request_duration_seconds", time.perf_counter() - start,
+                             (("endpoint", endpoint),))
+
+
+app.add_middleware(MetricsMiddleware)
+
+
 # ── Request / Response schemas ──────────────────────────────────────────────
 class PredictionFeatures(BaseModel):
     """
@@ -96,48 +342,100 @@ class PredictionResponse(BaseModel):
 
 # ── Endpoints ───────────────────────────────────────────────────────────────
 @app.get("/")
+@profiled("service.root")
 def root():
     return {
         "service": "GrainHero ML Service",
         "status": "online",
-        "model_loaded": MODEL_LOADED,
+        "model_loaded": model_cache.model is not None,
     }
 
 
 @app.get("/health")
+@profiled("service.health")
 def health():
+    model = model_cache.get()
     return {
-        "status": "healthy" if MODEL_LOADED else "degraded",
-        "model_loaded": MODEL_LOADED,
+        "status": "healthy" if model is not None else "degraded",
+        "model_loaded": model is not None,
         "model_path": MODEL_PATH,
-        "model_type": str(type(model).__name__) if model else None,
+        "model_type": str(type(model).__name__) if model is not None else None,
     }
 
 
-@app.post("/predict", response_model=PredictionResponse)
-def predict(request: PredictionRequest):
-    if not MODEL_LOADED or model is None:
+@app.get("/memory")
+def memory():
+    if model_cache.get() is None:
         raise HTTPException(status_code=503, detail="ML model is not loaded")
+    return dict(model_memory(), process_rss_bytes=process_rss_bytes())
+
+
+@app.get("/drift")
+def drift_scores():
+    return {
+        "enabled": drift is not None,
+        "metadata_path": MODEL_METADATA_PATH,
+        "grains": drift.scores() if drift is not None else {},
+    }
+
 
+@app.get("/metrics")
+def metrics():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
+def _grain_label(grain_type):
+    grain = (grain_type or "unknown").strip().lower()
+    return grain if grain in KNOWN_GRAINS or grain == "unknown" else "other"
+
+
+def _record_prediction(grain, outcome, timer):
+    registry.inc("grainhero_predictions_total", (("grain", grain), ("outcome", outcome)))
+    for stage, seconds in timer.stages.items():
+        registry.observe("grainhero_predict_stage_duration_seconds", seconds, (("stage", stage),))
+
+
+@app.post("/predict", response_model=PredictionResponse)
+@profiled("service.predict")
+def predict(request: PredictionRequest, http_request: Request):
+    # Time from the middleware's start to here: body parsing, validation, dispatch
+    timer = StageTimer(time.perf_counter, getattr(http_request.state, "request_start", None))
+    timer.stage("validation")
     f = request.features
+    grain = _grain_label(f.grain_type)
+
+    model = model_cache.get()
+    if model is None:
+        _record_prediction(grain, "unavailable", timer)
+        raise HTTPException(status_code=503, detail="ML model is not loaded")
 
     # Use sensible defaults when sensor data is missing
     temp = f.temperature if f.temperature is not None else 25.0
     hum = f.humidity if f.humidity is not None else 60.0
     moist = f.moisture_content if f.moisture_content is not None else 14.0
+    timer.stage("feature_assembly")
 
     # Calculate dew point if not provided
     dew = f.dew_point if f.dew_point is not None else approx_dew_point(temp, hum)
+    timer.stage("dew_point")
 
     # Build the 4-feature vector the model expects
     feature_vector = np.array([[temp, hum, moist, dew]])
+    timer.stage("feature_assembly")
 
+    if drift is not None:
+        drift.update(grain, feature_vector, DRIFT_REFERENCE, SERVICE_FEATURES)
+        timer.stage("drift")
+
+    outcome = "error"
     try:
+        registry.observe("grainhero_predict_batch_size", len(feature_vector))
         prediction = int(model.predict(feature_vector)[0])
         label = LABEL_MAP.get(prediction, "Unknown")
 
         # Try to get probability estimates for confidence
         confidence = 0.85  # default
+        probabilities = None
         try:
             probabilities = model.predict_proba(feature_vector)[0]
             confidence = round(float(max(probabilities)), 4)
@@ -151,8 +449,15 @@ def predict(request: PredictionRequest):
         except Exception:
             # Fallback: derive risk score from the label
             risk_score = float(RISK_WEIGHTS.get(label, 50))
+        timer.stage("inference")
+
+        if prediction_log is not None and probabilities is not None:
+            # Hashed once per model file (cached by size and mtime)
+            model_hash = prediction_logger.model_fingerprint(MODEL_PATH)
+            prediction_log.log(grain, model_hash, feature_vector, probabilities, list(LABEL_MAP.values()))
+            timer.stage("prediction_log")
 
-        return PredictionResponse(
+        response = PredictionResponse(
             risk_score=risk_score,
             label=label,
             confidence=confidence,
@@ -164,16 +469,37 @@ def predict(request: PredictionRequest):
                 "dew_point": dew,
             },
         )
+        timer.stage("response_build")
+        outcome = "ok"
+        return response
 
     except Exception as exc:
         raise HTTPException(
             status_code=500,
             detail=f"Prediction failed: {str(exc)}",
         )
+    finally:
+        _record_prediction(grain, outcome, timer)
 
 
 # ── Run with uvicorn when executed directly ─────────────────────────────────
 if __name__ == "__main__":
+    import argparse
     import uvicorn
+    parser = argparse.ArgumentParser(description="GrainHero ML Service")
+    parser.add_argument("--profile-dir", help="profile handlers into this directory "
+                                              "(same as GRAINHERO_PROFILE_DIR)")
+    parser.add_argument("--prediction-log", help="log predictions into this directory "
+                                                 "(same as GRAINHERO_PREDICTION_LOG)")
+    parser.add_argument("--ml-dir", help="farmHomeBackend-main/ml directory with the shared modules "
+                                         "(same as GRAINHERO_ML_DIR)")
+    args = parser.parse_args()
+    if args.ml_dir:
+        os.environ["GRAINHERO_ML_DIR"] = os.path.abspath(args.ml_dir)
+    # uvicorn imports main:app afresh, which picks these up
+    if args.profile_dir:
+        os.environ["GRAINHERO_PROFILE_DIR"] = os.path.abspath(args.profile_dir)
+    if args.prediction_log:
+        os.environ["GRAINHERO_PREDICTION_LOG"] = os.path.abspath(args.prediction_log)
     port = int(os.getenv("PORT", 8000))
     uvicorn.run("main:app", host="0.0.0.0", port=port, reload=False)
@@ -0,0 +1,195 @@
+"""
+GrainHero ML Service - Metrics
+Counters, histograms and gauges rendered in the Prometheus text exposition
+format (version 0.0.4) for the /metrics endpoint, without prometheus_client.
+
+Lock-light: every thread records into its own shard (threading.local), so
+inc()/observe() never take a lock or contend with the request threads of
+the threadpool. A lock is only taken when a new thread creates its shard
+and when /metrics merges the shards. Shards of threads that have exited
+(the threadpool retires idle workers) are folded into one retired shard at
+merge time, so the shard list stays as long as the number of live threads.
+Gauges are callbacks evaluated at scrape time.
+"""
+
+import bisect
+import math
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BATCH_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000)
+
+
+def process_rss_bytes():
+    """Resident set size of this process in bytes (None if unknown)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return None
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Shard:
+    __slots__ = ("counters", "histograms")
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def add(self, other):
+        """Add another shard's counts into this one."""
+        for key, value in list(other.counters.items()):
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, (buckets, total) in list(other.histograms.items()):
+            merged = self.histograms.setdefault(key, [[0] * len(buckets), 0.0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+
+
+class Registry:
+    def __init__(self):
+        self._meta = {}
+        self._gauges = {}
+        self._shards = []  # (thread, shard) per live recording thread
+        self._retired = _Shard()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    # ── Declaration ─────────────────────────────────────────────────────────
+    def counter(self, name, help_text):
+        self._meta[name] = ("counter", help_text, None)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self._meta[name] = ("histogram", help_text, tuple(buckets))
+
+    def gauge(self, name, help_text, fn):
+        """`fn()` returns a number, or a dict of label tuples -> number."""
+        self._meta[name] = ("gauge", help_text, None)
+        self._gauges[name] = fn
+
+    # ── Recording (no locks) ────────────────────────────────────────────────
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def inc(self, name, labels=(), value=1):
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        histograms = self._shard().histograms
+        key = (name, labels)
+        state = histograms.get(key)
+        if state is None:
+            state = histograms[key] = [[0] * (len(self._meta[name][2]) + 1), 0.0]
+        state[0][bisect.bisect_left(self._meta[name][2], value)] += 1
+        state[1] += value
+
+    # ── Exposition ──────────────────────────────────────────────────────────
+    def _merged(self):
+        merged = _Shard()
+        with self._lock:
+            # An exited thread no longer writes to its shard: fold it in for good
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    self._retired.add(shard)
+            self._shards = live
+            merged.add(self._retired)
+        for _, shard in live:
+            merged.add(shard)
+        return merged.counters, merged.histograms
+
+    def counter_values(self, name):
+        """Current totals of counter `name` by label tuple."""
+        counters, _ = self._merged()
+        return {labels: value for (metric, labels), value in counters.items() if metric == name}
+
+    def render(self):
+        counters, histograms = self._merged()
+        lines = []
+        for name, (kind, help_text, bounds) in self._meta.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            elif kind == "histogram":
+                for (metric, labels), (buckets, total) in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(bounds + (math.inf,), buckets):
+                        cumulative += count
+                        le = ("le", _format_value(bound))
+                        lines.append(f"{name}_bucket{_format_labels(labels, le)} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+            else:
+                try:
+                    value = self._gauges[name]()
+                except Exception:
+                    value = None
+                items = value.items() if isinstance(value, dict) else [((), value)]
+                for labels, v in items:
+                    if v is not None:
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(v)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class StageTimer:
+    """
+    Consecutive stage timings: `t.stage("name")` closes the stage that began
+    at the previous call (or at `start`). Repeated names accumulate.
+    """
+
+    __slots__ = ("_clock", "_last", "stages")
+
+    def __init__(self, clock, start=None):
+        self._clock = clock
+        self._last = clock() if start is None else start
+        self.stages = {}
+
+    def stage(self, name):
+        now = self._clock()
+        self.stages[name] = self.stages.get(name, 0.0) + (now - self._last)
+        self._last = now
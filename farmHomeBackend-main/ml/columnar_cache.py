@@ -0,0 +1,278 @@
+"""
+GrainHero Columnar Dataset Cache
+================================
+Parsed training datasets stored as one .npy file per column under
+ml/column_cache/, so repeated training runs memory-map the columns instead
+of re-parsing the CSV text.
+
+Each entry holds the output of dataset_loader.load_training_data (float32
+features after median imputation, int8 label codes) for one source file, or
+an ordered list of files read as one dataset, and a feature list:
+
+  column_cache/<entry>/manifest.json   per-source size/mtime/sha256, rows, label categories,
+                                       feature statistics (feature_stats.py)
+  column_cache/<entry>/<Feature>.npy   float32, one per feature
+  column_cache/<entry>/labels.npy      int8 codes into manifest['categories']
+
+An entry is reused while every source's size and mtime match. If they
+changed but the SHA-256 did not (e.g. a file was rewritten with the same
+contents), the manifest is refreshed and the entry kept; otherwise it is
+rebuilt. Entries whose sources no longer exist, and the oldest entries beyond
+max_entries, are pruned on the next build.
+
+Benchmark (CSV parse vs cache build vs memory-mapped reload):
+  python columnar_cache.py [--rows 1000000] [dataset.csv ...]
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from dataset_loader import load_training_data, DEFAULT_CHUNKSIZE
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(ML_DIR, 'column_cache')
+FORMAT_VERSION = 3
+CHUNK_SIZE = 1 << 20
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ColumnarCache:
+    """Memory-mapped .npy column store keyed by source file(s) and feature list."""
+
+    def __init__(self, root=CACHE_DIR, max_entries=16):
+        self.root = root
+        self.max_entries = max_entries
+
+    @staticmethod
+    def _sources(path):
+        return [os.path.abspath(p) for p in ([path] if isinstance(path, str) else path)]
+
+    def _entry_dir(self, path, features, fill_values=None):
+        fills = sorted((k, round(float(v), 6)) for k, v in fill_values.items()) if fill_values else None
+        ident = json.dumps([self._sources(path), list(features), FORMAT_VERSION, fills])
+        return os.path.join(self.root, hashlib.sha1(ident.encode()).hexdigest()[:16])
+
+    def _read_manifest(self, entry_dir):
+        try:
+            with open(os.path.join(entry_dir, 'manifest.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self, entry_dir, manifest):
+        tmp_path = os.path.join(entry_dir, 'manifest.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, os.path.join(entry_dir, 'manifest.json'))
+
+    def is_valid(self, path, features, fill_values=None):
+        """True if a cache entry matching the current source contents exists."""
+        entry_dir = self._entry_dir(path, features, fill_values)
+        manifest = self._read_manifest(entry_dir)
+        if manifest is None:
+            return False
+        touched = False
+        for source in manifest['sources']:
+            if not os.path.exists(source['path']):
+                return False
+            stat = os.stat(source['path'])
+            if source['size'] == stat.st_size and source['mtime_ns'] == stat.st_mtime_ns:
+                continue
+            if source['size'] != stat.st_size or source['sha256'] != file_sha256(source['path']):
+                return False
+            # Touched but unchanged: keep the columns, record the new mtime
+            source['mtime_ns'] = stat.st_mtime_ns
+            touched = True
+        if touched:
+            self._write_manifest(entry_dir, manifest)
+        return True
+
+    def build(self, path, features, chunksize=DEFAULT_CHUNKSIZE, fill_values=None):
+        """Parse the source(s) and write their columns; returns (X, labels, report)."""
+        sources = []
+        for source in self._sources(path):
+            stat = os.stat(source)
+            sources.append({'path': source, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                            'sha256': file_sha256(source)})
+        X, labels, report = load_training_data([s['path'] for s in sources], features, chunksize,
+                                               fill_values=fill_values)
+        self.prune()
+
+        entry_dir = self._entry_dir(path, features, fill_values)
+        os.makedirs(self.root, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix='.build_', dir=self.root)
+        try:
+            columns = {}
+            for i, col in enumerate(features):
+                name = f'{i:02d}_{col}.npy'
+                np.save(os.path.join(tmp_dir, name), X[col].to_numpy())
+                columns[col] = name
+            np.save(os.path.join(tmp_dir, 'labels.npy'), np.asarray(labels.codes))
+            self._write_manifest(tmp_dir, {
+                'format_version': FORMAT_VERSION,
+                'sources': sources,
+                'rows': len(X),
+                'features': list(features),
+                'columns': columns,
+                'categories': list(labels.categories),
+                'feature_stats': report['feature_stats'],
+                'built': time.time(),
+            })
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        report['cache'] = 'built'
+        return X, labels, report
+
+    def _open(self, path, features, fill_values=None):
+        entry_dir = self._entry_dir(path, features, fill_values)
+        manifest = self._read_manifest(entry_dir)
+        start = time.perf_counter()
+        X = pd.DataFrame({
+            col: np.load(os.path.join(entry_dir, manifest['columns'][col]), mmap_mode='r')
+            for col in features
+        }, copy=False)
+        codes = np.load(os.path.join(entry_dir, 'labels.npy'), mmap_mode='r')
+        labels = pd.Categorical.from_codes(codes, categories=manifest['categories'])
+        report = {
+            'rows': manifest['rows'],
+            'cache': 'hit',
+            'seconds': round(time.perf_counter() - start, 4),
+            'data_mb': round(sum(X[col].nbytes for col in features) / (1024 * 1024) + codes.nbytes / (1024 * 1024), 1),
+            'feature_stats': manifest['feature_stats'],
+        }
+        return X, labels, report
+
+    def load(self, path, features, chunksize=DEFAULT_CHUNKSIZE, verbose=True, fill_values=None):
+        """
+        Drop-in for dataset_loader.load_training_data: memory-maps the cached
+        columns when they are current, otherwise parses the CSV and caches it.
+        """
+        if self.is_valid(path, features, fill_values):
+            result = self._open(path, features, fill_values)
+        else:
+            result = self.build(path, features, chunksize, fill_values)
+        if verbose:
+            report = result[2]
+            print(f"   Column cache {report['cache']}: {report['rows']} rows")
+        return result
+
+    def invalidate(self, path=None):
+        """Drop the entries reading `path` (any feature list), or the whole cache."""
+        source = os.path.abspath(path) if path else None
+        self._drop(lambda sources: source is None or source in sources)
+
+    def prune(self):
+        """
+        Drop entries whose source files no longer exist (e.g. compacted
+        segments), then the oldest builds beyond max_entries.
+        """
+        self._drop(lambda sources: not all(os.path.exists(s) for s in sources))
+        if not os.path.isdir(self.root):
+            return
+        entries = []
+        for name in os.listdir(self.root):
+            manifest = self._read_manifest(os.path.join(self.root, name))
+            if manifest is not None:
+                entries.append((manifest['built'], name))
+        for _, name in sorted(entries, reverse=True)[self.max_entries - 1:]:
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def _drop(self, predicate):
+        if not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            entry_dir = os.path.join(self.root, name)
+            if name.startswith('.build_'):
+                continue
+            manifest = self._read_manifest(entry_dir)
+            if manifest is None or predicate([s['path'] for s in manifest.get('sources', [])]):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+
+
+# Global instance
+columnar_cache = ColumnarCache()
+
+
+def benchmark(paths, features, repeats=3):
+    """Time CSV parsing, cache build and memory-mapped reload per dataset."""
+    cache = ColumnarCache(tempfile.mkdtemp(prefix='column_cache_bench_'))
+    results = {}
+    try:
+        for path in paths:
+            parse = min(_timed(lambda: load_training_data(path, features, verbose=False)) for _ in range(repeats))
+            build = _timed(lambda: cache.build(path, features))
+            # Reload includes touching every column so mmap page-in is counted
+            reload = min(_timed(lambda: _touch(cache.load(path, features, verbose=False)))
+                         for _ in range(repeats))
+            results[os.path.basename(path)] = {
+                'csv_parse_s': round(parse, 4),
+                'cache_build_s': round(build, 4),
+                'cache_reload_s': round(reload, 4),
+                'speedup': round(parse / reload, 1) if reload > 0 else None,
+            }
+            r = results[os.path.basename(path)]
+            print(f"   {os.path.basename(path):32s} parse={r['csv_parse_s']:.3f}s  build={r['cache_build_s']:.3f}s  "
+                  f"reload={r['cache_reload_s']:.4f}s  ({r['speedup']}x)")
+    finally:
+        shutil.rmtree(cache.root, ignore_errors=True)
+    return results
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def _touch(result):
+    X, labels, _ = result
+    float(sum(X[col].to_numpy().sum() for col in X.columns))
+    int(np.asarray(labels.codes).sum())
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark CSV parsing against the columnar cache.')
+    parser.add_argument('datasets', nargs='*', help='CSV files (default: rice 10k + a tiled 1M-row copy)')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='rows in the synthetic large dataset')
+    args = parser.parse_args()
+
+    features = ['Temperature', 'Humidity', 'Storage_Days', 'Airflow', 'Dew_Point',
+                'Ambient_Light', 'Pest_Presence', 'Grain_Moisture', 'Rainfall']
+    datasets = args.datasets
+    scratch = None
+    if not datasets:
+        base = os.path.join(ML_DIR, 'rice_spoilage_10k.csv')
+        if not os.path.exists(base):
+            print(f"Dataset not found: {base}")
+            sys.exit(1)
+        scratch = tempfile.mkdtemp(prefix='column_cache_data_')
+        df = pd.read_csv(base)
+        large = os.path.join(scratch, f'synthetic_{args.rows}.csv')
+        pd.concat([df] * -(-args.rows // len(df)), ignore_index=True).iloc[:args.rows].to_csv(large, index=False)
+        datasets = [base, large]
+
+    print("Columnar cache benchmark")
+    try:
+        result = benchmark(datasets, features)
+        print(json.dumps(result, indent=2))
+    finally:
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
@@ -3,22 +3,51 @@ import numpy as np
 import os
 import json
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional
 import csv
+import hashlib
+from dataset_loader import spoilage_class_to_label, ChunkReader, complete_size
+from feature_stats import FeatureStats
+from columnar_cache import columnar_cache
+from segment_store import segment_store, SegmentStore
+from file_lock import file_lock, atomic_write_json
+
+# Bytes hashed at the start and at the previous end of the base file to
+# tell an append from a rewrite
+CHECK_BYTES = 4096
+
+FEATURE_COLUMNS = ['Temperature', 'Humidity', 'Grain_Moisture', 'Dew_Point',
+                   'Storage_Days', 'Airflow', 'Ambient_Light', 'Pest_Presence', 'Rainfall']
 
 class DataManager:
     """
     Manages the GrainHero ML training dataset.
     
     Base dataset:   grain_spoilage_dataset.csv  (10,000 synthetic + live readings appended by Firebase)
-    New data:       new_training_data.csv        (manually added batches, if any)
-    Combined:       combined_training_data.csv   (merged for training)
+    New data:       new_data_segments/           (manually added batches, append-only segments;
+                                                  a legacy new_training_data.csv is imported once)
+    Combined:       virtual view over base + segments (combined_sources / load_training_columns);
+                    combined_training_data.csv is only written by create_combined_dataset for export.
+                    Until the base file exists, the CSV the /retrain route exports from MongoDB
+                    to combined_training_data.csv is read in its place.
+    
+    Safe to use from several processes at once: segment appends and the
+    data_log.json update each hold a file lock and replace files atomically.
+    
+    Feature statistics (counts, min/max, mean/variance, quantile sketch) are
+    kept in the segment manifest: updated per appended batch, and for the base
+    file from the rows appended since the last call (a full pass only when it
+    was rewritten). They provide the imputation medians and the summary
+    without a pass over the data.
     """
-    def __init__(self):
-        self.base_data_path = os.path.join(os.path.dirname(__file__), 'rice_spoilage_10k.csv')
-        self.new_data_path = os.path.join(os.path.dirname(__file__), 'new_training_data.csv')
-        self.combined_data_path = os.path.join(os.path.dirname(__file__), 'combined_training_data.csv')
-        self.data_log_path = os.path.join(os.path.dirname(__file__), 'data_log.json')
+    def __init__(self, root: str = None):
+        data_dir = root or os.path.dirname(__file__)
+        self.base_data_path = os.path.join(data_dir, 'rice_spoilage_10k.csv')
+        self.new_data_path = os.path.join(data_dir, 'new_training_data.csv')
+        self.combined_data_path = os.path.join(data_dir, 'combined_training_data.csv')
+        self.data_log_path = os.path.join(data_dir, 'data_log.json')
+        self.segments = segment_store if root is None else SegmentStore(
+            os.path.join(data_dir, 'new_data_segments'), self.new_data_path)
         
     def load_base_dataset(self):
         """Load the base + live-augmented dataset"""
@@ -41,8 +70,7 @@ class DataManager:
         # Handle Spoilage_Class → Spoilage_Label
         if 'Spoilage_Class' in df.columns and 'Spoilage_Label' not in df.columns:
             # 0=Safe, 1=Risky, 2=Spoiled
-            label_map = {0: 'Safe', 1: 'Risky', 2: 'Spoiled'}
-            df['Spoilage_Label'] = df['Spoilage_Class'].map(lambda x: label_map.get(int(x), 'Safe') if pd.notna(x) else 'Safe')
+            df['Spoilage_Label'] = spoilage_class_to_label(df['Spoilage_Class'])
         return df
     
     def add_new_data(self, new_records: List[Dict]):
@@ -50,22 +78,17 @@ class DataManager:
         try:
             new_df = pd.DataFrame(new_records)
             
-            required_columns = ['Temperature', 'Humidity', 'Grain_Moisture', 'Dew_Point', 
-                              'Storage_Days', 'Airflow', 'Ambient_Light', 'Pest_Presence', 
-                              'Rainfall', 'Spoilage_Label']
+            required_columns = FEATURE_COLUMNS + ['Spoilage_Label']
             
             missing = [c for c in required_columns if c not in new_df.columns]
             if missing:
                 raise ValueError(f"Missing required columns: {missing}")
             
-            if os.path.exists(self.new_data_path):
-                existing = pd.read_csv(self.new_data_path)
-                combined = pd.concat([existing, new_df], ignore_index=True)
-                combined.to_csv(self.new_data_path, index=False)
-            else:
-                new_df.to_csv(self.new_data_path, index=False)
+            # O(batch): written as a new segment, earlier data is not touched
+            total = self.segments.append(new_df)
             
-            self.log_data_addition(len(new_records))
+            self.log_data_addition(len(new_records), total)
+            self.segments.maybe_compact()
             print(f"✅ Added {len(new_records)} new records")
             return True
             
@@ -74,22 +97,27 @@ class DataManager:
             return False
     
     def create_combined_dataset(self):
-        """Combine base dataset with any manually-added new data for training"""
+        """Write base dataset + manually-added data to combined_training_data.csv
+        
+        Export only: training reads the same rows through load_training_columns()
+        without materializing this file.
+        """
         try:
             base_df = self.load_base_dataset()
             if base_df is None:
                 return False
             
             # Load manual additions if they exist
-            if os.path.exists(self.new_data_path):
-                new_df = pd.read_csv(self.new_data_path)
-                new_df = self._normalize_columns(new_df)
+            if self.segments.count():
+                new_df = self._normalize_columns(self.segments.read())
                 print(f"✅ Found {len(new_df)} manually-added records")
                 combined_df = pd.concat([base_df, new_df], ignore_index=True)
             else:
                 combined_df = base_df
             
-            combined_df.to_csv(self.combined_data_path, index=False)
+            tmp_path = f'{self.combined_data_path}.{os.getpid()}.tmp'
+            combined_df.to_csv(tmp_path, index=False)
+            os.replace(tmp_path, self.combined_data_path)
             print(f"✅ Created combined dataset: {len(combined_df)} total records")
             return True
                 
@@ -97,43 +125,128 @@ class DataManager:
             print(f"❌ Error creating combined dataset: {e}")
             return False
     
-    def log_data_addition(self, record_count: int):
+    def base_source(self) -> Optional[str]:
+        """The base dataset file, or the route's exported CSV while the base does not exist yet"""
+        for path in (self.base_data_path, self.combined_data_path):
+            if os.path.exists(path):
+                return path
+        return None
+    
+    def combined_sources(self) -> List[str]:
+        """Existing files that make up the combined dataset, in order: base, then new-data segments"""
+        base = self.base_source()
+        segments = [path for path, _ in self.segments.segment_paths() if os.path.exists(path)]
+        return ([base] if base else []) + segments
+    
+    def load_training_columns(self, features: List[str], path: str = None):
+        """Load the combined dataset (or `path`) as memory-mapped columns.
+        
+        The combined dataset is read straight from the base file and the
+        segments; the column cache is rebuilt only when one of them changes.
+        Missing values are filled with the medians from feature_stats().
+        """
+        if path:
+            return columnar_cache.load(path, features)
+        fills = self.feature_defaults(features)
+        with self.segments.reading():
+            sources = self.combined_sources()
+            if not sources:
+                raise FileNotFoundError(f"No training data: neither {self.base_data_path} "
+                                        f"nor {self.combined_data_path} exists and no data was added")
+            return columnar_cache.load(sources, features, fill_values=fills)
+    
+    @staticmethod
+    def _byte_digest(path, start, end):
+        with open(path, 'rb') as f:
+            f.seek(start)
+            return hashlib.sha256(f.read(end - start)).hexdigest()
+    
+    def _file_marks(self, path, size):
+        """Digests of the first and the last CHECK_BYTES of the first `size` bytes"""
+        return {'head': self._byte_digest(path, 0, min(size, CHECK_BYTES)),
+                'tail': self._byte_digest(path, max(0, size - CHECK_BYTES), size)}
+    
+    def base_stats(self) -> FeatureStats:
+        """Statistics of the base dataset, updated from the rows appended since the last call.
+        
+        Firebase only appends to the base file: if it grew and the bytes read
+        last time are unchanged (checked at the start and at the old end), only
+        the complete lines after the old end are read and folded in. Any other
+        change triggers a full pass.
+        """
+        path = self.base_source()
+        if path is None:
+            return FeatureStats()
+        stat = os.stat(path)
+        cached = self.segments.get_meta('base_stats')
+        if cached and cached.get('path') != path:
+            cached = None
+        if cached and cached.get('file_size') == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+            return FeatureStats.from_dict(cached['stats'])
+        
+        end = complete_size(path, stat.st_size)
+        appended = (cached and 'head' in cached and cached['size'] <= end
+                    and self._file_marks(path, cached['size']) == {'head': cached['head'], 'tail': cached['tail']})
+        if appended:
+            stats = FeatureStats.from_dict(cached['stats'])
+            start = cached['size']
+        else:
+            stats = FeatureStats(FEATURE_COLUMNS)
+            start = 0
+        if end > start:
+            for block, _ in ChunkReader(path, FEATURE_COLUMNS, byte_range=(start, end)):
+                stats.update_block(block, FEATURE_COLUMNS)
+        self.segments.set_meta('base_stats', dict(
+            self._file_marks(path, end), path=path, size=end, file_size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns, stats=stats.to_dict()
+        ))
+        return stats
+    
+    def feature_stats(self) -> FeatureStats:
+        """Statistics of the combined dataset (base + manually added rows)"""
+        return FeatureStats.merged([self.base_stats(), self.segments.stats()])
+    
+    def feature_defaults(self, features: List[str] = None) -> Dict[str, float]:
+        """Median per feature, used to fill missing values in training and serving"""
+        return self.feature_stats().defaults(features or FEATURE_COLUMNS)
+    
+    def log_data_addition(self, record_count: int, total_new_records: int = None):
         """Log data additions for tracking"""
         try:
+            if total_new_records is None:
+                total_new_records = self.get_new_data_count()
             entry = {
                 'timestamp': datetime.now().isoformat(),
                 'records_added': record_count,
-                'total_new_records': self.get_new_data_count()
+                'total_new_records': total_new_records
             }
             
-            if os.path.exists(self.data_log_path):
-                with open(self.data_log_path, 'r') as f:
-                    log_data = json.load(f)
-            else:
-                log_data = {'additions': []}
-            
-            log_data['additions'].append(entry)
-            
-            with open(self.data_log_path, 'w') as f:
-                json.dump(log_data, f, indent=2)
+            with file_lock(self.data_log_path + '.lock'):
+                if os.path.exists(self.data_log_path):
+                    with open(self.data_log_path, 'r') as f:
+                        log_data = json.load(f)
+                else:
+                    log_data = {'additions': []}
+                
+                log_data['additions'].append(entry)
+                atomic_write_json(self.data_log_path, log_data, indent=2)
                 
         except Exception as e:
             print(f"Warning: Could not log data addition: {e}")
     
     def get_new_data_count(self):
-        if os.path.exists(self.new_data_path):
-            return len(pd.read_csv(self.new_data_path))
-        return 0
+        """Number of manually added records (O(1), from the segment manifest)"""
+        return self.segments.count()
     
     def get_data_summary(self):
-        """Get summary of all data"""
-        base_df = self.load_base_dataset()
+        """Get summary of all data (from the stored statistics, no full read)"""
+        base = self.base_stats()
         new_count = self.get_new_data_count()
-        base_count = len(base_df) if base_df is not None else 0
         return {
-            'base_records': base_count,
+            'base_records': base.rows,
             'new_records': new_count,
-            'total_records': base_count + new_count,
+            'total_records': base.rows + new_count,
+            'features': FeatureStats.merged([base, self.segments.stats()]).summary(),
             'last_updated': datetime.now().isoformat()
         }
 
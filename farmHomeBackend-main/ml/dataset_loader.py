@@ -0,0 +1,324 @@
+"""
+GrainHero Dataset Loader
+========================
+Compact, chunked loading of spoilage CSVs for training.
+
+Features are parsed straight into a preallocated float32 matrix chunk by
+chunk, labels are kept as int8 category codes, and the Spoilage_Class ->
+Spoilage_Label mapping is a table lookup instead of a per-row lambda. Only
+one chunk is ever held at pandas' default dtypes, so peak memory stays close
+to the size of the final float32 matrix instead of several float64 copies
+of the whole file. Per-feature statistics (feature_stats.py) are gathered
+chunk by chunk on the way in and supply the imputation medians, so filling
+missing values needs no extra pass over the matrix.
+
+Usage (compare against the plain pandas path):
+  python dataset_loader.py [dataset.csv]
+"""
+import gc
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from training_profiler import PhaseProfiler, current_rss_mb
+from feature_stats import FeatureStats
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Spoilage_Class codes 0/1/2; anything else (or missing) counts as Safe
+SPOILAGE_CLASS_LABELS = ['Safe', 'Risky', 'Spoiled']
+DEFAULT_CHUNKSIZE = 200_000
+LABEL_COLUMN = 'Spoilage_Label'
+CLASS_COLUMN = 'Spoilage_Class'
+
+
+def spoilage_class_to_label(values):
+    """Vectorized Spoilage_Class -> Spoilage_Label as a Categorical."""
+    classes = np.trunc(pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float64))
+    known = np.isin(classes, np.arange(len(SPOILAGE_CLASS_LABELS)))
+    codes = np.where(known, classes, 0).astype(np.int8)
+    return pd.Categorical.from_codes(codes, categories=SPOILAGE_CLASS_LABELS)
+
+
+def _count_rows(path, block_size=1 << 20):
+    """Upper bound on data rows (newline count), used to preallocate."""
+    lines = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            lines += block.count(b'\n')
+    return lines + 1
+
+
+def complete_size(path, size=None, block_size=1 << 16):
+    """Byte length of the complete lines among the first `size` bytes (default: the whole file)."""
+    size = os.path.getsize(path) if size is None else size
+    with open(path, 'rb') as f:
+        end = size
+        while end > 0:
+            start = max(0, end - block_size)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+    return 0
+
+
+class _ByteRange(io.RawIOBase):
+    """Read-only view of bytes [start, end) of a file."""
+
+    def __init__(self, path, start, end):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self._file.readinto(memoryview(buffer)[:max(0, min(len(buffer), self._remaining))])
+        self._remaining -= n
+        return n
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+class ChunkReader:
+    """
+    Iterates a spoilage CSV as (float32 feature block, int8 label codes)
+    pairs, one per chunk, skipping unlabelled rows. Label codes index into
+    `categories`, which grows as new label strings are seen; pass the same
+    `label_index` dict to several readers to share one coding across files.
+    
+    `byte_range=(start, end)` reads only the rows in those bytes of the file
+    (start at a line boundary after the header, or 0), e.g. the rows
+    appended since an earlier pass.
+    """
+
+    def __init__(self, path, features, chunksize=DEFAULT_CHUNKSIZE, label_index=None, byte_range=None):
+        self.path = path
+        self.features = list(features)
+        self.chunksize = chunksize
+        self.byte_range = byte_range
+        self._sources = []
+        header = pd.read_csv(path, nrows=0).columns
+        self.header = list(header)
+        if LABEL_COLUMN in header:
+            self.label_col = LABEL_COLUMN
+        elif CLASS_COLUMN in header:
+            self.label_col = CLASS_COLUMN
+        else:
+            raise ValueError(f"No {LABEL_COLUMN} or {CLASS_COLUMN} column in {path}")
+        self.present = [col for col in self.features if col in header]
+        self._index = label_index if label_index is not None else {}
+        if self.label_col == CLASS_COLUMN:
+            self._class_lookup = np.array([self._index.setdefault(label, len(self._index))
+                                           for label in SPOILAGE_CLASS_LABELS], dtype=np.int8)
+        self.chunks = 0
+
+    @property
+    def categories(self):
+        return list(self._index)
+
+    def capacity(self):
+        """Upper bound on the number of rows, for preallocation."""
+        return _count_rows(self.path)
+
+    def _read(self, typed):
+        dtype = {self.label_col: 'category' if self.label_col == LABEL_COLUMN else np.float32}
+        if typed:
+            dtype.update({col: np.float32 for col in self.present})
+        options = dict(usecols=self.present + [self.label_col], dtype=dtype, chunksize=self.chunksize)
+        if self.byte_range is None:
+            return pd.read_csv(self.path, **options)
+        start, end = self.byte_range
+        source = io.BufferedReader(_ByteRange(self.path, start, end))
+        self._sources.append(source)
+        if start > 0:
+            # Past the header line: name the columns from the file's header
+            options.update(header=None, names=self.header)
+        return pd.read_csv(source, **options)
+
+    def _chunks(self):
+        reader = self._read(typed=True)
+        typed = True
+        done = 0
+        try:
+            while True:
+                try:
+                    chunk = next(reader)
+                except StopIteration:
+                    return
+                except ValueError:
+                    if not typed:
+                        raise
+                    # Non-numeric values in a feature column: re-read untyped from
+                    # this chunk on and coerce them to NaN
+                    reader.close()
+                    reader = self._read(typed=False)
+                    typed = False
+                    for _ in range(done):
+                        next(reader)
+                    continue
+                done += 1
+                yield chunk, typed
+        finally:
+            reader.close()
+            # read_csv leaves file objects it was given open
+            for source in self._sources:
+                source.close()
+            self._sources = []
+
+    def _codes(self, chunk):
+        if self.label_col == CLASS_COLUMN:
+            return self._class_lookup[spoilage_class_to_label(chunk[self.label_col]).codes]
+        labels = chunk[self.label_col].cat
+        lookup = np.array([self._index.setdefault(c, len(self._index)) for c in labels.categories],
+                          dtype=np.int16)
+        if len(self._index) > np.iinfo(np.int8).max:
+            raise ValueError(f"Too many distinct labels in {self.path}")
+        raw = labels.codes.to_numpy()
+        return np.where(raw >= 0, lookup[raw] if len(lookup) else -1, -1).astype(np.int8)
+
+    def __iter__(self):
+        self.chunks = 0
+        for chunk, typed in self._chunks():
+            self.chunks += 1
+            codes = self._codes(chunk)
+            keep = codes >= 0
+            block = np.empty((int(keep.sum()), len(self.features)), dtype=np.float32)
+            for j, col in enumerate(self.features):
+                if col not in chunk.columns:
+                    block[:, j] = 0
+                    continue
+                values = chunk[col]
+                if not typed:
+                    values = pd.to_numeric(values, errors='coerce')
+                block[:, j] = values.to_numpy(dtype=np.float32, na_value=np.nan)[keep]
+            yield block, codes[keep]
+
+
+def load_training_data(path, features, chunksize=DEFAULT_CHUNKSIZE, verbose=True, fill_values=None):
+    """
+    Load a spoilage CSV (or a list of CSVs, read in order as one dataset)
+    into compact arrays.
+
+    Rows without a label are dropped, missing feature columns are filled with
+    0 and missing values with the column median over all rows (approximate,
+    from the streamed statistics) unless `fill_values` gives one per feature.
+    Returns (X, labels, report) where X is a float32 DataFrame, labels a
+    Categorical and report the row count, memory figures and feature_stats.
+    """
+    paths = [path] if isinstance(path, str) else list(path)
+    rss_before = current_rss_mb()
+    profiler = PhaseProfiler()
+    start = time.perf_counter()
+
+    with profiler.phase('load'):
+        label_index = {}
+        readers = [ChunkReader(p, features, chunksize, label_index) for p in paths]
+        capacity = sum(reader.capacity() for reader in readers)
+        X = np.empty((capacity, len(features)), dtype=np.float32)
+        codes = np.empty(capacity, dtype=np.int8)
+        stats = FeatureStats(features)
+        n = 0
+        for reader in readers:
+            for block, block_codes in reader:
+                X[n:n + len(block)] = block
+                codes[n:n + len(block)] = block_codes
+                stats.update_block(block, features)
+                n += len(block)
+        X, codes = X[:n], codes[:n]
+        categories = list(label_index)
+        chunks = sum(reader.chunks for reader in readers)
+
+        fills = stats.medians() if fill_values is None else fill_values
+        for j, col in enumerate(features):
+            fill = fills.get(col)
+            if stats.columns[col].missing and fill is not None and not np.isnan(fill):
+                X[np.isnan(X[:, j]), j] = fill
+
+    X_df = pd.DataFrame(X, columns=list(features), copy=False)
+    labels = pd.Categorical.from_codes(codes, categories=categories)
+    report = {
+        'rows': len(X_df),
+        'chunks': chunks,
+        'seconds': round(time.perf_counter() - start, 3),
+        'rss_before_mb': round(rss_before or 0, 1),
+        'peak_rss_mb': profiler.phases['load']['peak_rss_mb'],
+        'data_mb': round((X.nbytes + codes.nbytes) / (1024 * 1024), 1),
+        'feature_stats': stats.to_dict(),
+    }
+    if verbose:
+        print(f"   Loaded {report['rows']} rows in {chunks} chunk(s): data={report['data_mb']}MB, "
+              f"RSS {report['rss_before_mb']}MB -> peak {report['peak_rss_mb']}MB")
+    return X_df, labels, report
+
+
+def encode_labels(label_encoder, labels):
+    """
+    Equivalent of label_encoder.fit_transform(labels) for a Categorical,
+    computed on the integer codes instead of the label strings.
+    """
+    codes = np.asarray(labels.codes)
+    categories = np.asarray(labels.categories, dtype=object)
+    used = np.flatnonzero(np.bincount(codes[codes >= 0], minlength=len(categories)))
+    classes = np.sort(categories[used])
+    lookup = np.full(len(categories), -1, dtype=np.int64)
+    lookup[used] = np.searchsorted(classes, categories[used])
+    label_encoder.classes_ = classes
+    return lookup[codes]
+
+
+def _legacy_load(path, features):
+    """The previous pandas path, kept for comparison."""
+    df = pd.read_csv(path)
+    if LABEL_COLUMN not in df.columns and CLASS_COLUMN in df.columns:
+        label_map = dict(enumerate(SPOILAGE_CLASS_LABELS))
+        df[LABEL_COLUMN] = df[CLASS_COLUMN].map(
+            lambda x: label_map.get(int(x), 'Safe') if pd.notna(x) else 'Safe'
+        )
+    df = df.dropna(subset=[LABEL_COLUMN])
+    for col in features:
+        if col not in df.columns:
+            df[col] = 0
+    df[features] = df[features].apply(pd.to_numeric, errors='coerce')
+    df[features] = df[features].fillna(df[features].median())
+    return df[features], df[LABEL_COLUMN]
+
+
+def compare_loading(path, features):
+    """Peak memory and time of the legacy pandas path vs the compact loader."""
+    profiler = PhaseProfiler()
+    results = {}
+    for name, loader in [('compact', lambda: load_training_data(path, features, verbose=False)),
+                         ('pandas', lambda: _legacy_load(path, features))]:
+        gc.collect()
+        baseline = current_rss_mb() or 0
+        start = time.perf_counter()
+        with profiler.phase(name):
+            result = loader()
+        seconds = time.perf_counter() - start
+        results[name] = {
+            'seconds': round(seconds, 3),
+            'peak_rss_mb': profiler.phases[name]['peak_rss_mb'],
+            'peak_increase_mb': round(profiler.phases[name]['peak_rss_mb'] - baseline, 1),
+        }
+        del result
+    for name, r in results.items():
+        print(f"   {name:8s} time={r['seconds']:.2f}s  peak RSS={r['peak_rss_mb']:.1f}MB  "
+              f"(+{r['peak_increase_mb']:.1f}MB)")
+    return results
+
+
+if __name__ == '__main__':
+    dataset = sys.argv[1] if len(sys.argv) > 1 else os.path.join(ML_DIR, 'rice_spoilage_10k.csv')
+    print(f"Loading comparison: {dataset}")
+    compare_loading(dataset, ['Temperature', 'Humidity', 'Storage_Days', 'Airflow', 'Dew_Point',
+                              'Ambient_Light', 'Pest_Presence', 'Grain_Moisture', 'Rainfall'])
@@ -0,0 +1,346 @@
+"""
+GrainHero Drift Monitor
+=======================
+Has the sensor data reaching the prediction path drifted away from the data
+the model was trained on?
+
+At training time each feature's distribution is summarized as a reference
+histogram (reference_histograms(), stored as 'drift_reference' in the model
+metadata): up to DEFAULT_BINS bins with edges at the training deciles, and
+the training share per bin, read off the FeatureStats quantile sketch so no
+extra pass over the data is needed.
+
+At prediction time every reading is counted into the same bins per grain and
+feature: a fixed-size array of counts, so an update is O(1) per reading and
+memory does not grow with traffic. Counts are kept over a tumbling window
+pair (the last one or two windows of DEFAULT_WINDOW readings), and compared
+with the reference by
+
+  PSI  population stability index, sum((o - e) * ln(o / e)); below 0.1 is
+       stable, 0.1-0.25 moderate, above 0.25 significant drift
+  KS   largest gap between the binned reference and observed CDFs
+
+A grain whose largest PSI is significant is flagged retrain_recommended.
+
+The Node routes run one short-lived prediction process per request, so the
+global drift_monitor adds each process's counts to ml/drift_state/<grain>.json
+(under a file lock) when the process exits; GRAINHERO_DRIFT_DIR moves that
+directory and an empty value keeps the counts in memory only (as the ML
+service does).
+
+  python drift_monitor.py [GRAIN ...] [--json]          scores from drift_state
+  python drift_monitor.py --reset [GRAIN ...]
+  python drift_monitor.py --build-reference data.csv --metadata model_metadata.json
+                          [--features Temperature Humidity ...]
+"""
+import atexit
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from file_lock import file_lock, atomic_write_json
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+DRIFT_DIR_ENV = 'GRAINHERO_DRIFT_DIR'
+DEFAULT_STATE_DIR = os.path.join(ML_DIR, 'drift_state')
+DEFAULT_BINS = 10
+DEFAULT_WINDOW = 5000
+MIN_READINGS = 100          # fewer readings than this are not scored
+PSI_MODERATE = 0.1
+PSI_SIGNIFICANT = 0.25
+EPSILON = 1e-4              # share assumed for empty bins (keeps PSI finite)
+
+
+def reference_histograms(feature_stats, features, bins=DEFAULT_BINS):
+    """
+    Reference histogram per feature from FeatureStats: edges at the training
+    quantiles k/bins (deduplicated, so discrete features get fewer bins) and
+    the training share of each bin, from the sketch centroids.
+    """
+    reference = {'bins': bins, 'features': {}}
+    for feature in features:
+        stats = feature_stats.columns.get(feature)
+        if stats is None or stats.count == 0:
+            reference['features'][feature] = {'edges': [], 'expected': [1.0]}
+            continue
+        quantiles = (stats.quantile(k / bins) for k in range(1, bins))
+        edges = sorted({round(q, 6) for q in quantiles if q > stats.min})
+        bin_index = np.searchsorted(edges, stats.sketch.means, side='right')
+        counts = np.bincount(bin_index, weights=stats.sketch.weights, minlength=len(edges) + 1)
+        reference['features'][feature] = {
+            'edges': edges,
+            'expected': [round(float(c), 6) for c in counts / counts.sum()],
+        }
+    return reference
+
+
+def psi(expected, observed):
+    expected = np.clip(expected, EPSILON, None)
+    observed = np.clip(observed, EPSILON, None)
+    return float(((observed - expected) * np.log(observed / expected)).sum())
+
+
+def ks(expected, observed):
+    return float(np.abs(np.cumsum(observed) - np.cumsum(expected)).max())
+
+
+def drift_status(max_psi, readings):
+    if readings < MIN_READINGS:
+        return 'insufficient_data'
+    if max_psi >= PSI_SIGNIFICANT:
+        return 'significant'
+    return 'moderate' if max_psi >= PSI_MODERATE else 'stable'
+
+
+class GrainDrift:
+    """Streaming bin counts for one grain's features against its reference."""
+
+    def __init__(self, reference, features, window=DEFAULT_WINDOW):
+        self.reference = reference
+        self.features = list(features)
+        self.window = window
+        columns = [reference['features'].get(f, {'edges': [], 'expected': [1.0]}) for f in self.features]
+        width = max(len(c['edges']) for c in columns)
+        self.n_bins = width + 1
+        # Edges padded with +inf, so every feature shares one (features, bins) layout
+        self.edges = np.full((len(columns), width), np.inf)
+        self.expected = np.zeros((len(columns), self.n_bins))
+        for j, column in enumerate(columns):
+            self.edges[j, :len(column['edges'])] = column['edges']
+            self.expected[j, :len(column['expected'])] = column['expected']
+        self._offsets = np.arange(len(columns)) * self.n_bins
+        self.current = np.zeros((len(columns), self.n_bins), dtype=np.int64)
+        self.previous = np.zeros_like(self.current)
+        self.current_n = self.previous_n = self.total = 0
+        self.updated = None
+
+    def bin_counts(self, X):
+        """Counts per (feature, bin) for the rows of X (columns in self.features order)."""
+        bins = (X[:, :, None] >= self.edges[None, :, :]).sum(axis=2) + self._offsets
+        return np.bincount(bins.ravel(), minlength=self.current.size).reshape(self.current.shape)
+
+    def add(self, counts, n):
+        self.current += counts
+        self.current_n += n
+        self.total += n
+        self.updated = datetime.now().isoformat()
+        if self.current_n >= self.window:
+            self.previous, self.current = self.current, np.zeros_like(self.current)
+            self.previous_n, self.current_n = self.current_n, 0
+
+    def scores(self):
+        readings = self.current_n + self.previous_n
+        observed = (self.current + self.previous) / max(readings, 1)
+        features = {
+            f: {'psi': round(psi(self.expected[j], observed[j]), 4),
+                'ks': round(ks(self.expected[j], observed[j]), 4)}
+            for j, f in enumerate(self.features)
+        }
+        max_psi = max((s['psi'] for s in features.values()), default=0.0) if readings else 0.0
+        status = drift_status(max_psi, readings)
+        return {
+            'status': status,
+            'retrain_recommended': status == 'significant',
+            'max_psi': max_psi,
+            'readings': readings,
+            'total_readings': self.total,
+            'window': self.window,
+            'updated': self.updated,
+            'features': features if readings else {},
+        }
+
+    def to_dict(self):
+        return {
+            'reference': self.reference, 'features': self.features, 'window': self.window,
+            'current': self.current.tolist(), 'previous': self.previous.tolist(),
+            'current_n': self.current_n, 'previous_n': self.previous_n,
+            'total': self.total, 'updated': self.updated,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        drift = cls(data['reference'], data['features'], data['window'])
+        drift.current = np.asarray(data['current'], dtype=np.int64)
+        drift.previous = np.asarray(data['previous'], dtype=np.int64)
+        drift.current_n, drift.previous_n = data['current_n'], data['previous_n']
+        drift.total, drift.updated = data['total'], data['updated']
+        return drift
+
+
+class DriftMonitor:
+    """GrainDrift per grain; with a state_dir, counts are also persisted on flush()."""
+
+    def __init__(self, state_dir=DEFAULT_STATE_DIR, window=DEFAULT_WINDOW):
+        self.state_dir = state_dir
+        self.window = window
+        self._grains = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_at_exit = False
+
+    def update(self, grain, X, reference, features):
+        """
+        Count readings X (rows, columns named by `features`) for `grain`.
+        Returns the grain's GrainDrift, or None without a reference.
+        """
+        if not reference:
+            return None
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        with self._lock:
+            drift = self._grains.get(grain)
+            if drift is None or (reference is not drift.reference and reference != drift.reference) \
+                    or list(features) != drift.features:
+                # First reading, or the model was retrained: start over
+                drift = self._grains[grain] = GrainDrift(reference, features, self.window)
+                self._pending.pop(grain, None)
+            counts = drift.bin_counts(X)
+            drift.add(counts, len(X))
+            if self.state_dir:
+                pending = self._pending.get(grain)
+                if pending is None:
+                    self._pending[grain] = [counts, len(X)]
+                else:
+                    pending[0] = pending[0] + counts
+                    pending[1] += len(X)
+                if not self._flush_at_exit:
+                    atexit.register(self.flush)
+                    self._flush_at_exit = True
+        return drift
+
+    def scores(self, grain=None):
+        """Scores per grain seen by this process (or for one grain)."""
+        with self._lock:
+            grains = dict(self._grains)
+        if grain is not None:
+            return grains[grain].scores() if grain in grains else None
+        return {g: drift.scores() for g, drift in sorted(grains.items())}
+
+    def state_path(self, grain):
+        return os.path.join(self.state_dir, f'{grain}.json')
+
+    def flush(self):
+        """Add the counts gathered since the last flush to the state files."""
+        if not self.state_dir:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            drifts = {grain: self._grains[grain] for grain in pending}
+        for grain, (counts, n) in pending.items():
+            path = self.state_path(grain)
+            with file_lock(path + '.lock'):
+                stored = self._load(path)
+                live = drifts[grain]
+                if stored is None or stored.reference != live.reference or stored.features != live.features:
+                    stored = GrainDrift(live.reference, live.features, self.window)
+                stored.add(counts, n)
+                atomic_write_json(path, stored.to_dict())
+
+    @staticmethod
+    def _load(path):
+        try:
+            with open(path) as f:
+                return GrainDrift.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def stored_scores(self, grains=None):
+        """Scores from the state files (all grains found by default)."""
+        if not self.state_dir or not os.path.isdir(self.state_dir):
+            return {}
+        if not grains:
+            grains = sorted(name[:-5] for name in os.listdir(self.state_dir) if name.endswith('.json'))
+        report = {}
+        for grain in grains:
+            drift = self._load(self.state_path(grain))
+            if drift is not None:
+                report[grain] = drift.scores()
+        return report
+
+    def reset(self, grains=None):
+        """Forget the counts (in memory and on disk) for these grains, or all."""
+        with self._lock:
+            for grain in list(self._grains) if grains is None else grains:
+                self._grains.pop(grain, None)
+                self._pending.pop(grain, None)
+        if self.state_dir and os.path.isdir(self.state_dir):
+            for name in os.listdir(self.state_dir):
+                if name.endswith('.json') and (grains is None or name[:-5] in grains):
+                    with file_lock(os.path.join(self.state_dir, name) + '.lock'):
+                        os.remove(os.path.join(self.state_dir, name))
+
+
+# Global instance (persisted counts, see module docstring)
+drift_monitor = DriftMonitor(state_dir=os.environ.get(DRIFT_DIR_ENV, DEFAULT_STATE_DIR) or None)
+
+
+def build_reference(csv_path, metadata_path, features=None, bins=DEFAULT_BINS):
+    """Store a reference computed from a training CSV in a (new or existing) metadata JSON."""
+    import pandas as pd
+    from feature_stats import FeatureStats
+
+    metadata = {}
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+    features = features or metadata.get('features')
+    if not features:
+        raise ValueError('No feature list: pass --features or use metadata with a "features" entry')
+    stats = FeatureStats()
+    for chunk in pd.read_csv(csv_path, usecols=features, chunksize=200_000):
+        stats.update_frame(chunk, features)
+    metadata.setdefault('features', features)
+    metadata['drift_reference'] = reference_histograms(stats, features, bins)
+    metadata['drift_reference']['source'] = os.path.basename(csv_path)
+    atomic_write_json(metadata_path, metadata, indent=2)
+    return metadata['drift_reference']
+
+
+def _print_report(report):
+    if not report:
+        print("No drift data yet (predictions are counted once a model has a drift reference)")
+    for grain, scores in report.items():
+        print(f"{grain}: {scores['status']}  max PSI {scores['max_psi']:.3f}  "
+              f"({scores['readings']} readings in window, {scores['total_readings']} total, "
+              f"updated {scores['updated']})")
+        for feature, s in sorted(scores['features'].items(), key=lambda item: -item[1]['psi']):
+            print(f"   {feature:15s} PSI {s['psi']:7.3f}   KS {s['ks']:.3f}")
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Feature drift of incoming readings against training data.')
+    parser.add_argument('grains', nargs='*', help='grains to report (default: all with drift data)')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--reset', action='store_true', help='discard the stored counts')
+    parser.add_argument('--build-reference', metavar='CSV',
+                        help='compute a drift reference from this training CSV into --metadata')
+    parser.add_argument('--metadata', metavar='PATH', help='model metadata JSON for --build-reference')
+    parser.add_argument('--features', nargs='+', help='feature columns (default: the metadata features)')
+    parser.add_argument('--bins', type=int, default=DEFAULT_BINS)
+    args = parser.parse_args(argv)
+
+    if args.build_reference:
+        if not args.metadata:
+            parser.error('--build-reference needs --metadata')
+        reference = build_reference(args.build_reference, args.metadata, args.features, args.bins)
+        print(f"Drift reference for {len(reference['features'])} features written to {args.metadata}")
+        return 0
+    if args.reset:
+        drift_monitor.reset(args.grains or None)
+        print("Drift counts reset")
+        return 0
+
+    report = drift_monitor.stored_scores(args.grains)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,14 +4,27 @@ import joblib
 import json
 from datetime import datetime
 from xgboost import XGBClassifier
-from sklearn.model_selection import train_test_split, cross_val_score
+from lightgbm import LGBMClassifier
+from sklearn.ensemble import RandomForestClassifier, VotingClassifier
+from sklearn.model_selection import train_test_split, cross_val_score, StratifiedKFold
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, classification_report, confusion_matrix
 from sklearn.preprocessing import LabelEncoder
 import optuna
 import os
+import time
+from contextlib import ExitStack
+from dataset_loader import encode_labels, spoilage_class_to_label
+from drift_monitor import reference_histograms
+from out_of_core import SoftVotingEnsemble
+from training_budget import TimeBudget
+from training_cache import training_cache
+from training_profiler import PhaseProfiler
+
+# Test-split row numbers of the last full training, for incremental updates
+HOLDOUT_FILE = 'smartbin_holdout.npy'
 
 class SmartBinModelTrainer:
-    def __init__(self):
+    def __init__(self, profile_trace=None):
         self.ml_dir = os.path.dirname(os.path.abspath(__file__))
         self.base_data_path = os.path.join(self.ml_dir, 'rice_spoilage_10k.csv')
         self.combined_data_path = os.path.join(self.ml_dir, 'combined_training_data.csv')
@@ -19,49 +32,78 @@ class SmartBinModelTrainer:
         self.label_encoder = LabelEncoder()
         self.feature_names = ['Temperature', 'Humidity', 'Grain_Moisture', 'Dew_Point', 'Storage_Days', 'Airflow', 'Ambient_Light', 'Pest_Presence', 'Rainfall']
         self.training_history = []
+        self.random_state = 42
+        self.cache_key = None
+        self.cache_info = None
+        self.tuning_trials = 0
+        self.split = None
+        self.holdout_indices = None
+        self.load_report = None
+        self.feature_defaults = {}
+        self.feature_summary = {}
+        self.drift_reference = None
+        self.profiler = PhaseProfiler(trace_path=profile_trace)
+    
+    def phase(self, name, budget=None, allotted=None):
+        """Profile a named phase and, with a TimeBudget, charge it to the budget"""
+        stack = ExitStack()
+        stack.enter_context(self.profiler.phase(name))
+        if budget:
+            stack.enter_context(budget.phase(name, allotted))
+        return stack
+        
+    def _prepare_frame(self, df, features=None, fill_values=None):
+        """Normalize labels and fill missing feature values (default: medians of `df`)"""
+        features = features or self.feature_names
+        
+        # Normalize: Spoilage_Class (int) → Spoilage_Label (string)
+        if 'Spoilage_Class' in df.columns and 'Spoilage_Label' not in df.columns:
+            df['Spoilage_Label'] = spoilage_class_to_label(df['Spoilage_Class'])
+        
+        # Drop rows where Spoilage_Label is missing
+        df = df.dropna(subset=['Spoilage_Label'])
         
+        # Handle missing feature values
+        for col in features:
+            if col not in df.columns:
+                df[col] = 0
+        df[features] = df[features].fillna(df[features].median() if fill_values is None else fill_values)
+        return df
+    
     def load_and_preprocess_data(self):
         """Load and preprocess the dataset"""
         try:
-            # Use data_manager to create combined dataset from base + any manual additions
+            # Base dataset + any manual additions, read directly from their
+            # files (no combined CSV is written)
             import sys
             sys.path.insert(0, self.ml_dir)
             from data_manager import data_manager
-            data_manager.create_combined_dataset()
-            
-            # Load the combined dataset
-            if os.path.exists(self.combined_data_path):
-                df = pd.read_csv(self.combined_data_path)
-                print(f"\u2705 Loaded combined dataset with {len(df)} records")
-            else:
-                df = pd.read_csv(self.base_data_path)
-                print(f"\u2705 Loaded base dataset with {len(df)} records")
-            
-            # Normalize: Spoilage_Class (int) → Spoilage_Label (string)
-            if 'Spoilage_Class' in df.columns and 'Spoilage_Label' not in df.columns:
-                label_map = {0: 'Safe', 1: 'Risky', 2: 'Spoiled'}
-                df['Spoilage_Label'] = df['Spoilage_Class'].map(lambda x: label_map.get(int(x), 'Safe') if pd.notna(x) else 'Safe')
-            
-            # Drop rows where Spoilage_Label is missing
-            df = df.dropna(subset=['Spoilage_Label'])
+            X, labels, self.load_report = data_manager.load_training_columns(self.feature_names)
+            new_rows = data_manager.get_new_data_count()
+            stats = data_manager.feature_stats()
+            self.load_report.pop('feature_stats', None)
+            self.feature_defaults = stats.defaults(self.feature_names)
+            self.feature_summary = stats.summary()
+            self.drift_reference = reference_histograms(stats, self.feature_names)
+            print(f"\u2705 Loaded combined dataset with {len(X)} records "
+                  f"({new_rows} manually added)")
             
-            # Handle missing feature values
-            for col in self.feature_names:
-                if col not in df.columns:
-                    df[col] = 0
-            df[self.feature_names] = df[self.feature_names].fillna(df[self.feature_names].median())
-            
-            # Prepare features and target
-            X = df[self.feature_names]
-            y = df['Spoilage_Label']
+            # Features (float32) + category labels; no copy of the feature block
+            df = X.assign(Spoilage_Label=labels)
             
             # Encode labels
-            y_encoded = self.label_encoder.fit_transform(y)
+            y_encoded = encode_labels(self.label_encoder, labels)
             
-            # Split data
-            X_train, X_test, y_train, y_test = train_test_split(
-                X, y_encoded, test_size=0.2, random_state=42, stratify=y_encoded
+            # Split data (by row index, so incremental training can evaluate
+            # on the same holdout rows)
+            train_idx, test_idx = train_test_split(
+                np.arange(len(X)), test_size=0.2, random_state=42, stratify=y_encoded
             )
+            X_train, X_test = X.iloc[train_idx], X.iloc[test_idx]
+            y_train, y_test = y_encoded[train_idx], y_encoded[test_idx]
+            self.split = {'base_source': data_manager.base_source(),
+                          'base_rows': len(X) - new_rows, 'segment_rows': new_rows}
+            self.holdout_indices = test_idx
             
             print(f"\u2705 Data split: {len(X_train)} train, {len(X_test)} test samples")
             print(f"   Classes: {dict(zip(self.label_encoder.classes_, np.bincount(y_encoded)))}")
@@ -73,8 +115,17 @@ class SmartBinModelTrainer:
             traceback.print_exc()
             return None, None, None, None, None
     
-    def hyperparameter_tuning(self, X_train, y_train, n_trials=30):
-        """Optimize hyperparameters using Optuna"""
+    def hyperparameter_tuning(self, X_train, y_train, n_trials=30, timeout=None):
+        """Optimize hyperparameters using Optuna
+        
+        With a timeout the study stops at the deadline and keeps the best trial
+        so far; returns None (train_model defaults) if no trial completed.
+        """
+        X = np.asarray(X_train)
+        y = np.asarray(y_train)
+        splits = list(StratifiedKFold(n_splits=5).split(X, y))
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        
         def objective(trial):
             params = {
                 'max_depth': trial.suggest_int('max_depth', 3, 12),
@@ -87,18 +138,32 @@ class SmartBinModelTrainer:
                 'reg_lambda': trial.suggest_float('reg_lambda', 0, 10)
             }
             
-            model = XGBClassifier(**params, random_state=42)
-            scores = cross_val_score(model, X_train, y_train, cv=5, scoring='accuracy')
-            return scores.mean()
+            scores = []
+            for train_idx, valid_idx in splits:
+                if deadline is not None and time.monotonic() > deadline:
+                    raise optuna.TrialPruned()
+                model = XGBClassifier(**params, random_state=42)
+                model.fit(X[train_idx], y[train_idx])
+                scores.append(accuracy_score(y[valid_idx], model.predict(X[valid_idx])))
+            return np.mean(scores)
         
-        study = optuna.create_study(direction='maximize')
-        study.optimize(objective, n_trials=n_trials)
+        study = optuna.create_study(direction='maximize',
+                                    sampler=optuna.samplers.TPESampler(seed=self.random_state))
+        study.optimize(objective, n_trials=n_trials, timeout=timeout)
         
+        self.tuning_trials = len(study.get_trials(deepcopy=False, states=[optuna.trial.TrialState.COMPLETE]))
+        if not self.tuning_trials:
+            print("⚠️ No tuning trial finished within the time budget - using default parameters")
+            return None
         print(f"✅ Hyperparameter tuning completed. Best score: {study.best_value:.4f}")
         return study.best_params
     
-    def train_model(self, X_train, X_test, y_train, y_test, best_params=None):
-        """Train the XGBoost model"""
+    def train_model(self, X_train, X_test, y_train, y_test, best_params=None, budget=None):
+        """Train the XGBoost model
+        
+        With a TimeBudget the fitted model is saved as a checkpoint before
+        cross-validation, and CV is skipped if it no longer fits in the budget.
+        """
         if best_params is None:
             best_params = {
                 'max_depth': 6,
@@ -108,10 +173,12 @@ class SmartBinModelTrainer:
                 'subsample': 0.8,
                 'colsample_bytree': 0.8
             }
-        
         # Train model
-        self.model = XGBClassifier(**best_params, random_state=42)
-        self.model.fit(X_train, y_train)
+        fit_start = time.monotonic()
+        with self.phase('final_fit', budget):
+            self.model = XGBClassifier(**best_params, random_state=42)
+            self.model.fit(X_train, y_train)
+        fit_seconds = time.monotonic() - fit_start
         
         # Evaluate model
         y_pred = self.model.predict(X_test)
@@ -122,16 +189,13 @@ class SmartBinModelTrainer:
         recall = recall_score(y_test, y_pred, average='weighted')
         f1 = f1_score(y_test, y_pred, average='weighted')
         
-        # Cross-validation score
-        cv_scores = cross_val_score(self.model, X_train, y_train, cv=5)
-        
         metrics = {
             'accuracy': float(accuracy),
             'precision': float(precision),
             'recall': float(recall),
             'f1_score': float(f1),
-            'cv_mean': float(cv_scores.mean()),
-            'cv_std': float(cv_scores.std()),
+            'cv_mean': None,
+            'cv_std': None,
             'training_samples': len(X_train),
             'test_samples': len(X_test),
             'timestamp': datetime.now().isoformat()
@@ -140,19 +204,79 @@ class SmartBinModelTrainer:
         print(f"✅ Model trained successfully!")
         print(f"   Accuracy: {accuracy:.4f}")
         print(f"   F1-Score: {f1:.4f}")
+        
+        if budget:
+            # Publish a valid model before spending the rest of the budget on CV
+            with self.phase('checkpoint', budget):
+                self.save_model(metrics, best_params, budget, store_cache=False)
+            if not budget.can_afford(5 * fit_seconds * 1.5):
+                budget.cut_short('cross_validation', 'insufficient budget')
+                print("⏱️ Skipping cross-validation: not enough time left in the budget")
+                return metrics
+        
+        # Cross-validation score
+        with self.phase('cross_validation', budget):
+            cv_scores = cross_val_score(self.model, X_train, y_train, cv=5)
+        metrics['cv_mean'] = float(cv_scores.mean())
+        metrics['cv_std'] = float(cv_scores.std())
         print(f"   CV Score: {cv_scores.mean():.4f} ± {cv_scores.std():.4f}")
         
         return metrics
     
-    def save_model(self, metrics, best_params):
-        """Save model and metadata"""
+    def publish_cached(self, n_trials=20, time_budget=None):
+        """Publish the stored model if the combined dataset and settings are unchanged.
+        
+        Returns the cached metrics on a hit, None on a miss.
+        """
+        import sys
+        sys.path.insert(0, self.ml_dir)
+        from data_manager import data_manager
+        with data_manager.segments.reading():
+            self.cache_key = training_cache.compute_key(
+                data_manager.combined_sources(), self.feature_names, self.random_state,
+                {'trainer': 'SmartBinModelTrainer', 'n_trials': n_trials, 'time_budget': time_budget}
+            )
+        cached = training_cache.lookup(self.cache_key)
+        self.cache_info = dict(training_cache.stats(), key=self.cache_key, status='hit' if cached else 'miss')
+        if cached is None:
+            print(f"🔁 Training cache miss: {self.cache_key[:12]}")
+            return None
+        
+        print(f"⚡ Training cache hit: {self.cache_key[:12]} - publishing stored model")
+        training_cache.publish(cached, {
+            'model': [os.path.join(self.ml_dir, 'smartbin_model.pkl')],
+            'label_encoder': [os.path.join(self.ml_dir, 'label_encoder.pkl')],
+            'holdout': [os.path.join(self.ml_dir, HOLDOUT_FILE)]
+        })
+        with open(cached['metadata']) as f:
+            metadata = json.load(f)
+        metadata['training_cache'] = self.cache_info
+        metadata['published_date'] = datetime.now().isoformat()
+        with open(os.path.join(self.ml_dir, 'model_metadata.json'), 'w') as f:
+            json.dump(metadata, f, indent=2)
+        
+        self.model = joblib.load(os.path.join(self.ml_dir, 'smartbin_model.pkl'))
+        self.label_encoder = joblib.load(os.path.join(self.ml_dir, 'label_encoder.pkl'))
+        return metadata['metrics']
+    
+    def save_model(self, metrics, best_params, budget=None, store_cache=True):
+        """Save model and metadata
+        
+        The model goes into the training cache only with store_cache and if no
+        phase was cut short by the time budget.
+        """
         try:
             model_path = os.path.join(self.ml_dir, 'smartbin_model.pkl')
             encoder_path = os.path.join(self.ml_dir, 'label_encoder.pkl')
             metadata_path = os.path.join(self.ml_dir, 'model_metadata.json')
             
-            joblib.dump(self.model, model_path)
-            joblib.dump(self.label_encoder, encoder_path)
+            holdout_path = os.path.join(self.ml_dir, HOLDOUT_FILE)
+            
+            with self.phase('dump_model'):
+                joblib.dump(self.model, model_path)
+                joblib.dump(self.label_encoder, encoder_path)
+                if self.holdout_indices is not None:
+                    np.save(holdout_path, self.holdout_indices.astype(np.int32))
             
             metadata = {
                 'model_type': 'XGBoost',
@@ -161,12 +285,39 @@ class SmartBinModelTrainer:
                 'label_classes': self.label_encoder.classes_.tolist(),
                 'best_params': best_params,
                 'metrics': metrics,
-                'training_date': datetime.now().isoformat()
+                'training_date': datetime.now().isoformat(),
+                # The combined dataset already contains every new record
+                'incremental': {'rows_consumed': self.split['segment_rows'] if self.split
+                                else self._new_data_count()},
+                # Rows the model was trained on and the test rows among them
+                # (row numbers in the combined dataset, saved to HOLDOUT_FILE)
+                'holdout': dict(self.split, file=HOLDOUT_FILE) if self.split else None,
+                'training_cache': self.cache_info,
+                'data_loading': self.load_report,
+                # Serving fills missing readings with these (training-set medians)
+                'feature_defaults': self.feature_defaults,
+                'feature_stats': self.feature_summary,
+                # Training-data histograms the drift monitor compares readings with
+                'drift_reference': self.drift_reference,
+                'time_budget': budget.report() if budget else None,
+                'profile': self.profiler.report()
             }
             
             with open(metadata_path, 'w') as f:
                 json.dump(metadata, f, indent=2)
             
+            if budget and not budget.complete:
+                print(f"⏱️ Not caching: cut short by the time budget ({', '.join(budget.truncated)})")
+            elif self.cache_key and store_cache:
+                artifacts = {
+                    'model': model_path,
+                    'label_encoder': encoder_path,
+                    'metadata': metadata_path
+                }
+                if self.holdout_indices is not None:
+                    artifacts['holdout'] = holdout_path
+                training_cache.store(self.cache_key, artifacts)
+            
             print("\u2705 Model and metadata saved successfully")
             return True
             
@@ -174,24 +325,232 @@ class SmartBinModelTrainer:
             print(f"\u274c Error saving model: {e}")
             return False
     
-    def incremental_training(self, new_data_path=None):
-        """Perform incremental training with new data"""
-        if new_data_path and os.path.exists(new_data_path):
-            # Load new data
-            new_df = pd.read_csv(new_data_path)
-            print(f"✅ Loaded {len(new_df)} new records for incremental training")
-            
-            # Combine with existing data
-            existing_df = pd.read_csv(self.data_path)
-            combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-            
-            # Update data path temporarily
-            temp_path = 'temp_combined_data.csv'
-            combined_df.to_csv(temp_path, index=False)
-            self.data_path = temp_path
-            
-            return True
-        return False
+    def _new_data_count(self):
+        import sys
+        sys.path.insert(0, self.ml_dir)
+        from data_manager import data_manager
+        return data_manager.get_new_data_count()
+    
+    def _published_paths(self, grain_type=None):
+        """Published files of the SmartBin model, or of the `grain_type` ensemble
+        (the same files ensemble_train.py publishes to); the first path of each
+        role is the one read"""
+        if grain_type is None:
+            return {
+                'model': [os.path.join(self.ml_dir, 'smartbin_model.pkl')],
+                'label_encoder': [os.path.join(self.ml_dir, 'label_encoder.pkl')],
+                'metadata': [os.path.join(self.ml_dir, 'model_metadata.json')]
+            }
+        prefix = grain_type.lower()
+        paths = {
+            'model': [os.path.join(self.ml_dir, f'{prefix}_ensemble_model.pkl')],
+            'label_encoder': [os.path.join(self.ml_dir, f'{prefix}_label_encoder.pkl')],
+            'metadata': [os.path.join(self.ml_dir, f'{prefix}_model_metadata.json')]
+        }
+        if prefix == 'rice':
+            paths['model'] += [os.path.join(self.ml_dir, 'ensemble_model.pkl'),
+                               os.path.join(self.ml_dir, 'smartbin_model.pkl')]
+            paths['metadata'].append(os.path.join(self.ml_dir, 'model_metadata.json'))
+        return paths
+    
+    def _load_published_model(self, paths):
+        """Load the currently published model, encoder and metadata"""
+        model_path, encoder_path, metadata_path = (paths[role][0] for role in ('model', 'label_encoder', 'metadata'))
+        if not os.path.exists(model_path) or not os.path.exists(encoder_path):
+            return None, None, {}
+        
+        metadata = {}
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as f:
+                metadata = json.load(f)
+        return joblib.load(model_path), joblib.load(encoder_path), metadata
+    
+    def _unsupported_members(self, model):
+        """Names of the model's parts _continue_fit cannot train further"""
+        if isinstance(model, (VotingClassifier, SoftVotingEnsemble)):
+            return [name for member in model.estimators_ for name in self._unsupported_members(member)]
+        if isinstance(model, (XGBClassifier, LGBMClassifier, RandomForestClassifier)):
+            return []
+        # e.g. BoosterClassifier (out-of-core LightGBM): no sklearn fit to continue from
+        return [type(model).__name__]
+    
+    def _continue_fit(self, model, X, y, extra_rounds, update_share, shrinkage=0.1):
+        """Continue training a fitted model (or every member of an ensemble) on new rows"""
+        if isinstance(model, (VotingClassifier, SoftVotingEnsemble)):
+            for estimator in model.estimators_:
+                self._continue_fit(estimator, X, y, extra_rounds, update_share, shrinkage)
+        elif isinstance(model, (XGBClassifier, LGBMClassifier)):
+            # Boost on from the existing trees with a damped learning rate so a
+            # small batch refines the model instead of overriding it
+            params = model.get_params()
+            learning_rate = params['learning_rate'] or 0.3
+            model.set_params(n_estimators=extra_rounds, learning_rate=learning_rate * shrinkage)
+            if isinstance(model, XGBClassifier):
+                model.fit(X, y, xgb_model=model.get_booster())
+            else:
+                model.fit(X, y, init_model=model.booster_)
+            model.set_params(n_estimators=params['n_estimators'], learning_rate=params['learning_rate'])
+        elif isinstance(model, RandomForestClassifier):
+            # New trees get a vote proportional to the share of new data
+            extra_trees = max(1, int(round(len(model.estimators_) * update_share)))
+            model.set_params(warm_start=True, n_estimators=len(model.estimators_) + extra_trees)
+            model.fit(X, y)
+        else:
+            raise TypeError(f"Incremental training not supported for {type(model).__name__}")
+    
+    def incremental_training(self, new_data_path=None, extra_rounds=20, tolerance=0.0, grain_type=None):
+        """Continue training the published model on rows appended since the last update.
+        
+        Updates the SmartBin XGBoost model, or with `grain_type` the soft-voting
+        ensemble published by ensemble_train.py ({grain}_ensemble_model.pkl).
+        XGBoost and LightGBM members keep boosting from their existing booster for
+        `extra_rounds` damped rounds and RandomForest grows additional trees
+        (warm_start) in proportion to the amount of new data. A small stratified replay
+        sample of the full training's train split is mixed in so every class is present.
+        The update is only published if accuracy on the full training's test split
+        (plus a share of the new rows) does not drop by more than `tolerance`
+        compared to the previous model.
+        
+        New rows come from the manually added data (segments) when the model was
+        trained on the base dataset (the SmartBin model, the rice ensemble);
+        other grains' ensembles need `new_data_path`.
+        """
+        import sys
+        import copy
+        sys.path.insert(0, self.ml_dir)
+        from data_manager import data_manager
+        
+        paths = self._published_paths(grain_type)
+        previous, encoder, metadata = self._load_published_model(paths)
+        if previous is None:
+            print("❌ No published model found - run a full training first")
+            return {'published': False, 'reason': 'no_model'}
+        unsupported = self._unsupported_members(previous)
+        if unsupported:
+            print(f"❌ Incremental training not supported for {', '.join(unsupported)} - run a full retrain")
+            return {'published': False, 'reason': 'unsupported_model'}
+        split = metadata.get('holdout')
+        holdout_path = os.path.join(self.ml_dir, split['file']) if split else None
+        if holdout_path is None or not os.path.exists(holdout_path):
+            print("❌ The published model has no recorded train/test split - run a full training first")
+            return {'published': False, 'reason': 'no_holdout'}
+        # Only the base dataset is extended by the manually added segments
+        base = data_manager.base_source()
+        same_base = base is not None and os.path.abspath(base) == os.path.abspath(split['base_source'])
+        uses_segments = grain_type is None or same_base
+        if new_data_path is not None and not os.path.exists(new_data_path):
+            print(f"❌ New data not found: {new_data_path}")
+            return {'published': False, 'reason': 'no_new_data'}
+        if new_data_path is None and (not uses_segments or data_manager.get_new_data_count() == 0):
+            print("❌ No manually added data found")
+            return {'published': False, 'reason': 'no_new_data'}
+        
+        features = metadata.get('features', self.feature_names)
+        consumed = metadata.get('incremental', {}).get('rows_consumed', 0)
+        if new_data_path is None:
+            # Only the segments past the consumed offset are read
+            new_df = data_manager.segments.read(start_row=consumed)
+        else:
+            new_df = pd.read_csv(new_data_path).iloc[consumed:]
+        # Same fill values as the published model was trained and serves with
+        fills = metadata.get('feature_defaults') or data_manager.feature_defaults(features)
+        new_df = self._prepare_frame(new_df, features, fills)
+        if len(new_df) == 0:
+            print("✅ No new records since the last update")
+            return {'published': False, 'reason': 'no_new_rows'}
+        print(f"✅ Loaded {len(new_df)} new records for incremental training")
+        
+        unknown = set(new_df['Spoilage_Label']) - set(encoder.classes_)
+        if unknown:
+            print(f"❌ New labels {sorted(unknown)} require a full retrain")
+            return {'published': False, 'reason': 'unknown_labels'}
+        
+        y_new = encoder.transform(new_df['Spoilage_Label'])
+        X_new = new_df[features]
+        if len(new_df) >= 10 and np.bincount(y_new).min() >= 2:
+            X_upd, X_hold, y_upd, y_hold = train_test_split(
+                X_new, y_new, test_size=0.2, random_state=42, stratify=y_new
+            )
+        else:
+            X_upd, X_hold, y_upd, y_hold = X_new, X_new.iloc[:0], y_new, y_new[:0]
+        
+        # Holdout = test rows of the full training (same row numbers) + new holdout rows
+        if uses_segments:
+            X_all, labels, _ = data_manager.load_training_columns(features)
+            base_rows = len(X_all) - data_manager.get_new_data_count()
+        elif os.path.exists(split['base_source']):
+            X_all, labels, _ = data_manager.load_training_columns(features, path=split['base_source'])
+            base_rows = len(X_all)
+        else:
+            base_rows = -1
+        if (uses_segments and not same_base) or base_rows < split['base_rows']:
+            print("❌ The base dataset was replaced since the last full training - run a full retrain")
+            return {'published': False, 'reason': 'base_changed'}
+        
+        def current_rows(idx):
+            # Base rows keep their position; segment rows moved back by the base's growth
+            return np.where(idx < split['base_rows'], idx, idx + base_rows - split['base_rows'])
+        
+        test_idx = np.load(holdout_path)
+        in_train = np.ones(split['base_rows'] + split['segment_rows'], dtype=bool)
+        in_train[test_idx] = False
+        trained = {}
+        for part, idx in (('test', test_idx), ('train', np.flatnonzero(in_train))):
+            rows = current_rows(idx)
+            part_labels = np.asarray(labels[rows])
+            known = np.isin(part_labels, encoder.classes_)
+            trained[part] = (X_all.iloc[rows[known]], encoder.transform(part_labels[known]))
+        X_hold = pd.concat([trained['test'][0], X_hold])
+        y_hold = np.concatenate([trained['test'][1], y_hold])
+        
+        # Replay sample keeps every class present and limits forgetting
+        X_pool, y_pool = trained['train']
+        per_class = max(1, len(X_upd) // len(encoder.classes_))
+        rng = np.random.RandomState(42)
+        replay_idx = np.concatenate([
+            rng.choice(members, size=min(per_class, len(members)), replace=False)
+            for members in (np.flatnonzero(y_pool == c) for c in range(len(encoder.classes_)))
+        ])
+        X_upd = pd.concat([X_upd, X_pool.iloc[replay_idx]])
+        y_upd = np.concatenate([y_upd, y_pool[replay_idx]])
+        
+        if len(X_hold) == 0:
+            print("❌ Not enough data for a holdout comparison")
+            return {'published': False, 'reason': 'no_holdout'}
+        if len(np.unique(y_upd)) < len(encoder.classes_):
+            print("❌ Update batch does not cover every class - run a full retrain")
+            return {'published': False, 'reason': 'missing_classes'}
+        
+        training_rows = metadata.get('dataset_rows') or metadata.get('metrics', {}).get('training_samples') or len(X_upd)
+        updated = copy.deepcopy(previous)
+        self._continue_fit(updated, X_upd, y_upd, extra_rounds, len(X_upd) / (training_rows + len(X_upd)))
+        
+        previous_acc = float(accuracy_score(y_hold, previous.predict(X_hold)))
+        updated_acc = float(accuracy_score(y_hold, updated.predict(X_hold)))
+        report = {
+            'published': updated_acc + tolerance >= previous_acc,
+            'rows_added': len(new_df),
+            'update_rows': len(X_upd),
+            'holdout_rows': len(X_hold),
+            'holdout_accuracy_before': round(previous_acc, 4),
+            'holdout_accuracy_after': round(updated_acc, 4),
+            'timestamp': datetime.now().isoformat()
+        }
+        print(f"   Holdout accuracy: {previous_acc:.4f} -> {updated_acc:.4f}")
+        if not report['published']:
+            print("⚠️ Incremental update rejected: holdout accuracy dropped")
+            return report
+        
+        self.model = updated
+        for path in paths['model']:
+            joblib.dump(updated, path)
+        
+        metadata['incremental'] = dict(report, rows_consumed=consumed + len(new_df))
+        for path in paths['metadata']:
+            with open(path, 'w') as f:
+                json.dump(metadata, f, indent=2, default=str)
+        print("✅ Incremental update published")
+        return report
     
     def get_feature_importance(self):
         """Get feature importance from the trained model"""
@@ -231,28 +590,73 @@ class SmartBinModelTrainer:
             print(f"❌ Prediction error: {e}")
             return None
 
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Train the SmartBin XGBoost model on the combined dataset.')
+    parser.add_argument('--time-budget', type=float, metavar='SECONDS',
+                        help='finish tuning, training and publishing within this wall-clock budget')
+    parser.add_argument('--incremental', action='store_true',
+                        help='continue training the published model on rows added since the last '
+                             'update instead of a full retrain')
+    parser.add_argument('--grain', metavar='GRAIN',
+                        help='with --incremental: update the ensemble ensemble_train.py published for '
+                             'this grain instead of the SmartBin model')
+    parser.add_argument('--new-data', metavar='CSV',
+                        help='with --incremental: read new rows from this CSV instead of the manually '
+                             'added data')
+    parser.add_argument('--profile-trace', metavar='PATH',
+                        help='append per-phase wall/CPU/peak-RSS records to this JSONL file '
+                             '(default: $GRAINHERO_PROFILE_TRACE)')
+    return parser.parse_args(argv)
+
 def main():
     """Main training function"""
-    print("🚀 Starting SmartBin Model Training...")
-    
-    trainer = SmartBinModelTrainer()
-    
-    # Load data
-    X_train, X_test, y_train, y_test, df = trainer.load_and_preprocess_data()
-    if X_train is None:
+    args = parse_args()
+    if args.incremental:
+        print("🚀 Starting incremental SmartBin update...")
+        report = SmartBinModelTrainer(profile_trace=args.profile_trace).incremental_training(
+            new_data_path=args.new_data, grain_type=args.grain)
+        print(json.dumps(report))
         return
+    print("🚀 Starting SmartBin Model Training...")
     
-    # Hyperparameter tuning
-    print("🔧 Optimizing hyperparameters...")
-    best_params = trainer.hyperparameter_tuning(X_train, y_train, n_trials=20)
-    
-    # Train model
-    print("🎯 Training model...")
-    metrics = trainer.train_model(X_train, X_test, y_train, y_test, best_params)
+    budget = TimeBudget(args.time_budget) if args.time_budget else None
+    trainer = SmartBinModelTrainer(profile_trace=args.profile_trace)
     
-    # Save model
-    print("💾 Saving model...")
-    success = trainer.save_model(metrics, best_params)
+    # Reuse the stored model when the data and settings are unchanged (the
+    # key hashes the source files, so a hit skips loading them)
+    metrics = trainer.publish_cached(n_trials=20, time_budget=args.time_budget)
+    if metrics is not None:
+        success = True
+    else:
+        # Load data
+        with trainer.phase('load_data', budget):
+            X_train, X_test, y_train, y_test, df = trainer.load_and_preprocess_data()
+        if X_train is None:
+            return
+        
+        # Hyperparameter tuning
+        print("🔧 Optimizing hyperparameters...")
+        timeout = budget.tuning_allowance(1) if budget else None
+        with trainer.phase('tuning_XGBoost', budget, timeout):
+            best_params = trainer.hyperparameter_tuning(X_train, y_train, n_trials=20, timeout=timeout)
+        if budget and trainer.tuning_trials < 20:
+            budget.cut_short('tuning_XGBoost', 'deadline')
+        
+        # Train model
+        print("🎯 Training model...")
+        metrics = trainer.train_model(X_train, X_test, y_train, y_test, best_params, budget)
+        
+        # Save model
+        print("💾 Saving model...")
+        with trainer.phase('save', budget):
+            success = trainer.save_model(metrics, best_params, budget)
+        
+        print("\n⏱️ Phase profile:")
+        for name, p in trainer.profiler.phases.items():
+            print(f"   {name:18s} wall={p['wall_s']:7.2f}s  cpu={p['cpu_s']:7.2f}s  peak={p['peak_rss_mb']:7.1f}MB")
+        trainer.profiler.write_trace(trainer='SmartBinModelTrainer', grain_type='rice',
+                                     dataset_rows=len(df))
     
     if success:
         print("✅ Training completed successfully!")
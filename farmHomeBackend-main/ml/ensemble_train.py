@@ -11,12 +11,13 @@ Based on Weka evaluation results:
   - Stacking:       97.16% accuracy
   -> Ensemble of XGBoost + RF + LightGBM with soft voting expected: 96-99%
 """
-import pandas as pd
+import argparse
 import numpy as np
 import joblib
 import json
 import os
 import sys
+import tempfile
 from datetime import datetime
 from sklearn.model_selection import train_test_split, cross_val_score, StratifiedKFold
 from sklearn.metrics import (accuracy_score, precision_score, recall_score,
@@ -25,8 +26,22 @@ from sklearn.preprocessing import LabelEncoder
 from sklearn.ensemble import RandomForestClassifier, VotingClassifier
 from xgboost import XGBClassifier
 from lightgbm import LGBMClassifier
+import xgboost as xgb
+import lightgbm as lgb
 import optuna
+import time
 import warnings
+from contextlib import ExitStack
+from columnar_cache import columnar_cache
+from dataset_loader import encode_labels, DEFAULT_CHUNKSIZE
+from drift_monitor import reference_histograms
+from feature_stats import FeatureStats
+from profiling_hooks import profiled, enable as enable_profiling
+from out_of_core import (spill_dataset, train_xgboost, train_lightgbm, SoftVotingEnsemble,
+                         DEFAULT_SAMPLE_SIZE)
+from training_budget import TimeBudget
+from training_cache import training_cache
+from training_profiler import PhaseProfiler
 
 warnings.filterwarnings('ignore')
 optuna.logging.set_verbosity(optuna.logging.WARNING)
@@ -39,12 +54,30 @@ sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='repla
 ML_DIR = os.path.dirname(os.path.abspath(__file__))
 
 SUPPORTED_GRAINS = ['rice', 'wheat', 'maize', 'sorghum', 'barley']
+# Tuning stops a fold once the error on its early-stopping slice has not
+# improved for this many boosting rounds
+EARLY_STOPPING_ROUNDS = 50
+# Share of each fold's training part held out to watch for early stopping,
+# so the validation fold that scores the trial plays no part in fitting it
+EARLY_STOPPING_FRACTION = 0.15
+
+# With a time budget, final fits that would overrun it are shrunk to at most
+# this few boosting rounds / trees
+MIN_FINAL_ROUNDS = 20
+
+# Used when a time-budgeted study finishes no trial
+DEFAULT_PARAMS = {
+    'XGBoost': {'max_depth': 6, 'n_estimators': 200, 'learning_rate': 0.1,
+                'subsample': 0.8, 'colsample_bytree': 0.8},
+    'RandomForest': {'n_estimators': 200, 'max_depth': 20, 'max_features': 'sqrt'},
+    'LightGBM': {'n_estimators': 200, 'learning_rate': 0.1, 'num_leaves': 31},
+}
 
 
 class GrainEnsembleTrainer:
     """Trains an ensemble of XGBoost + Random Forest + LightGBM with soft voting."""
 
-    def __init__(self, grain_type='rice', dataset_path=None):
+    def __init__(self, grain_type='rice', dataset_path=None, profile_trace=None):
         self.grain_type = grain_type.lower()
         self.dataset_path = dataset_path or os.path.join(ML_DIR, f'{self.grain_type}_spoilage_10k.csv')
         self.feature_names = [
@@ -52,10 +85,29 @@ class GrainEnsembleTrainer:
             'Dew_Point', 'Ambient_Light', 'Pest_Presence',
             'Grain_Moisture', 'Rainfall'
         ]
+        self.random_state = 42
         self.label_encoder = LabelEncoder()
         self.ensemble = None
         self.individual_models = {}
         self.metrics = {}
+        self.cache_key = None
+        self.cache_info = None
+        self.checkpointed = False
+        self.tuning_trials = {}
+        self.trial_seconds = {}
+        self.split = None
+        self.holdout_indices = None
+        self.load_report = None
+        self.feature_stats = FeatureStats()
+        self.profiler = PhaseProfiler(trace_path=profile_trace)
+
+    def phase(self, name, budget=None, allotted=None):
+        """Profile a named phase and, with a TimeBudget, charge it to the budget."""
+        stack = ExitStack()
+        stack.enter_context(self.profiler.phase(name))
+        if budget:
+            stack.enter_context(budget.phase(name, allotted))
+        return stack
 
     def load_data(self):
         """Load and preprocess the dataset."""
@@ -64,44 +116,112 @@ class GrainEnsembleTrainer:
             print(f"Dataset not found: {self.dataset_path}")
             return None, None, None, None
 
-        df = pd.read_csv(self.dataset_path)
-        print(f"   Rows: {len(df)}")
-
-        # Normalize label column
-        if 'Spoilage_Label' in df.columns:
-            label_col = 'Spoilage_Label'
-        elif 'Spoilage_Class' in df.columns:
-            label_map = {0: 'Safe', 1: 'Risky', 2: 'Spoiled'}
-            df['Spoilage_Label'] = df['Spoilage_Class'].map(
-                lambda x: label_map.get(int(x), 'Safe') if pd.notna(x) else 'Safe'
-            )
-            label_col = 'Spoilage_Label'
-        else:
-            print("No Spoilage_Label or Spoilage_Class column found")
+        try:
+            X, labels, self.load_report = columnar_cache.load(self.dataset_path, self.feature_names)
+        except ValueError as e:
+            print(e)
             return None, None, None, None
-
-        df = df.dropna(subset=[label_col])
-
-        # Ensure all features exist
-        for col in self.feature_names:
-            if col not in df.columns:
-                df[col] = 0
-        df[self.feature_names] = df[self.feature_names].apply(pd.to_numeric, errors='coerce')
-        df[self.feature_names] = df[self.feature_names].fillna(df[self.feature_names].median())
-
-        X = df[self.feature_names]
-        y = self.label_encoder.fit_transform(df[label_col])
+        self.feature_stats = FeatureStats.from_dict(self.load_report.pop('feature_stats'))
+        y = encode_labels(self.label_encoder, labels)
 
         print(f"   Classes: {dict(zip(self.label_encoder.classes_, np.bincount(y)))}")
         print(f"   Features: {self.feature_names}")
 
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42, stratify=y
+        # Split by row index so incremental training (enhanced_train.py) can
+        # evaluate on the same test rows
+        train_idx, test_idx = train_test_split(
+            np.arange(len(y)), test_size=0.2, random_state=self.random_state, stratify=y
         )
+        X_train, X_test = X.iloc[train_idx], X.iloc[test_idx]
+        y_train, y_test = y[train_idx], y[test_idx]
+        self.split = {'base_source': os.path.abspath(self.dataset_path), 'base_rows': len(y), 'segment_rows': 0}
+        self.holdout_indices = test_idx
         print(f"   Train: {len(X_train)}, Test: {len(X_test)}")
         return X_train, X_test, y_train, y_test
 
-    def _tune_xgboost(self, X_train, y_train, n_trials=15):
+    def _build_tuning_folds(self, X_train, y_train, n_splits=3):
+        """
+        Build fold-wise QuantileDMatrix / lgb.Dataset objects once so every
+        Optuna trial reuses the same quantized matrices and histogram bins.
+        Same outer splits as cross_val_score(cv=3) on a classifier; each
+        fold's training part is further split into fit rows and an
+        early-stopping slice (EARLY_STOPPING_FRACTION).
+        """
+        X = np.ascontiguousarray(X_train, dtype=np.float32)
+        y = np.asarray(y_train)
+        folds = []
+        for train_idx, valid_idx in StratifiedKFold(n_splits=n_splits).split(X, y):
+            fit_idx, stop_idx = train_test_split(train_idx, test_size=EARLY_STOPPING_FRACTION,
+                                                 random_state=self.random_state, stratify=y[train_idx])
+            xgb_train = xgb.QuantileDMatrix(X[fit_idx], y[fit_idx])
+            lgb_train = lgb.Dataset(X[fit_idx], y[fit_idx], params={'verbose': -1},
+                                    free_raw_data=False).construct()
+            folds.append({
+                'X_valid': X[valid_idx],
+                'y_valid': y[valid_idx],
+                'xgb_train': xgb_train,
+                'xgb_stop': xgb.QuantileDMatrix(X[stop_idx], y[stop_idx], ref=xgb_train),
+                'xgb_valid': xgb.QuantileDMatrix(X[valid_idx], ref=xgb_train),
+                'lgb_train': lgb_train,
+                'lgb_stop': lgb.Dataset(X[stop_idx], y[stop_idx], reference=lgb_train).construct(),
+            })
+        return folds
+
+    def _optimize(self, name, objective, n_trials, timeout=None):
+        """
+        Run a seeded Optuna study. With a timeout the study stops once its
+        share of the time budget is spent and keeps the best trial so far;
+        returns None if no trial completed.
+        """
+        study = optuna.create_study(direction='maximize',
+                                    sampler=optuna.samplers.TPESampler(seed=self.random_state))
+        study.optimize(objective, n_trials=n_trials, timeout=timeout, show_progress_bar=False)
+        completed = study.get_trials(deepcopy=False, states=[optuna.trial.TrialState.COMPLETE])
+        self.tuning_trials[name] = len(completed)
+        if not completed:
+            print(f"   {name}: no trial finished within the budget, using defaults")
+            return None
+        print(f"   {name} best CV: {study.best_value:.4f} ({len(completed)} trials)")
+        self.trial_seconds[name] = study.best_trial.duration.total_seconds()
+        return study.best_trial
+
+    def _tune_xgboost(self, X_train, y_train, n_trials=15, folds=None, timeout=None):
+        n_classes = len(np.unique(y_train))
+        folds = folds or self._build_tuning_folds(X_train, y_train)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        def objective(trial):
+            params = {
+                'max_depth': trial.suggest_int('max_depth', 3, 10),
+                'n_estimators': trial.suggest_int('n_estimators', 100, 500),
+                'learning_rate': trial.suggest_float('learning_rate', 0.01, 0.3),
+                'subsample': trial.suggest_float('subsample', 0.6, 1.0),
+                'colsample_bytree': trial.suggest_float('colsample_bytree', 0.6, 1.0),
+                'gamma': trial.suggest_float('gamma', 0, 2),
+                'reg_alpha': trial.suggest_float('reg_alpha', 0, 5),
+                'reg_lambda': trial.suggest_float('reg_lambda', 0, 5),
+            }
+            num_rounds = params.pop('n_estimators')
+            params.update(objective='multi:softprob', num_class=n_classes, eval_metric='merror',
+                          tree_method='hist', seed=self.random_state, verbosity=0)
+            scores, rounds = [], []
+            for fold in folds:
+                if deadline is not None and time.monotonic() > deadline:
+                    raise optuna.TrialPruned()
+                booster = xgb.train(params, fold['xgb_train'], num_boost_round=num_rounds,
+                                    evals=[(fold['xgb_stop'], 'stop')],
+                                    early_stopping_rounds=EARLY_STOPPING_ROUNDS, verbose_eval=False)
+                proba = booster.predict(fold['xgb_valid'], iteration_range=(0, booster.best_iteration + 1))
+                scores.append(np.mean(proba.argmax(axis=1) == fold['y_valid']))
+                rounds.append(booster.best_iteration + 1)
+            trial.set_user_attr('n_estimators', int(np.mean(rounds)))
+            return float(np.mean(scores))
+        best = self._optimize('XGBoost', objective, n_trials, timeout)
+        if best is None:
+            return dict(DEFAULT_PARAMS['XGBoost'])
+        return dict(best.params, n_estimators=best.user_attrs['n_estimators'])
+
+    def _tune_xgboost_sklearn(self, X_train, y_train, n_trials=15):
+        """Reference tuning path through the sklearn wrapper (rebuilds bins per fold per trial)."""
         n_classes = len(np.unique(y_train))
         def objective(trial):
             params = {
@@ -114,16 +234,17 @@ class GrainEnsembleTrainer:
                 'reg_alpha': trial.suggest_float('reg_alpha', 0, 5),
                 'reg_lambda': trial.suggest_float('reg_lambda', 0, 5),
             }
-            model = XGBClassifier(**params, random_state=42, verbosity=0,
+            model = XGBClassifier(**params, random_state=self.random_state, verbosity=0,
                                   num_class=n_classes, objective='multi:softprob')
             scores = cross_val_score(model, X_train, y_train, cv=3, scoring='accuracy', n_jobs=1)
             return scores.mean()
-        study = optuna.create_study(direction='maximize')
-        study.optimize(objective, n_trials=n_trials, show_progress_bar=False)
-        print(f"   XGBoost best CV: {study.best_value:.4f}")
-        return study.best_params
+        return self._optimize('XGBoost', objective, n_trials).params
 
-    def _tune_rf(self, X_train, y_train, n_trials=15):
+    def _tune_rf(self, X_train, y_train, n_trials=15, timeout=None):
+        X = np.asarray(X_train, dtype=np.float32)
+        y = np.asarray(y_train)
+        splits = list(StratifiedKFold(n_splits=3).split(X, y))
+        deadline = time.monotonic() + timeout if timeout is not None else None
         def objective(trial):
             params = {
                 'n_estimators': trial.suggest_int('n_estimators', 100, 600),
@@ -132,15 +253,54 @@ class GrainEnsembleTrainer:
                 'min_samples_leaf': trial.suggest_int('min_samples_leaf', 1, 5),
                 'max_features': trial.suggest_categorical('max_features', ['sqrt', 'log2']),
             }
-            model = RandomForestClassifier(**params, random_state=42, n_jobs=1)
-            scores = cross_val_score(model, X_train, y_train, cv=3, scoring='accuracy', n_jobs=1)
-            return scores.mean()
-        study = optuna.create_study(direction='maximize')
-        study.optimize(objective, n_trials=n_trials, show_progress_bar=False)
-        print(f"   RandomForest best CV: {study.best_value:.4f}")
-        return study.best_params
-
-    def _tune_lgbm(self, X_train, y_train, n_trials=15):
+            scores = []
+            for train_idx, valid_idx in splits:
+                if deadline is not None and time.monotonic() > deadline:
+                    raise optuna.TrialPruned()
+                model = RandomForestClassifier(**params, random_state=self.random_state, n_jobs=1)
+                model.fit(X[train_idx], y[train_idx])
+                scores.append(model.score(X[valid_idx], y[valid_idx]))
+            return float(np.mean(scores))
+        best = self._optimize('RandomForest', objective, n_trials, timeout)
+        return dict(best.params) if best is not None else dict(DEFAULT_PARAMS['RandomForest'])
+
+    def _tune_lgbm(self, X_train, y_train, n_trials=15, folds=None, timeout=None):
+        n_classes = len(np.unique(y_train))
+        folds = folds or self._build_tuning_folds(X_train, y_train)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        def objective(trial):
+            params = {
+                'n_estimators': trial.suggest_int('n_estimators', 100, 500),
+                'max_depth': trial.suggest_int('max_depth', 3, 15),
+                'learning_rate': trial.suggest_float('learning_rate', 0.01, 0.3),
+                'num_leaves': trial.suggest_int('num_leaves', 20, 100),
+                'subsample': trial.suggest_float('subsample', 0.6, 1.0),
+                'colsample_bytree': trial.suggest_float('colsample_bytree', 0.6, 1.0),
+                'reg_alpha': trial.suggest_float('reg_alpha', 0, 5),
+                'reg_lambda': trial.suggest_float('reg_lambda', 0, 5),
+            }
+            num_rounds = params.pop('n_estimators')
+            params.update(objective='multiclass', num_class=n_classes, metric='multi_error',
+                          seed=self.random_state, verbosity=-1, num_threads=1)
+            scores, rounds = [], []
+            for fold in folds:
+                if deadline is not None and time.monotonic() > deadline:
+                    raise optuna.TrialPruned()
+                booster = lgb.train(params, fold['lgb_train'], num_boost_round=num_rounds,
+                                    valid_sets=[fold['lgb_stop']],
+                                    callbacks=[lgb.early_stopping(EARLY_STOPPING_ROUNDS, verbose=False)])
+                proba = booster.predict(fold['X_valid'], num_iteration=booster.best_iteration)
+                scores.append(np.mean(proba.argmax(axis=1) == fold['y_valid']))
+                rounds.append(booster.best_iteration or num_rounds)
+            trial.set_user_attr('n_estimators', int(np.mean(rounds)))
+            return float(np.mean(scores))
+        best = self._optimize('LightGBM', objective, n_trials, timeout)
+        if best is None:
+            return dict(DEFAULT_PARAMS['LightGBM'])
+        return dict(best.params, n_estimators=best.user_attrs['n_estimators'])
+
+    def _tune_lgbm_sklearn(self, X_train, y_train, n_trials=15):
+        """Reference tuning path through the sklearn wrapper (rebuilds bins per fold per trial)."""
         def objective(trial):
             params = {
                 'n_estimators': trial.suggest_int('n_estimators', 100, 500),
@@ -152,29 +312,116 @@ class GrainEnsembleTrainer:
                 'reg_alpha': trial.suggest_float('reg_alpha', 0, 5),
                 'reg_lambda': trial.suggest_float('reg_lambda', 0, 5),
             }
-            model = LGBMClassifier(**params, random_state=42, verbosity=-1, n_jobs=1)
+            model = LGBMClassifier(**params, random_state=self.random_state, verbosity=-1, n_jobs=1)
             scores = cross_val_score(model, X_train, y_train, cv=3, scoring='accuracy', n_jobs=1)
             return scores.mean()
-        study = optuna.create_study(direction='maximize')
-        study.optimize(objective, n_trials=n_trials, show_progress_bar=False)
-        print(f"   LightGBM best CV: {study.best_value:.4f}")
-        return study.best_params
+        return self._optimize('LightGBM', objective, n_trials).params
+
+    def compare_tuning(self, X_train, y_train, n_trials=15):
+        """
+        Time the shared-dataset native tuning path against the sklearn
+        wrapper path for XGBoost and LightGBM. Returns seconds per path.
+        """
+        report = {}
+        start = time.perf_counter()
+        folds = self._build_tuning_folds(X_train, y_train)
+        build_time = time.perf_counter() - start
+        for name, native, reference in [
+            ('XGBoost', self._tune_xgboost, self._tune_xgboost_sklearn),
+            ('LightGBM', self._tune_lgbm, self._tune_lgbm_sklearn),
+        ]:
+            start = time.perf_counter()
+            reference(X_train, y_train, n_trials)
+            sklearn_time = time.perf_counter() - start
+            start = time.perf_counter()
+            native(X_train, y_train, n_trials, folds=folds)
+            # Fold construction is shared, so charge each model half of it
+            native_time = time.perf_counter() - start + build_time / 2
+            report[name] = {
+                'sklearn_seconds': round(sklearn_time, 2),
+                'native_seconds': round(native_time, 2),
+                'saved_seconds': round(sklearn_time - native_time, 2),
+                'speedup': round(sklearn_time / native_time, 2) if native_time > 0 else None,
+            }
+            print(f"   {name}: sklearn={sklearn_time:.1f}s  native={native_time:.1f}s  "
+                  f"saved={sklearn_time - native_time:.1f}s")
+        return report
+
+    def _holdout_metrics(self, model, X_test, y_test):
+        y_pred = model.predict(X_test)
+        return y_pred, self._scores(y_test, y_pred)
+
+    def _scores(self, y_test, y_pred):
+        return {
+            'accuracy': round(float(accuracy_score(y_test, y_pred)), 4),
+            'precision': round(float(precision_score(y_test, y_pred, average='weighted')), 4),
+            'recall': round(float(recall_score(y_test, y_pred, average='weighted')), 4),
+            'f1_score': round(float(f1_score(y_test, y_pred, average='weighted')), 4),
+            'cv_mean': None,
+            'cv_std': None,
+        }
 
-    def train(self, X_train, X_test, y_train, y_test, n_tuning_trials=15):
-        """Train all 3 models + ensemble."""
+    def _tune_all(self, X_train, y_train, n_tuning_trials, budget=None):
+        """Tune the three members in turn, sharing the time budget between them."""
+        with self.phase('build_folds', budget):
+            folds = self._build_tuning_folds(X_train, y_train)
+        tuners = [
+            ('XGBoost', lambda t: self._tune_xgboost(X_train, y_train, n_tuning_trials, folds=folds, timeout=t)),
+            ('RandomForest', lambda t: self._tune_rf(X_train, y_train, n_tuning_trials, timeout=t)),
+            ('LightGBM', lambda t: self._tune_lgbm(X_train, y_train, n_tuning_trials, folds=folds, timeout=t)),
+        ]
+        best_params_all = {}
+        for i, (name, tune) in enumerate(tuners):
+            print(f"\nTuning {name}...")
+            timeout = budget.tuning_allowance(len(tuners) - i) if budget else None
+            with self.phase(f'tuning_{name}', budget, timeout):
+                best_params_all[name] = tune(timeout)
+            if budget and self.tuning_trials.get(name, 0) < n_tuning_trials:
+                budget.cut_short(f'tuning_{name}', 'deadline')
+        return best_params_all
+
+    def _bound_final_fit(self, best_params_all, budget, rows_scale=1.0):
+        """
+        Shrink n_estimators so the final fits still fit in the time budget.
+
+        A tuning trial fits three folds on about 60% of the tuning rows, so
+        the best trial's duration (times rows_scale, the final/tuning row
+        ratio) is a conservative estimate of one final fit. If the estimates
+        exceed the remaining budget, every model's rounds/trees are scaled
+        down in proportion (to no fewer than MIN_FINAL_ROUNDS).
+        Returns (params, cut-short reason or None).
+        """
+        estimate = sum(self.trial_seconds.get(name, 0.0) for name in best_params_all) * rows_scale
+        if not budget or not estimate or budget.can_afford(estimate):
+            return best_params_all, None
+        scale = budget.remaining() / estimate
+        print(f"\nFinal fits need ~{estimate:.0f}s, {budget.remaining():.0f}s left: "
+              f"scaling n_estimators to {scale:.0%}")
+        return {name: dict(params, n_estimators=min(params['n_estimators'],
+                                                    max(MIN_FINAL_ROUNDS, int(params['n_estimators'] * scale))))
+                if 'n_estimators' in params else params
+                for name, params in best_params_all.items()}, f'n_estimators scaled to {scale:.2f}'
+
+    @profiled('GrainEnsembleTrainer.train')
+    def train(self, X_train, X_test, y_train, y_test, n_tuning_trials=15, budget=None):
+        """
+        Train all 3 models + ensemble.
+
+        Each member is fitted once; the ensemble soft-votes over the fitted
+        members. With a TimeBudget, each tuning study stops at its share of
+        the budget, the final fits are shrunk if they would overrun it, the
+        fitted ensemble is published as a checkpoint before the (optional)
+        cross-validation scoring, and CV is skipped if it no longer fits.
+        """
         n_classes = len(np.unique(y_train))
+        best_params_all = self._tune_all(X_train, y_train, n_tuning_trials, budget)
+        best_params_all, shrunk = self._bound_final_fit(best_params_all, budget)
 
-        print("\nTuning XGBoost...")
-        xgb_params = self._tune_xgboost(X_train, y_train, n_tuning_trials)
-        print("Tuning Random Forest...")
-        rf_params = self._tune_rf(X_train, y_train, n_tuning_trials)
-        print("Tuning LightGBM...")
-        lgbm_params = self._tune_lgbm(X_train, y_train, n_tuning_trials)
-
-        xgb_model = XGBClassifier(**xgb_params, random_state=42, verbosity=0,
+        xgb_model = XGBClassifier(**best_params_all['XGBoost'], random_state=self.random_state, verbosity=0,
                                    num_class=n_classes, objective='multi:softprob')
-        rf_model = RandomForestClassifier(**rf_params, random_state=42, n_jobs=1)
-        lgbm_model = LGBMClassifier(**lgbm_params, random_state=42, verbosity=-1, n_jobs=1)
+        rf_model = RandomForestClassifier(**best_params_all['RandomForest'], random_state=self.random_state, n_jobs=1)
+        lgbm_model = LGBMClassifier(**best_params_all['LightGBM'], random_state=self.random_state,
+                                    verbosity=-1, n_jobs=1)
 
         print("\nTraining individual models...")
         models = {
@@ -182,55 +429,26 @@ class GrainEnsembleTrainer:
             'RandomForest': rf_model,
             'LightGBM': lgbm_model,
         }
-        best_params_all = {
-            'XGBoost': xgb_params,
-            'RandomForest': rf_params,
-            'LightGBM': lgbm_params,
-        }
 
-        for name, model in models.items():
-            model.fit(X_train, y_train)
-            y_pred = model.predict(X_test)
-            acc = accuracy_score(y_test, y_pred)
-            prec = precision_score(y_test, y_pred, average='weighted')
-            rec = recall_score(y_test, y_pred, average='weighted')
-            f1 = f1_score(y_test, y_pred, average='weighted')
-            cv_scores = cross_val_score(model, X_train, y_train, cv=5, scoring='accuracy')
-
-            self.metrics[name] = {
-                'accuracy': round(float(acc), 4),
-                'precision': round(float(prec), 4),
-                'recall': round(float(rec), 4),
-                'f1_score': round(float(f1), 4),
-                'cv_mean': round(float(cv_scores.mean()), 4),
-                'cv_std': round(float(cv_scores.std()), 4),
-            }
-            self.individual_models[name] = model
-            print(f"   {name}: Acc={acc:.4f}, F1={f1:.4f}, CV={cv_scores.mean():.4f}")
+        fit_start = time.monotonic()
+        with self.phase('final_fit', budget):
+            for name, model in models.items():
+                model.fit(X_train, y_train)
+                _, self.metrics[name] = self._holdout_metrics(model, X_test, y_test)
+                self.individual_models[name] = model
+                print(f"   {name}: Acc={self.metrics[name]['accuracy']:.4f}, F1={self.metrics[name]['f1_score']:.4f}")
+
+        fit_seconds = time.monotonic() - fit_start
+        if shrunk:
+            budget.cut_short('final_fit', shrunk)
 
         print("\nBuilding soft voting ensemble...")
-        self.ensemble = VotingClassifier(
-            estimators=[('xgb', xgb_model), ('rf', rf_model), ('lgbm', lgbm_model)],
-            voting='soft', n_jobs=1
-        )
-        self.ensemble.fit(X_train, y_train)
-        y_pred_ensemble = self.ensemble.predict(X_test)
-
-        ens_acc = accuracy_score(y_test, y_pred_ensemble)
-        ens_prec = precision_score(y_test, y_pred_ensemble, average='weighted')
-        ens_rec = recall_score(y_test, y_pred_ensemble, average='weighted')
-        ens_f1 = f1_score(y_test, y_pred_ensemble, average='weighted')
-        cv_ens = cross_val_score(self.ensemble, X_train, y_train, cv=5, scoring='accuracy')
-
-        self.metrics['Ensemble'] = {
-            'accuracy': round(float(ens_acc), 4),
-            'precision': round(float(ens_prec), 4),
-            'recall': round(float(ens_rec), 4),
-            'f1_score': round(float(ens_f1), 4),
-            'cv_mean': round(float(cv_ens.mean()), 4),
-            'cv_std': round(float(cv_ens.std()), 4),
-        }
-        print(f"   Ensemble: Acc={ens_acc:.4f}, F1={ens_f1:.4f}, CV={cv_ens.mean():.4f}")
+        members = [('xgb', xgb_model), ('rf', rf_model), ('lgbm', lgbm_model)]
+        with self.phase('ensemble_fit', budget):
+            self.ensemble = SoftVotingEnsemble(members)
+            y_pred_ensemble, self.metrics['Ensemble'] = self._holdout_metrics(self.ensemble, X_test, y_test)
+        print(f"   Ensemble: Acc={self.metrics['Ensemble']['accuracy']:.4f}, "
+              f"F1={self.metrics['Ensemble']['f1_score']:.4f}")
 
         # Feature importance (average across all 3)
         importances = np.zeros(len(self.feature_names))
@@ -241,6 +459,27 @@ class GrainEnsembleTrainer:
             zip(self.feature_names, importances), key=lambda x: x[1], reverse=True
         )
 
+        if budget:
+            # Publish what we have before spending the rest of the budget on CV
+            with self.phase('checkpoint', budget):
+                self.save(best_params_all, budget=budget, store_cache=False)
+            self.checkpointed = True
+
+        # 5-fold CV refits every model five times, and the ensemble (a
+        # VotingClassifier over unfitted copies) all three again
+        if budget and not budget.can_afford(2 * 5 * fit_seconds):
+            budget.cut_short('cross_validation', 'insufficient budget')
+            print("\nSkipping cross-validation: not enough time left in the budget")
+        else:
+            print("\nCross-validating...")
+            with self.phase('cross_validation', budget):
+                voting = VotingClassifier(estimators=members, voting='soft', n_jobs=1)
+                for name, model in list(models.items()) + [('Ensemble', voting)]:
+                    cv_scores = cross_val_score(model, X_train, y_train, cv=5, scoring='accuracy')
+                    self.metrics[name]['cv_mean'] = round(float(cv_scores.mean()), 4)
+                    self.metrics[name]['cv_std'] = round(float(cv_scores.std()), 4)
+                    print(f"   {name}: CV={cv_scores.mean():.4f}")
+
         cm = confusion_matrix(y_test, y_pred_ensemble)
         print(f"\nConfusion Matrix (Ensemble):")
         print(f"   Classes: {list(self.label_encoder.classes_)}")
@@ -248,21 +487,161 @@ class GrainEnsembleTrainer:
 
         return self.metrics, best_params_all
 
-    def save(self, best_params_all):
-        """Save ensemble model, label encoder, and metadata."""
-        prefix = self.grain_type
-        ensemble_path = os.path.join(ML_DIR, f'{prefix}_ensemble_model.pkl')
-        encoder_path = os.path.join(ML_DIR, f'{prefix}_label_encoder.pkl')
-        metadata_path = os.path.join(ML_DIR, f'{prefix}_model_metadata.json')
+    @profiled('GrainEnsembleTrainer.train_out_of_core')
+    def train_out_of_core(self, n_tuning_trials=15, budget=None, chunksize=DEFAULT_CHUNKSIZE,
+                          sample_size=DEFAULT_SAMPLE_SIZE, workdir=None):
+        """
+        Train the ensemble without loading the dataset into memory.
+
+        The CSV is streamed once into memory-mapped train/test files (80/20
+        random split) while a stratified reservoir sample is kept. Tuning and
+        the RandomForest use the sample; XGBoost (external memory) and
+        LightGBM (batched Dataset) train on every row. Cross-validation is
+        not run in this mode.
+        """
+        print(f"Streaming dataset: {self.dataset_path}")
+        if not os.path.exists(self.dataset_path):
+            print(f"Dataset not found: {self.dataset_path}")
+            return None, None
+
+        with tempfile.TemporaryDirectory(prefix=f'{self.grain_type}_ooc_', dir=workdir) as spill_dir:
+            with self.phase('spill', budget):
+                try:
+                    data = spill_dataset(self.dataset_path, self.feature_names, spill_dir, chunksize,
+                                         sample_size=sample_size, seed=self.random_state)
+                except ValueError as e:
+                    print(e)
+                    return None, None
+            self.label_encoder.classes_ = data.classes
+            self.feature_stats = data.feature_stats
+            n_classes = len(data.classes)
+            X_sample, y_sample = data.sample_frame()
+            self.load_report = {'mode': 'out-of-core', 'rows': data.n_train + data.n_test,
+                                'chunks': data.chunks, 'sample_rows': len(y_sample)}
+            print(f"   Train: {data.n_train}, Test: {data.n_test}, Sample: {len(y_sample)} "
+                  f"({data.chunks} chunk(s))")
+            print(f"   Classes: {list(data.classes)}")
+
+            best_params_all = self._tune_all(X_sample, y_sample, n_tuning_trials, budget)
+            best_params_all, shrunk = self._bound_final_fit(best_params_all, budget, data.n_train / len(y_sample))
+
+            print("\nTraining individual models (out of core)...")
+            with self.phase('final_fit', budget):
+                models = {
+                    'XGBoost': train_xgboost(data, best_params_all['XGBoost'], n_classes, self.random_state),
+                    'RandomForest': RandomForestClassifier(**best_params_all['RandomForest'],
+                                                           random_state=self.random_state,
+                                                           n_jobs=1).fit(X_sample, y_sample),
+                    'LightGBM': train_lightgbm(data, best_params_all['LightGBM'], n_classes, self.random_state),
+                }
+            self.individual_models = models
+            if shrunk:
+                budget.cut_short('final_fit', shrunk)
+
+            with self.phase('ensemble_fit', budget):
+                self.ensemble = SoftVotingEnsemble(
+                    [('xgb', models['XGBoost']), ('rf', models['RandomForest']), ('lgbm', models['LightGBM'])]
+                )
+
+            with self.phase('holdout_eval', budget):
+                y_test = np.asarray(data.y_test)
+                members = list(models.items()) + [('Ensemble', self.ensemble)]
+                predictions = {name: [] for name, _ in members}
+                for X_batch in data.test_batches(fill=self.feature_stats.defaults()):
+                    for name, model in members:
+                        predictions[name].append(model.predict(X_batch))
+                for name, _ in members:
+                    y_pred = np.concatenate(predictions[name])
+                    self.metrics[name] = self._scores(y_test, y_pred)
+                    print(f"   {name}: Acc={self.metrics[name]['accuracy']:.4f}, "
+                          f"F1={self.metrics[name]['f1_score']:.4f}")
+
+        importances = np.zeros(len(self.feature_names))
+        for model in models.values():
+            importances += model.feature_importances_
+        importances /= 3
+        self.feature_importance = sorted(
+            zip(self.feature_names, importances), key=lambda x: x[1], reverse=True
+        )
+        if budget:
+            budget.skip('cross_validation', 'out-of-core')
 
-        joblib.dump(self.ensemble, ensemble_path)
-        joblib.dump(self.label_encoder, encoder_path)
+        cm = confusion_matrix(y_test, np.concatenate(predictions['Ensemble']))
+        print(f"\nConfusion Matrix (Ensemble):")
+        print(f"   Classes: {list(self.label_encoder.classes_)}")
+        print(f"   {cm}")
+        return self.metrics, best_params_all
 
+    def _artifact_paths(self):
+        """Published locations for each artifact role."""
+        prefix = self.grain_type
+        paths = {
+            'model': [os.path.join(ML_DIR, f'{prefix}_ensemble_model.pkl')],
+            'label_encoder': [os.path.join(ML_DIR, f'{prefix}_label_encoder.pkl')],
+            'metadata': [os.path.join(ML_DIR, f'{prefix}_model_metadata.json')],
+            'holdout': [os.path.join(ML_DIR, f'{prefix}_holdout.npy')],
+        }
         # Backward compat: rice also saves as default names
         if self.grain_type == 'rice':
-            joblib.dump(self.ensemble, os.path.join(ML_DIR, 'ensemble_model.pkl'))
-            joblib.dump(self.ensemble, os.path.join(ML_DIR, 'smartbin_model.pkl'))
-            joblib.dump(self.label_encoder, os.path.join(ML_DIR, 'label_encoder.pkl'))
+            paths['model'] += [os.path.join(ML_DIR, 'ensemble_model.pkl'),
+                               os.path.join(ML_DIR, 'smartbin_model.pkl')]
+            paths['label_encoder'].append(os.path.join(ML_DIR, 'label_encoder.pkl'))
+            paths['metadata'].append(os.path.join(ML_DIR, 'model_metadata.json'))
+        return paths
+
+    def publish_cached(self, n_tuning_trials=15, time_budget=None, out_of_core=None):
+        """
+        Publish a previously trained model if the dataset and training
+        configuration are unchanged. Returns the cached metrics on a hit,
+        None on a miss (self.cache_key is then stored by save()).
+        """
+        params = {'trainer': 'GrainEnsembleTrainer', 'grain_type': self.grain_type,
+                  'n_tuning_trials': n_tuning_trials, 'time_budget': time_budget,
+                  'tuning': 'native-shared-folds-stop-slice', 'early_stopping_rounds': EARLY_STOPPING_ROUNDS,
+                  'early_stopping_fraction': EARLY_STOPPING_FRACTION}
+        if out_of_core:
+            params['out_of_core'] = out_of_core
+        self.cache_key = training_cache.compute_key(
+            [self.dataset_path], self.feature_names, self.random_state, params,
+        )
+        cached = training_cache.lookup(self.cache_key)
+        self.cache_info = dict(training_cache.stats(), key=self.cache_key, status='hit' if cached else 'miss')
+        if cached is None:
+            print(f"Training cache miss: {self.cache_key[:12]}")
+            return None
+
+        print(f"Training cache hit: {self.cache_key[:12]} - publishing stored model")
+        paths = self._artifact_paths()
+        training_cache.publish(cached, {'model': paths['model'], 'label_encoder': paths['label_encoder'],
+                                        'holdout': paths['holdout']})
+        with open(cached['metadata']) as f:
+            metadata = json.load(f)
+        metadata['training_cache'] = self.cache_info
+        metadata['published_date'] = datetime.now().isoformat()
+        for path in paths['metadata']:
+            with open(path, 'w') as f:
+                json.dump(metadata, f, indent=2, default=str)
+        self.metrics = metadata['metrics']
+        return self.metrics
+
+    def save(self, best_params_all, budget=None, write_models=True, store_cache=True):
+        """
+        Save ensemble model, label encoder, and metadata. write_models=False
+        only refreshes the metadata (e.g. after a budgeted checkpoint).
+        The artifacts go into the training cache only with store_cache and
+        if no phase was cut short by the time budget.
+        """
+        paths = self._artifact_paths()
+        ensemble_path = paths['model'][0]
+
+        if write_models:
+            with self.phase('dump_model'):
+                for path in paths['model']:
+                    joblib.dump(self.ensemble, path)
+                for path in paths['label_encoder']:
+                    joblib.dump(self.label_encoder, path)
+                if self.holdout_indices is not None:
+                    np.save(paths['holdout'][0], self.holdout_indices.astype(np.int32))
 
         # Count dataset rows
         dataset_rows = 0
@@ -284,6 +663,21 @@ class GrainEnsembleTrainer:
             'training_date': datetime.now().isoformat(),
             'dataset': self.dataset_path,
             'dataset_rows': dataset_rows,
+            # Rows the model was trained on and the test rows among them (row
+            # numbers in the dataset, saved to the holdout file); None out of core
+            'holdout': (dict(self.split, file=os.path.basename(paths['holdout'][0]))
+                        if self.holdout_indices is not None else None),
+            # Rows of new data (enhanced_train.py --incremental) already trained on
+            'incremental': {'rows_consumed': 0},
+            'data_loading': self.load_report,
+            # Serving fills missing readings with these (training-set medians)
+            'feature_defaults': self.feature_stats.defaults(self.feature_names),
+            'feature_stats': self.feature_stats.summary(),
+            # Training-data histograms the drift monitor compares readings with
+            'drift_reference': reference_histograms(self.feature_stats, self.feature_names),
+            'training_cache': self.cache_info,
+            'time_budget': budget.report() if budget else None,
+            'profile': self.profiler.report(),
             'weka_comparison': {
                 'Random Forest (Weka)': {'accuracy': 0.9726, 'f1': 0.973},
                 'J48 (Weka)': {'accuracy': 0.9644, 'f1': 0.964},
@@ -291,41 +685,125 @@ class GrainEnsembleTrainer:
             }
         }
 
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata, f, indent=2, default=str)
-        if self.grain_type == 'rice':
-            with open(os.path.join(ML_DIR, 'model_metadata.json'), 'w') as f:
+        for path in paths['metadata']:
+            with open(path, 'w') as f:
                 json.dump(metadata, f, indent=2, default=str)
 
+        if budget and not budget.complete:
+            print(f"Not caching: cut short by the time budget ({', '.join(budget.truncated)})")
+        elif self.cache_key and store_cache:
+            artifacts = {
+                'model': ensemble_path,
+                'label_encoder': paths['label_encoder'][0],
+                'metadata': paths['metadata'][0],
+            }
+            if self.holdout_indices is not None:
+                artifacts['holdout'] = paths['holdout'][0]
+            training_cache.store(self.cache_key, artifacts)
+
         print(f"Saved ({self.grain_type}): {ensemble_path}")
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Train the GrainHero ensemble for one grain type.')
+    parser.add_argument('grain', nargs='?', default='rice',
+                        help=f"one of {', '.join(SUPPORTED_GRAINS)} (or 'all' with --compare-tuning)")
+    parser.add_argument('--time-budget', type=float, metavar='SECONDS',
+                        help='finish tuning, training and publishing within this wall-clock budget')
+    parser.add_argument('--compare-tuning', action='store_true',
+                        help='time shared-dataset native tuning against the sklearn wrapper path and exit')
+    parser.add_argument('--profile-trace', metavar='PATH',
+                        help='append per-phase wall/CPU/peak-RSS records to this JSONL file '
+                             '(default: $GRAINHERO_PROFILE_TRACE)')
+    parser.add_argument('--profile-dir', metavar='DIR',
+                        help='write cProfile/tracemalloc dumps of the training hot paths here '
+                             '(default: $GRAINHERO_PROFILE_DIR)')
+    parser.add_argument('--out-of-core', action='store_true',
+                        help='stream the dataset from disk instead of loading it into memory')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                        help='CSV rows read per chunk in out-of-core mode')
+    parser.add_argument('--sample-size', type=int, default=DEFAULT_SAMPLE_SIZE,
+                        help='reservoir sample size per class for tuning and the RandomForest (out-of-core)')
+    parser.add_argument('--spill-dir', metavar='DIR',
+                        help='directory for the temporary memory-mapped spill files (out-of-core)')
+    args = parser.parse_args(argv)
+    if args.grain not in SUPPORTED_GRAINS and not (args.compare_tuning and args.grain == 'all'):
+        args.grain = 'rice'
+    return args
+
+
+def compare_tuning(grains, n_trials=15):
+    """Report tuning time saved per grain by the shared-dataset path."""
+    report = {}
+    for grain_type in grains:
+        print(f"\nTuning comparison - {grain_type.upper()}")
+        trainer = GrainEnsembleTrainer(grain_type=grain_type)
+        X_train, X_test, y_train, y_test = trainer.load_data()
+        if X_train is None:
+            continue
+        report[grain_type] = trainer.compare_tuning(X_train, y_train, n_trials)
+    print("\n__TUNING_COMPARISON_JSON__")
+    print(json.dumps(report, indent=2))
+    print("__END_TUNING_COMPARISON__")
+    return report
+
+
 def main():
     """Main entry point -- called by the backend retrain-public endpoint."""
-    grain_type = 'rice'
-    if len(sys.argv) > 1 and sys.argv[1] in SUPPORTED_GRAINS:
-        grain_type = sys.argv[1]
+    args = parse_args()
+    if args.profile_dir:
+        enable_profiling(args.profile_dir)
+    if args.compare_tuning:
+        compare_tuning(SUPPORTED_GRAINS if args.grain == 'all' else [args.grain])
+        return
+    grain_type = args.grain
 
     print("=" * 60)
     print(f"GrainHero Ensemble Training - {grain_type.upper()}")
     print("   XGBoost + Random Forest + LightGBM (Soft Voting)")
     print("=" * 60)
 
-    trainer = GrainEnsembleTrainer(grain_type=grain_type)
-
-    X_train, X_test, y_train, y_test = trainer.load_data()
-    if X_train is None:
-        print("Failed to load data")
-        sys.exit(1)
-
-    metrics, best_params = trainer.train(X_train, X_test, y_train, y_test, n_tuning_trials=15)
-    trainer.save(best_params)
+    budget = TimeBudget(args.time_budget) if args.time_budget else None
+    trainer = GrainEnsembleTrainer(grain_type=grain_type, profile_trace=args.profile_trace)
+
+    out_of_core = {'sample_size': args.sample_size} if args.out_of_core else None
+    metrics = trainer.publish_cached(n_tuning_trials=15, time_budget=args.time_budget,
+                                     out_of_core=out_of_core)
+    if metrics is None:
+        if args.out_of_core:
+            metrics, best_params = trainer.train_out_of_core(
+                n_tuning_trials=15, budget=budget, chunksize=args.chunksize,
+                sample_size=args.sample_size, workdir=args.spill_dir,
+            )
+            if metrics is None:
+                print("Failed to load data")
+                sys.exit(1)
+        else:
+            with trainer.phase('load_data', budget):
+                X_train, X_test, y_train, y_test = trainer.load_data()
+            if X_train is None:
+                print("Failed to load data")
+                sys.exit(1)
+
+            metrics, best_params = trainer.train(X_train, X_test, y_train, y_test,
+                                                 n_tuning_trials=15, budget=budget)
+        with trainer.phase('save', budget):
+            trainer.save(best_params, budget=budget, write_models=not trainer.checkpointed)
+        if budget:
+            print(f"Time budget: {budget.elapsed():.1f}s of {budget.seconds:.0f}s used")
+
+        print("\nPhase profile:")
+        for name, p in trainer.profiler.phases.items():
+            print(f"   {name:22s} wall={p['wall_s']:7.2f}s  cpu={p['cpu_s']:7.2f}s  peak={p['peak_rss_mb']:7.1f}MB")
+        trainer.profiler.write_trace(trainer='GrainEnsembleTrainer', grain_type=grain_type,
+                                     dataset_rows=trainer.load_report['rows'])
 
     print("\n" + "=" * 60)
     print(f"TRAINING COMPLETE - {grain_type.upper()}")
     print("=" * 60)
     for name, m in metrics.items():
-        print(f"   {name:15s}  Acc={m['accuracy']:.4f}  F1={m['f1_score']:.4f}  CV={m['cv_mean']:.4f}")
+        cv = f"{m['cv_mean']:.4f}" if m['cv_mean'] is not None else 'skipped'
+        print(f"   {name:15s}  Acc={m['accuracy']:.4f}  F1={m['f1_score']:.4f}  CV={cv}")
 
     print("\n__METRICS_JSON__")
     output_data = dict(metrics)
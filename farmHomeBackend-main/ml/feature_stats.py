@@ -0,0 +1,216 @@
+"""
+GrainHero Feature Statistics
+============================
+Streaming, mergeable per-feature statistics: row/missing counts, min/max,
+mean/variance (Chan's parallel update) and approximate quantiles from a
+small merging digest (centroids bucketed on an arcsine scale, so the tails
+stay sharp). Statistics of two batches merge into the statistics of their
+union without revisiting rows, which lets the segment store keep them up to
+date on append and lets the loader impute without a separate median pass.
+
+Everything serializes to plain JSON (to_dict/from_dict) for manifests and
+model metadata.
+"""
+import math
+
+import numpy as np
+
+DEFAULT_COMPRESSION = 100
+
+
+def _finite(value, digits=4):
+    """Rounded value, or None for NaN (keeps the JSON valid for Node)."""
+    return None if value is None or math.isnan(value) else round(value, digits)
+
+
+class QuantileSketch:
+    """Mergeable approximate quantiles over at most compression + 1 centroids."""
+
+    def __init__(self, compression=DEFAULT_COMPRESSION, means=None, weights=None):
+        self.compression = compression
+        self.means = np.asarray(means if means is not None else [], dtype=np.float64)
+        self.weights = np.asarray(weights if weights is not None else [], dtype=np.float64)
+
+    @property
+    def total(self):
+        return float(self.weights.sum())
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self._absorb(values, np.ones(len(values)))
+
+    def merge(self, other):
+        self._absorb(other.means, other.weights)
+
+    def _absorb(self, means, weights):
+        if len(means) == 0:
+            return
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        cumulative = np.cumsum(weights)
+        q = (cumulative - weights / 2) / cumulative[-1]
+        buckets = np.floor(self.compression * (np.arcsin(2 * q - 1) / math.pi + 0.5)).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def quantile(self, q, lo=None, hi=None):
+        if len(self.means) == 0:
+            return float('nan')
+        cumulative = np.cumsum(self.weights)
+        positions = (cumulative - self.weights / 2) / cumulative[-1]
+        means = self.means
+        if lo is not None:
+            positions, means = np.r_[0.0, positions], np.r_[lo, means]
+        if hi is not None:
+            positions, means = np.r_[positions, 1.0], np.r_[means, hi]
+        return float(np.interp(q, positions, means))
+
+    def to_list(self):
+        return [[round(float(m), 6), float(w)] for m, w in zip(self.means, self.weights)]
+
+    @classmethod
+    def from_list(cls, centroids, compression=DEFAULT_COMPRESSION):
+        centroids = np.asarray(centroids, dtype=np.float64).reshape(-1, 2)
+        return cls(compression, centroids[:, 0], centroids[:, 1])
+
+
+class ColumnStats:
+    """Count, missing, min/max, mean/M2 and a quantile sketch for one feature."""
+
+    def __init__(self):
+        self.count = 0
+        self.missing = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.sketch = QuantileSketch()
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        present = values[~np.isnan(values)]
+        self.missing += len(values) - len(present)
+        if len(present) == 0:
+            return
+        mean = float(present.mean())
+        batch = ColumnStats()
+        batch.count = len(present)
+        batch.min, batch.max = float(present.min()), float(present.max())
+        batch.mean = mean
+        batch.m2 = float(((present - mean) ** 2).sum())
+        batch.sketch.update(present)
+        self._combine(batch)
+
+    def merge(self, other):
+        self.missing += other.missing
+        self._combine(other)
+
+    def _combine(self, other):
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.min, self.max = other.min, other.max
+        else:
+            self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.sketch.merge(other.sketch)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def quantile(self, q):
+        return self.sketch.quantile(q, self.min, self.max)
+
+    def to_dict(self):
+        return {
+            'count': self.count, 'missing': self.missing, 'min': self.min, 'max': self.max,
+            'mean': self.mean, 'm2': self.m2, 'sketch': self.sketch.to_list(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.count, stats.missing = data['count'], data['missing']
+        stats.min, stats.max = data['min'], data['max']
+        stats.mean, stats.m2 = data['mean'], data['m2']
+        stats.sketch = QuantileSketch.from_list(data['sketch'])
+        return stats
+
+
+class FeatureStats:
+    """ColumnStats per feature plus the number of rows seen."""
+
+    def __init__(self, columns=()):
+        self.rows = 0
+        self.columns = {col: ColumnStats() for col in columns}
+
+    def update_block(self, X, columns):
+        """Add a 2-D array whose columns are `columns`."""
+        X = np.asarray(X)
+        self.rows += len(X)
+        for j, col in enumerate(columns):
+            self.columns.setdefault(col, ColumnStats()).update(X[:, j])
+
+    def update_frame(self, df, columns=None):
+        """Add the numeric `columns` of a DataFrame (default: all numeric columns)."""
+        import pandas as pd
+        if columns is None:
+            columns = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
+        self.rows += len(df)
+        for col in columns:
+            values = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            self.columns.setdefault(col, ColumnStats()).update(values)
+
+    def merge(self, other):
+        self.rows += other.rows
+        for col, stats in other.columns.items():
+            self.columns.setdefault(col, ColumnStats()).merge(stats)
+        return self
+
+    def medians(self):
+        """Approximate median per feature (NaN for features with no values)."""
+        return {col: stats.quantile(0.5) for col, stats in self.columns.items()}
+
+    def defaults(self, features=None):
+        """Finite medians per feature: the missing-value fill for training and serving."""
+        medians = self.medians()
+        return {col: round(medians[col], 6) for col in (features or medians)
+                if col in medians and not math.isnan(medians[col])}
+
+    def summary(self, quantiles=(0.25, 0.5, 0.75)):
+        """Readable per-feature summary (no sketches)."""
+        return {
+            col: {
+                'count': s.count, 'missing': s.missing, 'min': s.min, 'max': s.max,
+                'mean': round(s.mean, 4), 'std': round(s.std, 4),
+                **{f'p{int(q * 100)}': _finite(s.quantile(q)) for q in quantiles},
+            }
+            for col, s in self.columns.items()
+        }
+
+    def to_dict(self):
+        return {'rows': self.rows, 'columns': {col: s.to_dict() for col, s in self.columns.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        if data:
+            stats.rows = data['rows']
+            stats.columns = {col: ColumnStats.from_dict(s) for col, s in data['columns'].items()}
+        return stats
+
+    @classmethod
+    def merged(cls, items):
+        """Merge FeatureStats (or their dicts) into a new instance."""
+        total = cls()
+        for item in items:
+            total.merge(item if isinstance(item, FeatureStats) else cls.from_dict(item))
+        return total
@@ -0,0 +1,90 @@
+"""
+GrainHero File Locks
+====================
+Advisory inter-process locks for the ML data files.
+
+The Node routes start a separate `python -c "from data_manager import ..."`
+process per request, so in-process locks are not enough: every
+read-modify-write of a shared file takes a lock on a sibling `<name>.lock`
+file. flock() is used on POSIX; on Windows msvcrt.locking() gives exclusive
+locks only (shared requests are taken exclusively).
+
+    with file_lock(manifest_path + '.lock'):
+        manifest = load(); ...; atomic_write_json(manifest_path, manifest)
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class LockTimeout(TimeoutError):
+    """The lock could not be acquired in time."""
+
+
+def _try_lock(f, shared):
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path, shared=False, timeout=60.0, blocking=True):
+    """
+    Hold a lock on `path` (created if missing) for the duration of the block.
+
+    With blocking=False the block receives False instead of waiting when the
+    lock is held elsewhere; otherwise LockTimeout is raised after `timeout`
+    seconds (None waits forever).
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a+') as f:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = 0.001
+        while not _try_lock(f, shared):
+            if not blocking:
+                yield False
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                raise LockTimeout(f"Timed out waiting for {path}")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        try:
+            yield True
+        finally:
+            _unlock(f)
+
+
+def atomic_write_json(path, data, **kwargs):
+    """Write JSON to a process-unique temp file and rename it over `path`."""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, **kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -8,12 +8,30 @@ Spoilage thresholds are from:
   - FAO Guidelines for Grain Storage (2011)
   - IRRI Rice Post-Harvest Guidelines
   - ASABE Standards for Grain Drying & Storage
+
+Columns are drawn whole and the dew point and danger score are computed
+with array operations. Each grain is split into shards of SHARD_ROWS rows,
+each with its own random stream (SeedSequence keyed by seed, grain id and
+shard index), so shards are generated in parallel on a process pool and the
+output does not depend on the number of workers:
+  python generate_per_grain.py [--rows 10000000] [--grains rice wheat] [--format csv|npy] [--workers 4]
+  python generate_per_grain.py --compare     # vs the original row-by-row generator
 """
+import argparse
+import json
+import os, math
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import pandas as pd
-import os, math
 
 ROWS = 10000
+SHARD_ROWS = 1_000_000
+BASE_SEED = 42
+LABELS = ['Safe', 'Risky', 'Spoiled']
+COLUMNS = ['Temperature', 'Humidity', 'Storage_Days', 'Spoilage_Label', 'Grain_Type',
+           'Airflow', 'Dew_Point', 'Ambient_Light', 'Pest_Presence', 'Grain_Moisture', 'Rainfall']
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # --- Grain-specific parameters from literature ---
@@ -108,6 +126,39 @@ def calc_dew_point(temp, rh):
     return round((b * alpha) / (a - alpha), 2)
 
 
+def dew_point(temp, rh):
+    """Magnus formula over arrays"""
+    a, b = 17.27, 237.7
+    alpha = (a * temp) / (b + temp) + np.log(np.maximum(rh / 100, 1e-9))
+    return np.round((b * alpha) / (a - alpha), 2)
+
+
+def _tiered(values, thresholds, scores):
+    """Score of the highest threshold exceeded (thresholds ascending), else 0."""
+    conditions = [values > t for t in reversed(thresholds)]
+    return np.select(conditions, list(reversed(scores)), 0.0)
+
+
+def danger_score(cols, g):
+    """Vectorized danger score of classify() for a dict/DataFrame of columns."""
+    sms = g['storage_max_safe']
+    return (
+        _tiered(cols['Temperature'], (g['temp_safe'], g['temp_risky'], g['temp_spoiled']), (0.5, 1.5, 2.5))
+        + _tiered(cols['Humidity'], (g['hum_safe'], g['hum_risky'], g['hum_spoiled']), (0.5, 1.5, 2.5))
+        + _tiered(cols['Grain_Moisture'],
+                  (g['moisture_safe'], g['moisture_risky'], g['moisture_spoiled']), (0.5, 1.5, 3.0))
+        + _tiered(cols['Storage_Days'], (sms * 0.5, sms, sms * 2), (0.3, 1.0, 2.0))
+        + np.where(cols['Pest_Presence'] == 1, 1.5, 0.0)
+        + np.where(cols['Airflow'] < 0.3, 0.5, 0.0)
+        + np.where(cols['Dew_Point'] > 18, 0.5, 0.0)
+    )
+
+
+def classify_codes(danger):
+    """Danger score -> label codes into LABELS (0 Safe, 1 Risky, 2 Spoiled)."""
+    return (danger >= 2.0).astype(np.int8) + (danger >= 5.0)
+
+
 def classify(row, g):
     """
     Multi-factor spoilage classification using FAO/IRRI/ASABE thresholds.
@@ -168,10 +219,175 @@ def classify(row, g):
         return 'Safe'
 
 
-def generate_grain_dataset(grain_name, params, n=ROWS):
+def generate_chunk(rng, params, n):
+    """
+    n rows for one grain, drawn column by column from the Generator `rng`
+    with the same distributions and rounding as the original row-by-row
+    generator.
+    Spoilage_Label is a Categorical over LABELS.
+    """
+    tmin, tmax = params['temp_range']
+    hmin, hmax = params['hum_range']
+
+    cols = {}
+    cols['Temperature'] = np.round(rng.uniform(tmin, tmax, n), 2)
+    cols['Humidity'] = np.round(rng.uniform(hmin, hmax, n), 2)
+    cols['Storage_Days'] = rng.integers(1, params['storage_max'] + 1, n)
+    cols['Airflow'] = np.round(rng.uniform(0.05, 1.5, n), 3)
+    cols['Dew_Point'] = dew_point(cols['Temperature'], cols['Humidity'])
+    cols['Ambient_Light'] = np.round(rng.uniform(20, 200, n), 1)
+    cols['Pest_Presence'] = rng.choice(2, size=n, p=[0.75, 0.25])
+    cols['Grain_Moisture'] = np.round(rng.uniform(params['moisture_safe'] - 4,
+                                                  params['moisture_spoiled'] + 4, n), 2)
+    cols['Rainfall'] = np.round(rng.exponential(2, n), 2)
+    cols['Grain_Type'] = np.full(n, params['grain_type_id'])
+    codes = classify_codes(danger_score(cols, params))
+    cols['Spoilage_Label'] = pd.Categorical.from_codes(codes, categories=LABELS)
+    return pd.DataFrame({col: cols[col] for col in COLUMNS})
+
+
+def shard_rng(params, shard, seed=BASE_SEED):
+    """
+    Independent Generator for one shard of one grain. The stream depends only
+    on (seed, grain id, shard index), never on which worker draws it.
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(params['grain_type_id'], shard)))
+
+
+def shard_bounds(n, shard_rows=SHARD_ROWS):
+    """(shard index, rows) for every shard of an n-row dataset."""
+    return [(shard, min(shard_rows, n - start)) for shard, start in enumerate(range(0, n, shard_rows))]
+
+
+def iter_grain_chunks(params, n=ROWS, shard_rows=SHARD_ROWS, seed=BASE_SEED):
+    """Yield the grain's dataset shard by shard as DataFrames."""
+    for shard, rows in shard_bounds(n, shard_rows):
+        yield generate_chunk(shard_rng(params, shard, seed), params, rows)
+
+
+def generate_grain_dataset(grain_name, params, n=ROWS, shard_rows=SHARD_ROWS, seed=BASE_SEED):
     """Generate n rows of synthetic data for one grain type."""
+    return pd.concat(list(iter_grain_chunks(params, n, shard_rows, seed)), ignore_index=True)
+
+
+def _rows_tag(n):
+    for size, suffix in ((1_000_000, 'm'), (1_000, 'k')):
+        if n >= size and n % size == 0:
+            return f'{n // size}{suffix}'
+    return str(n)
+
+
+def _label_counts(df):
+    return np.bincount(df['Spoilage_Label'].cat.codes, minlength=len(LABELS))
+
+
+def _write_csv(path, frames):
+    counts = np.zeros(len(LABELS), dtype=np.int64)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', newline='') as f:
+        for i, df in enumerate(frames):
+            counts += _label_counts(df)
+            df.to_csv(f, index=False, header=(i == 0))
+    os.replace(tmp_path, path)
+    return counts
+
+
+def _write_npy(directory, frames, n):
+    """One .npy per column; labels as int8 Spoilage_Class codes."""
+    counts = np.zeros(len(LABELS), dtype=np.int64)
+    os.makedirs(directory, exist_ok=True)
+    files = {}
+    try:
+        for df in frames:
+            codes = df['Spoilage_Label'].cat.codes.to_numpy(dtype=np.int8)
+            counts += np.bincount(codes, minlength=len(LABELS))
+            columns = {('Spoilage_Class' if col == 'Spoilage_Label' else col):
+                       (codes if col == 'Spoilage_Label' else df[col].to_numpy()) for col in COLUMNS}
+            for col, values in columns.items():
+                if col not in files:
+                    # .npy header for the full length, then raw chunks appended
+                    files[col] = open(os.path.join(directory, f'{col}.npy'), 'wb')
+                    header = np.lib.format.header_data_from_array_1_0(values)
+                    header['shape'] = (n,)
+                    np.lib.format.write_array_header_1_0(files[col], header)
+                files[col].write(np.ascontiguousarray(values).tobytes())
+    finally:
+        for f in files.values():
+            f.close()
+    with open(os.path.join(directory, 'columns.json'), 'w') as f:
+        json.dump({'rows': n, 'columns': list(files), 'labels': LABELS}, f, indent=2)
+    return counts
+
+
+def _write_shard(task):
+    """Pool worker: generate one shard and write it to `path`."""
+    grain_name, shard, rows, path, fmt, seed = task
+    params = GRAINS[grain_name]
+    frames = [generate_chunk(shard_rng(params, shard, seed), params, rows)]
+    counts = _write_csv(path, frames) if fmt == 'csv' else _write_npy(path, frames, rows)
+    return grain_name, shard, counts
+
+
+def write_datasets(grain_names, n=ROWS, out_dir=SCRIPT_DIR, fmt='csv', shard_rows=SHARD_ROWS,
+                   workers=1, seed=BASE_SEED):
+    """
+    Generate every shard of every grain across a process pool; returns
+    {grain: (path, counts per label)}.
+
+    A dataset that fits in one shard is written as <grain>_spoilage_<rows>.csv
+    (npy: a directory of column files). Larger ones become a directory with
+    part-NNNNN.csv (npy: part-NNNNN/) per shard plus manifest.json. Output is
+    byte-identical for any worker count.
+    """
+    tasks, layout = [], {}
+    for grain_name in grain_names:
+        base = os.path.join(out_dir, f"{grain_name}_spoilage_{_rows_tag(n)}")
+        shards = shard_bounds(n, shard_rows)
+        if len(shards) == 1:
+            paths = [base + '.csv' if fmt == 'csv' else base]
+        else:
+            os.makedirs(base, exist_ok=True)
+            paths = [os.path.join(base, f'part-{shard:05d}' + ('.csv' if fmt == 'csv' else ''))
+                     for shard, _ in shards]
+        layout[grain_name] = (base, shards, paths)
+        tasks += [(grain_name, shard, rows, path, fmt, seed) for (shard, rows), path in zip(shards, paths)]
+
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_write_shard, tasks))
+    else:
+        results = [_write_shard(task) for task in tasks]
+
+    shard_counts = {(grain, shard): counts for grain, shard, counts in results}
+    written = {}
+    for grain_name, (base, shards, paths) in layout.items():
+        counts = sum(shard_counts[(grain_name, shard)] for shard, _ in shards)
+        if len(shards) == 1:
+            written[grain_name] = (paths[0], dict(zip(LABELS, counts.tolist())))
+            continue
+        manifest = {
+            'grain': grain_name, 'rows': n, 'shard_rows': shard_rows, 'seed': seed, 'format': fmt,
+            'shards': [{'path': os.path.basename(path), 'rows': rows,
+                        'counts': dict(zip(LABELS, shard_counts[(grain_name, shard)].tolist()))}
+                       for (shard, rows), path in zip(shards, paths)],
+            'counts': dict(zip(LABELS, counts.tolist())),
+        }
+        with open(os.path.join(base, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        written[grain_name] = (base, manifest['counts'])
+    return written
+
+
+def write_grain_dataset(grain_name, params, n=ROWS, out_dir=SCRIPT_DIR, fmt='csv', shard_rows=SHARD_ROWS,
+                        workers=1):
+    """Stream one grain's dataset to disk; returns (path, counts per label)."""
+    return write_datasets([grain_name], n, out_dir, fmt, shard_rows, workers)[grain_name]
+
+
+def _legacy_generate(grain_name, params, n=ROWS):
+    """The original row-by-row generator, kept for comparison."""
     np.random.seed(42 + params['grain_type_id'])
-    
+
     tmin, tmax = params['temp_range']
     hmin, hmax = params['hum_range']
 
@@ -206,34 +422,84 @@ def generate_grain_dataset(grain_name, params, n=ROWS):
         row['Spoilage_Label'] = classify(row, params)
         rows.append(row)
 
-    df = pd.DataFrame(rows)
-    return df
+    return pd.DataFrame(rows)
+
+
+def compare_generators(grain_name='rice', n=ROWS):
+    """
+    Time both generators and check the vectorized output against the
+    original: two-sample KS test per column, label shares, and the
+    vectorized classifier applied to the original rows.
+    """
+    from scipy.stats import ks_2samp
 
+    params = GRAINS[grain_name]
+    start = time.perf_counter()
+    legacy = _legacy_generate(grain_name, params, n)
+    legacy_s = time.perf_counter() - start
+    start = time.perf_counter()
+    vectorized = generate_grain_dataset(grain_name, params, n)
+    vectorized_s = time.perf_counter() - start
 
-def main():
-    for grain_name, params in GRAINS.items():
+    print(f"Generator comparison ({grain_name}, {n:,} rows): row loop {legacy_s:.2f}s, "
+          f"vectorized {vectorized_s:.3f}s ({legacy_s / vectorized_s:.0f}x)")
+    for col in COLUMNS:
+        if col in ('Spoilage_Label', 'Grain_Type'):
+            continue
+        result = ks_2samp(legacy[col], vectorized[col])
+        print(f"   {col:15s} KS={result.statistic:.4f}  p={result.pvalue:.3f}")
+    for label in LABELS:
+        print(f"   {label:8s} {(legacy['Spoilage_Label'] == label).mean() * 100:5.1f}%  vs  "
+              f"{(vectorized['Spoilage_Label'] == label).mean() * 100:5.1f}%")
+    codes = classify_codes(danger_score(legacy, params))
+    agree = (np.asarray(LABELS)[codes] == legacy['Spoilage_Label'].to_numpy()).mean()
+    print(f"   Vectorized classify() agrees on {agree * 100:.2f}% of the original rows")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Generate synthetic per-grain spoilage datasets.')
+    parser.add_argument('--rows', type=int, default=ROWS, help='rows per grain')
+    parser.add_argument('--grains', nargs='+', choices=list(GRAINS), default=list(GRAINS))
+    parser.add_argument('--out-dir', default=SCRIPT_DIR)
+    parser.add_argument('--format', choices=['csv', 'npy'], default='csv')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='generator processes (output is identical for any count)')
+    parser.add_argument('--shard-rows', type=int, default=SHARD_ROWS, help='rows per shard')
+    parser.add_argument('--seed', type=int, default=BASE_SEED)
+    parser.add_argument('--compare', action='store_true',
+                        help='compare against the original row-by-row generator and exit')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        compare_generators(args.grains[0])
+        return
+
+    shards = len(shard_bounds(args.rows, args.shard_rows))
+    print(f"Generating {args.rows:,} rows for: {', '.join(args.grains)} "
+          f"({shards} shard(s) each, {args.workers} worker(s))")
+    start = time.perf_counter()
+    written = write_datasets(args.grains, args.rows, args.out_dir, args.format, args.shard_rows,
+                             args.workers, args.seed)
+    elapsed = time.perf_counter() - start
+
+    for grain_name, (filepath, dist) in written.items():
         print(f"\n{'='*60}")
-        print(f"Generating {ROWS:,} rows for: {grain_name.upper()}")
+        print(f"{grain_name.upper()}")
         print(f"{'='*60}")
 
-        df = generate_grain_dataset(grain_name, params)
-
         # Print class distribution
-        dist = df['Spoilage_Label'].value_counts()
-        total = len(df)
-        print(f"  Safe:    {dist.get('Safe', 0):>5}  ({dist.get('Safe', 0)/total*100:.1f}%)")
-        print(f"  Risky:   {dist.get('Risky', 0):>5}  ({dist.get('Risky', 0)/total*100:.1f}%)")
-        print(f"  Spoiled: {dist.get('Spoiled', 0):>5}  ({dist.get('Spoiled', 0)/total*100:.1f}%)")
-
-        # Save to /ml folder
-        filename = f"{grain_name}_spoilage_10k.csv"
-        filepath = os.path.join(SCRIPT_DIR, filename)
-        df.to_csv(filepath, index=False)
+        total = args.rows
+        print(f"  Safe:    {dist['Safe']:>5}  ({dist['Safe']/total*100:.1f}%)")
+        print(f"  Risky:   {dist['Risky']:>5}  ({dist['Risky']/total*100:.1f}%)")
+        print(f"  Spoiled: {dist['Spoiled']:>5}  ({dist['Spoiled']/total*100:.1f}%)")
         print(f"  ✅ Saved: {filepath}")
-        print(f"  Columns: {list(df.columns)}")
+        print(f"  Columns: {COLUMNS}")
 
     print(f"\n{'='*60}")
-    print("ALL DONE! Files created in: farmHomeBackend-main/ml/")
+    print(f"ALL DONE in {elapsed:.1f}s! Files created in: {args.out_dir}")
     print(f"{'='*60}")
 
 
@@ -0,0 +1,271 @@
+"""
+GrainHero Inference Benchmark
+=============================
+Latency and throughput of the prediction paths in smartbin_predict.py, per
+grain and per model mode:
+
+  - single:    predict_single() end to end, one reading per call, exactly
+               as the Node route runs it (includes loading the model)
+  - batch_N:   predict_batch() on N readings with the model already loaded,
+               for N in --batch-sizes (default 1 .. 10,000)
+
+Model modes are 'ensemble' ({grain}_ensemble_model.pkl, or the shared
+ensemble_model.pkl it falls back to) and 'legacy' (smartbin_model.pkl);
+modes whose files are missing are skipped. Readings are drawn with a fixed
+seed from {grain}_spoilage_10k.csv, or from the silo simulator's standard
+workload with --workload silo.
+
+Each case reports p50/p95/p99/mean latency in ms and rows/sec. Results are
+written as JSON; --baseline compares against a stored run and exits with
+status 1 when a case's p95 latency grows, or its throughput drops, by more
+than --threshold (default 20%). --save-baseline stores the current run.
+
+  python inference_benchmark.py [--grains rice wheat] [--modes ensemble legacy]
+                                [--baseline benchmark_results/inference_baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import warnings
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from smartbin_predict import ML_DIR, FEATURE_NAMES, load_model, predict_batch, predict_single
+from drift_monitor import drift_monitor
+
+GRAINS = ['rice', 'wheat', 'maize', 'sorghum', 'barley']
+MODES = ['ensemble', 'legacy']
+BATCH_SIZES = [1, 10, 100, 1000, 10000]
+RESULTS_DIR = os.path.join(ML_DIR, 'benchmark_results')
+DEFAULT_OUTPUT = os.path.join(RESULTS_DIR, 'inference.json')
+DEFAULT_SEED = 42
+
+# Models fitted on DataFrames warn on every array predict; keep the timings clean
+warnings.filterwarnings('ignore', message='X does not have valid feature names')
+# Benchmark traffic is still counted for drift (it is part of the timed path) but
+# not added to the persisted counts in drift_state/
+drift_monitor.state_dir = None
+
+
+def load_readings(grain, workload='csv', rows=10000, seed=DEFAULT_SEED):
+    """Readings (list of feature dicts) for `grain`, or None if there is no source."""
+    if workload == 'silo':
+        from generate_per_grain import GRAINS as GRAIN_PARAMS
+        from silo_simulator import standard_workload
+        df = standard_workload(max(rows * len(GRAIN_PARAMS), 100_000), seed=seed)
+        df = df[df['Grain_Type'] == GRAIN_PARAMS[grain]['grain_type_id']]
+    else:
+        path = os.path.join(ML_DIR, f'{grain}_spoilage_10k.csv')
+        if not os.path.exists(path):
+            return None
+        df = pd.read_csv(path, usecols=lambda c: c in FEATURE_NAMES)
+    if df.empty:
+        return None
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(df), size=rows, replace=len(df) < rows)
+    return df[FEATURE_NAMES].iloc[picks].to_dict('records')
+
+
+def model_source(grain, mode):
+    """The model file a mode would load for `grain`, or None if it is missing."""
+    if mode == 'legacy':
+        candidates = ['smartbin_model.pkl']
+    else:
+        candidates = [f'{grain}_ensemble_model.pkl', 'ensemble_model.pkl']
+    for name in candidates:
+        if os.path.exists(os.path.join(ML_DIR, name)):
+            return name
+    return None
+
+
+def summarize(latencies, rows_per_call):
+    """Percentiles (ms) and throughput for a list of per-call latencies (s)."""
+    latencies = np.asarray(latencies)
+    return {
+        'calls': len(latencies),
+        'rows': len(latencies) * rows_per_call,
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 3),
+        'p95_ms': round(float(np.percentile(latencies, 95)) * 1000, 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 3),
+        'mean_ms': round(float(latencies.mean()) * 1000, 3),
+        'rows_per_sec': round(len(latencies) * rows_per_call / float(latencies.sum()), 1),
+    }
+
+
+def _time_calls(fn, args_iter, warmup):
+    for args in args_iter[:warmup]:
+        fn(*args)
+    latencies = []
+    for args in args_iter:
+        start = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_single(readings, grain, calls, warmup=3):
+    """predict_single() per reading, model load included."""
+    args = [(readings[i % len(readings)], grain) for i in range(calls)]
+    return summarize(_time_calls(predict_single, args, warmup), 1)
+
+
+def bench_batch(readings, loaded, batch_size, min_rows, min_calls=5, warmup=2):
+    """predict_batch() on a preloaded model, repeated until min_rows rows / min_calls calls."""
+    calls = max(min_calls, -(-min_rows // batch_size))
+    batches = []
+    for i in range(calls):
+        start = (i * batch_size) % len(readings)
+        batch = readings[start:start + batch_size]
+        if len(batch) < batch_size:
+            batch = batch + readings[:batch_size - len(batch)]
+        batches.append((batch,))
+    return summarize(_time_calls(lambda b: predict_batch(b, loaded=loaded), batches, warmup), batch_size)
+
+
+def run(grains, modes, batch_sizes, workload='csv', single_calls=200, min_rows=20000, seed=DEFAULT_SEED):
+    results, skipped = {}, []
+    for grain in grains:
+        readings = load_readings(grain, workload, max(batch_sizes), seed)
+        if readings is None:
+            skipped.append(f'{grain}: no {workload} readings')
+            continue
+        for mode in modes:
+            source = model_source(grain, mode)
+            if source is None:
+                skipped.append(f'{grain}/{mode}: no model file')
+                continue
+            loaded = load_model(grain, legacy=(mode == 'legacy'))
+            print(f"{grain}/{mode} ({source})")
+            cases = {}
+            # predict_single() only takes the legacy path when no ensemble exists
+            if mode == 'ensemble' or model_source(grain, 'ensemble') is None:
+                cases['single'] = bench_single(readings, grain, single_calls)
+            for size in batch_sizes:
+                cases[f'batch_{size}'] = bench_batch(readings, loaded, size, min_rows)
+            for case, r in cases.items():
+                results[f'{grain}/{mode}/{case}'] = dict(r, model=source)
+                print(f"   {case:12s} p50={r['p50_ms']:9.3f}ms  p95={r['p95_ms']:9.3f}ms  "
+                      f"p99={r['p99_ms']:9.3f}ms  {r['rows_per_sec']:12,.0f} rows/s")
+    return results, skipped
+
+
+def environment():
+    import sklearn
+    env = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+    }
+    for name in ('xgboost', 'lightgbm'):
+        try:
+            env[name] = __import__(name).__version__
+        except ImportError:
+            pass
+    return env
+
+
+def compare(results, baseline, threshold=0.2):
+    """Cases whose p95 latency or rows/sec regressed by more than `threshold`."""
+    regressions = []
+    for key, current in results.items():
+        before = baseline.get('results', {}).get(key)
+        if before is None:
+            continue
+        p95_change = current['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0.0
+        rate_change = current['rows_per_sec'] / before['rows_per_sec'] - 1 if before['rows_per_sec'] else 0.0
+        if p95_change > threshold or rate_change < -threshold:
+            regressions.append({
+                'case': key,
+                'p95_ms': [before['p95_ms'], current['p95_ms']],
+                'rows_per_sec': [before['rows_per_sec'], current['rows_per_sec']],
+                'p95_change': round(p95_change, 3),
+                'rows_per_sec_change': round(rate_change, 3),
+            })
+    return regressions
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark GrainHero prediction latency and throughput.')
+    parser.add_argument('--grains', nargs='+', default=GRAINS, choices=GRAINS)
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=BATCH_SIZES)
+    parser.add_argument('--workload', choices=['csv', 'silo'], default='csv',
+                        help="readings from {grain}_spoilage_10k.csv or the silo simulator")
+    parser.add_argument('--single-calls', type=int, default=200,
+                        help='predict_single() calls per grain')
+    parser.add_argument('--min-rows', type=int, default=20000,
+                        help='rows predicted per batch size (at least 5 calls each)')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='where to write the results JSON')
+    parser.add_argument('--baseline', metavar='PATH', help='compare against this results JSON')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='also write the results to --baseline (default benchmark_results/inference_baseline.json)')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative p95/throughput change counted as a regression')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results, skipped = run(args.grains, args.modes, args.batch_sizes, args.workload,
+                           args.single_calls, args.min_rows, args.seed)
+    for note in skipped:
+        print(f"   skipped {note}")
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'config': {
+            'grains': args.grains, 'modes': args.modes, 'batch_sizes': args.batch_sizes,
+            'workload': args.workload, 'single_calls': args.single_calls,
+            'min_rows': args.min_rows, 'seed': args.seed,
+        },
+        'environment': environment(),
+        'results': results,
+        'skipped': skipped,
+    }
+
+    status = 0
+    if args.baseline and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        report['baseline'] = {'path': args.baseline, 'threshold': args.threshold,
+                              'timestamp': baseline.get('timestamp'), 'regressions': regressions}
+        print(f"\nCompared with {args.baseline} ({baseline.get('timestamp')}):")
+        changed = [k for k in ('workload', 'seed', 'min_rows')
+                   if baseline.get('config', {}).get(k) != report['config'][k]]
+        if changed:
+            print(f"   warning: baseline was run with different {', '.join(changed)}")
+        for r in regressions:
+            print(f"   REGRESSION {r['case']}: p95 {r['p95_ms'][0]} -> {r['p95_ms'][1]}ms, "
+                  f"{r['rows_per_sec'][0]:,.0f} -> {r['rows_per_sec'][1]:,.0f} rows/s")
+        if not regressions:
+            print(f"   no regressions beyond {args.threshold:.0%}")
+        status = 1 if regressions else 0
+
+    _write_json(args.output, report)
+    print(f"\nResults: {args.output}")
+    if args.save_baseline:
+        path = args.baseline or os.path.join(RESULTS_DIR, 'inference_baseline.json')
+        _write_json(path, report)
+        print(f"Baseline: {path}")
+    if not results:
+        print("No models found - train first (ensemble_train.py / enhanced_train.py)")
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
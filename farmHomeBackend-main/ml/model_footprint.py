@@ -0,0 +1,64 @@
+"""
+GrainHero Model Footprint
+=========================
+Approximate in-memory size of fitted spoilage models, shared by
+smartbin_predict.py (--memory) and the ML service's /memory endpoint
+(SmartBin-RiceSpoilage main.py).
+
+Only the learned structures are measured: the raw XGBoost booster (UBJSON),
+sklearn tree node/value arrays, the LightGBM model string, or the pickled
+size for anything else. Ensembles are broken down per member.
+"""
+import importlib
+import pickle
+
+MODEL_LIBRARIES = ('sklearn.ensemble', 'xgboost', 'lightgbm')
+
+
+def import_model_libraries():
+    """
+    Import the installed model libraries (skipping missing ones) so their
+    own footprint is not charged to the first model loaded.
+    """
+    loaded = []
+    for name in MODEL_LIBRARIES:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except ImportError:
+            pass
+    return loaded
+
+
+def estimator_memory(estimator):
+    """Size report for a fitted model: type, bytes, structure and tree counts."""
+    members = getattr(estimator, 'named_estimators_', None)
+    if members:
+        parts = {name: estimator_memory(est) for name, est in members.items()}
+        return {
+            'type': type(estimator).__name__,
+            'bytes': sum(p['bytes'] for p in parts.values()),
+            'estimators': parts,
+        }
+
+    kind = type(estimator).__name__
+    if hasattr(estimator, 'get_booster'):
+        booster = estimator.get_booster()
+        rounds = booster.num_boosted_rounds()
+        # Multiclass boosters grow one tree per class per round, binary ones a single tree
+        n_classes = getattr(estimator, 'n_classes_', 1) or 1
+        return {'type': kind, 'bytes': len(booster.save_raw('ubj')), 'structure': 'booster',
+                'boosted_rounds': rounds, 'trees': rounds * (n_classes if n_classes > 2 else 1)}
+    if hasattr(estimator, 'booster_'):
+        return {'type': kind, 'bytes': len(estimator.booster_.model_to_string().encode()),
+                'structure': 'model_string', 'trees': estimator.booster_.num_trees()}
+    trees = getattr(estimator, 'estimators_', None)
+    if trees is not None and all(hasattr(t, 'tree_') for t in trees):
+        nbytes = nodes = 0
+        for tree in trees:
+            state = tree.tree_.__getstate__()
+            nbytes += state['nodes'].nbytes + state['values'].nbytes
+            nodes += tree.tree_.node_count
+        return {'type': kind, 'bytes': int(nbytes), 'structure': 'node_arrays',
+                'trees': len(trees), 'nodes': int(nodes)}
+    return {'type': kind, 'bytes': len(pickle.dumps(estimator)), 'structure': 'pickle'}
@@ -1,110 +1,269 @@
+"""
+GrainHero Model Performance Tracker
+===================================
+Training-session history in an append-only SQLite store
+(model_performance.db, stdlib sqlite3):
+
+  sessions    one row per retrain, never rewritten; indexed by
+              (grain, timestamp) and timestamp for range queries
+  aggregates  one small row per grain (plus '*' for all grains) holding
+              running aggregates: first/latest metrics, best accuracy/F1,
+              exponential and windowed moving averages, the interval
+              between retrains and training data growth
+
+Recording a session inserts its row and folds it into the aggregates in the
+same transaction (BEGIN IMMEDIATE, so concurrent Node-spawned processes
+serialize), which keeps summaries, insights and recommendations O(1) however
+long the history grows. An existing model_performance.json is imported once
+on first use.
+"""
 import json
 import os
-from datetime import datetime, timedelta
-import pandas as pd
-import numpy as np
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
 from typing import Dict, List, Optional
 
+ALL_GRAINS = '*'
+RECENT_WINDOW = 10     # sessions kept for trends and the windowed moving average
+EMA_ALPHA = 0.3        # weight of the newest session in the exponential average
+TRACKED_METRICS = ['accuracy', 'precision', 'recall', 'f1_score', 'cv_mean']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    grain TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    accuracy REAL,
+    f1_score REAL,
+    training_data_size INTEGER,
+    session TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_grain_time ON sessions (grain, timestamp);
+CREATE INDEX IF NOT EXISTS sessions_time ON sessions (timestamp);
+CREATE TABLE IF NOT EXISTS aggregates (grain TEXT PRIMARY KEY, state TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def _new_state():
+    return {
+        'count': 0, 'first_timestamp': None, 'last_timestamp': None,
+        'first_metrics': None, 'last_metrics': None,
+        'first_data_size': None, 'last_data_size': None,
+        'best_accuracy': None, 'best_f1': None,
+        'ema': {}, 'recent': [],
+    }
+
+
+def _fold(state, session):
+    """Add one session to a grain's running aggregates (constant work)."""
+    metrics, timestamp = session['metrics'], session['timestamp']
+    if state['count'] == 0:
+        state['first_timestamp'] = timestamp
+        state['first_metrics'] = metrics
+        state['first_data_size'] = session['training_data_size']
+    state['count'] += 1
+    state['last_timestamp'] = timestamp
+    state['last_metrics'] = metrics
+    state['last_data_size'] = session['training_data_size']
+
+    for key, metric in (('best_accuracy', 'accuracy'), ('best_f1', 'f1_score')):
+        value = metrics.get(metric)
+        if value is not None and (state[key] is None or value > state[key]['value']):
+            state[key] = {'value': value, 'timestamp': timestamp}
+    for metric in ('accuracy', 'f1_score'):
+        value = metrics.get(metric)
+        if value is not None:
+            previous = state['ema'].get(metric)
+            state['ema'][metric] = value if previous is None else EMA_ALPHA * value + (1 - EMA_ALPHA) * previous
+
+    state['recent'].append({'timestamp': timestamp, 'accuracy': metrics.get('accuracy'),
+                            'f1_score': metrics.get('f1_score')})
+    del state['recent'][:-RECENT_WINDOW]
+    return state
+
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if values else None
+
+
 class ModelPerformanceTracker:
-    def __init__(self, performance_file='model_performance.json'):
+    def __init__(self, performance_file='model_performance.json', db_path=None):
+        # performance_file is the legacy JSON history, imported once
         self.performance_file = performance_file
-        self.performance_history = self.load_performance_history()
-    
-    def load_performance_history(self):
-        """Load existing performance history"""
-        if os.path.exists(self.performance_file):
-            try:
-                with open(self.performance_file, 'r') as f:
-                    return json.load(f)
-            except:
-                return {'training_sessions': [], 'performance_trends': {}}
-        return {'training_sessions': [], 'performance_trends': {}}
-    
-    def save_performance_history(self):
-        """Save performance history to file"""
+        self.db_path = db_path or os.path.splitext(performance_file)[0] + '.db'
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self, write=False):
+        """A connection; write=True holds the database write lock for the block."""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            if not self._initialized:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.executescript(SCHEMA)
+                self._initialized = True
+                self._import_legacy_json(conn)
+            if write:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    yield conn
+                    conn.execute('COMMIT')
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+            else:
+                yield conn
+        finally:
+            conn.close()
+
+    def _import_legacy_json(self, conn):
+        """Import model_performance.json into an empty store (once)."""
+        conn.execute('BEGIN IMMEDIATE')
         try:
-            with open(self.performance_file, 'w') as f:
-                json.dump(self.performance_history, f, indent=2)
-            return True
-        except Exception as e:
-            print(f"Error saving performance history: {e}")
-            return False
-    
-    def record_training_session(self, metrics: Dict, training_data_size: int, 
-                              hyperparameters: Dict, improvement: Optional[Dict] = None):
+            done = conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_json_imported'").fetchone()
+            if not done and os.path.exists(self.performance_file):
+                try:
+                    with open(self.performance_file) as f:
+                        legacy = json.load(f).get('training_sessions', [])
+                except (OSError, ValueError):
+                    legacy = []
+                for session in legacy:
+                    self._append(conn, dict(session, grain_type=session.get('grain_type', 'rice')))
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('legacy_json_imported', ?)",
+                         (datetime.now().isoformat(),))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _state(self, conn, grain):
+        row = conn.execute('SELECT state FROM aggregates WHERE grain = ?', (grain,)).fetchone()
+        return json.loads(row[0]) if row else _new_state()
+
+    def _append(self, conn, session):
+        """Insert a session and fold it into its grain's and the overall aggregates."""
+        metrics = session['metrics']
+        conn.execute(
+            'INSERT INTO sessions (grain, timestamp, accuracy, f1_score, training_data_size, session) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (session['grain_type'], session['timestamp'], metrics.get('accuracy'), metrics.get('f1_score'),
+             session['training_data_size'], json.dumps(session, default=str)),
+        )
+        for grain in (session['grain_type'], ALL_GRAINS):
+            state = _fold(self._state(conn, grain), session)
+            conn.execute('INSERT OR REPLACE INTO aggregates VALUES (?, ?)', (grain, json.dumps(state)))
+
+    def aggregates(self, grain_type: Optional[str] = None) -> Dict:
+        """Running aggregates for a grain (None: all grains)."""
+        with self._connect() as conn:
+            return self._state(conn, grain_type or ALL_GRAINS)
+
+    def record_training_session(self, metrics: Dict, training_data_size: int,
+                              hyperparameters: Dict, improvement: Optional[Dict] = None,
+                              grain_type: str = 'rice'):
         """Record a new training session"""
         session = {
             'timestamp': datetime.now().isoformat(),
+            'grain_type': grain_type,
             'metrics': metrics,
             'training_data_size': training_data_size,
             'hyperparameters': hyperparameters,
             'improvement': improvement or {}
         }
-        
-        self.performance_history['training_sessions'].append(session)
-        
-        # Calculate improvement if this is not the first session
-        if len(self.performance_history['training_sessions']) > 1:
-            previous_session = self.performance_history['training_sessions'][-2]
-            improvement = self.calculate_improvement(previous_session['metrics'], metrics)
-            session['improvement'] = improvement
-        
-        self.save_performance_history()
+
+        with self._connect(write=True) as conn:
+            # Calculate improvement if this is not the first session for the grain
+            previous = self._state(conn, grain_type)['last_metrics']
+            if previous is not None:
+                session['improvement'] = self.calculate_improvement(previous, metrics)
+            self._append(conn, session)
         return session
-    
+
+    def get_sessions(self, grain_type: Optional[str] = None, since: Optional[str] = None,
+                     until: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+        """Sessions in time order, optionally for one grain and an ISO timestamp range."""
+        clauses, params = [], []
+        if grain_type:
+            clauses.append('grain = ?')
+            params.append(grain_type)
+        if since:
+            clauses.append('timestamp >= ?')
+            params.append(since)
+        if until:
+            clauses.append('timestamp < ?')
+            params.append(until)
+        query = 'SELECT id, timestamp, session FROM sessions'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        if limit:
+            # Newest `limit` sessions, returned oldest first
+            query = f'SELECT * FROM ({query} ORDER BY timestamp DESC, id DESC LIMIT ?) ORDER BY timestamp, id'
+            params.append(int(limit))
+        else:
+            query += ' ORDER BY timestamp, id'
+        with self._connect() as conn:
+            return [json.loads(row[2]) for row in conn.execute(query, params)]
+
+    def load_performance_history(self):
+        """Full history in the legacy JSON layout (reads every session)"""
+        return {'training_sessions': self.get_sessions(), 'performance_trends': {}}
+
+    @property
+    def performance_history(self):
+        return self.load_performance_history()
+
     def calculate_improvement(self, previous_metrics: Dict, current_metrics: Dict) -> Dict:
         """Calculate improvement metrics"""
         improvement = {}
-        
-        for metric in ['accuracy', 'precision', 'recall', 'f1_score', 'cv_mean']:
-            if metric in previous_metrics and metric in current_metrics:
-                prev_val = previous_metrics[metric]
-                curr_val = current_metrics[metric]
+
+        for metric in TRACKED_METRICS:
+            prev_val = previous_metrics.get(metric)
+            curr_val = current_metrics.get(metric)
+            # cv_* is None when a time-budgeted run skipped cross-validation
+            if prev_val is not None and curr_val is not None:
                 improvement[f'{metric}_improvement'] = curr_val - prev_val
                 improvement[f'{metric}_improvement_pct'] = ((curr_val - prev_val) / prev_val) * 100 if prev_val > 0 else 0
-        
+
         return improvement
-    
-    def get_performance_summary(self) -> Dict:
-        """Get overall performance summary"""
-        if not self.performance_history['training_sessions']:
+
+    def get_performance_summary(self, grain_type: Optional[str] = None) -> Dict:
+        """Get overall performance summary (trends cover the last RECENT_WINDOW sessions)"""
+        state = self.aggregates(grain_type)
+        if not state['count']:
             return {}
-        
-        latest_session = self.performance_history['training_sessions'][-1]
-        first_session = self.performance_history['training_sessions'][0]
-        
-        # Calculate overall improvement
-        overall_improvement = self.calculate_improvement(
-            first_session['metrics'], 
-            latest_session['metrics']
-        )
-        
-        # Calculate trends
-        sessions = self.performance_history['training_sessions']
-        accuracy_trend = [s['metrics']['accuracy'] for s in sessions]
-        f1_trend = [s['metrics']['f1_score'] for s in sessions]
-        
+
+        recent = state['recent']
         return {
-            'total_training_sessions': len(sessions),
-            'latest_metrics': latest_session['metrics'],
-            'overall_improvement': overall_improvement,
-            'accuracy_trend': accuracy_trend,
-            'f1_trend': f1_trend,
-            'training_frequency': self.calculate_training_frequency(),
-            'best_performance': self.get_best_performance()
+            'grain_type': grain_type or 'all',
+            'total_training_sessions': state['count'],
+            'latest_metrics': state['last_metrics'],
+            'overall_improvement': self.calculate_improvement(state['first_metrics'], state['last_metrics']),
+            'accuracy_trend': [s['accuracy'] for s in recent],
+            'f1_trend': [s['f1_score'] for s in recent],
+            'moving_average': {
+                'window': len(recent),
+                'accuracy': _mean(s['accuracy'] for s in recent),
+                'f1_score': _mean(s['f1_score'] for s in recent),
+            },
+            'exponential_average': state['ema'],
+            'training_frequency': self._training_frequency(state),
+            'best_performance': self._best_performance(state)
         }
-    
-    def calculate_training_frequency(self) -> str:
-        """Calculate how often the model is being retrained"""
-        sessions = self.performance_history['training_sessions']
-        if len(sessions) < 2:
+
+    def _average_interval_days(self, state):
+        if state['count'] < 2:
+            return None
+        span = datetime.fromisoformat(state['last_timestamp']) - datetime.fromisoformat(state['first_timestamp'])
+        return span.total_seconds() / 86400 / (state['count'] - 1)
+
+    def _training_frequency(self, state) -> str:
+        avg_days = self._average_interval_days(state)
+        if avg_days is None:
             return "First training"
-        
-        # Calculate average time between training sessions
-        timestamps = [datetime.fromisoformat(s['timestamp']) for s in sessions]
-        time_diffs = [(timestamps[i+1] - timestamps[i]).days for i in range(len(timestamps)-1)]
-        avg_days = sum(time_diffs) / len(time_diffs)
-        
+
         if avg_days < 1:
             return "Multiple times daily"
         elif avg_days < 7:
@@ -113,102 +272,96 @@ class ModelPerformanceTracker:
             return f"Every {avg_days/7:.1f} weeks"
         else:
             return f"Every {avg_days/30:.1f} months"
-    
-    def get_best_performance(self) -> Dict:
-        """Get the best performance metrics achieved"""
-        sessions = self.performance_history['training_sessions']
-        if not sessions:
+
+    def calculate_training_frequency(self, grain_type: Optional[str] = None) -> str:
+        """Calculate how often the model is being retrained"""
+        return self._training_frequency(self.aggregates(grain_type))
+
+    def _best_performance(self, state) -> Dict:
+        if not state['count']:
             return {}
-        
-        best_accuracy = max(sessions, key=lambda x: x['metrics']['accuracy'])
-        best_f1 = max(sessions, key=lambda x: x['metrics']['f1_score'])
-        
-        return {
-            'best_accuracy': {
-                'value': best_accuracy['metrics']['accuracy'],
-                'timestamp': best_accuracy['timestamp']
-            },
-            'best_f1': {
-                'value': best_f1['metrics']['f1_score'],
-                'timestamp': best_f1['timestamp']
-            }
-        }
-    
-    def get_training_insights(self) -> Dict:
+        return {'best_accuracy': state['best_accuracy'], 'best_f1': state['best_f1']}
+
+    def get_best_performance(self, grain_type: Optional[str] = None) -> Dict:
+        """Get the best performance metrics achieved"""
+        return self._best_performance(self.aggregates(grain_type))
+
+    def get_training_insights(self, grain_type: Optional[str] = None) -> Dict:
         """Get insights about the training process"""
-        sessions = self.performance_history['training_sessions']
-        if len(sessions) < 2:
+        state = self.aggregates(grain_type)
+        if state['count'] < 2:
             return {'insights': ['Not enough data for insights yet']}
-        
+
         insights = []
-        
+
         # Check for consistent improvement
-        recent_sessions = sessions[-3:] if len(sessions) >= 3 else sessions
-        accuracy_values = [s['metrics']['accuracy'] for s in recent_sessions]
-        
-        if all(accuracy_values[i] <= accuracy_values[i+1] for i in range(len(accuracy_values)-1)):
+        accuracy_values = [s['accuracy'] for s in state['recent'][-3:] if s['accuracy'] is not None]
+
+        if len(accuracy_values) < 2:
+            pass
+        elif all(accuracy_values[i] <= accuracy_values[i+1] for i in range(len(accuracy_values)-1)):
             insights.append("✅ Model shows consistent improvement in recent training sessions")
         elif accuracy_values[-1] > accuracy_values[0]:
             insights.append("📈 Overall improvement since first training")
         else:
             insights.append("⚠️ Recent performance may need attention")
-        
+
         # Check training frequency
-        frequency = self.calculate_training_frequency()
+        frequency = self._training_frequency(state)
         if "daily" in frequency:
             insights.append("🔄 High training frequency - model is actively learning")
         elif "weekly" in frequency:
             insights.append("📅 Regular training schedule maintained")
         else:
             insights.append("⏰ Consider more frequent training for better performance")
-        
+
         # Check data growth
-        data_sizes = [s['training_data_size'] for s in sessions]
-        if data_sizes[-1] > data_sizes[0]:
-            growth = ((data_sizes[-1] - data_sizes[0]) / data_sizes[0]) * 100
+        first_size, last_size = state['first_data_size'], state['last_data_size']
+        if first_size and last_size and last_size > first_size:
+            growth = ((last_size - first_size) / first_size) * 100
             insights.append(f"📊 Training data increased by {growth:.1f}% since first training")
-        
+
         return {'insights': insights}
-    
-    def generate_training_report(self) -> Dict:
+
+    def generate_training_report(self, grain_type: Optional[str] = None) -> Dict:
         """Generate a comprehensive training report"""
-        summary = self.get_performance_summary()
-        insights = self.get_training_insights()
-        
+        summary = self.get_performance_summary(grain_type)
+        insights = self.get_training_insights(grain_type)
+
         return {
             'summary': summary,
             'insights': insights,
-            'recommendations': self.get_recommendations()
+            'recommendations': self.get_recommendations(grain_type)
         }
-    
-    def get_recommendations(self) -> List[str]:
+
+    def get_recommendations(self, grain_type: Optional[str] = None) -> List[str]:
         """Get recommendations for model improvement"""
-        sessions = self.performance_history['training_sessions']
-        if not sessions:
+        state = self.aggregates(grain_type)
+        if not state['count']:
             return ["Start training the model to see recommendations"]
-        
+
         recommendations = []
-        latest = sessions[-1]
-        
+        latest = state['last_metrics']
+
         # Check accuracy
-        if latest['metrics']['accuracy'] < 0.85:
+        if (latest.get('accuracy') or 0) < 0.85:
             recommendations.append("🎯 Consider collecting more diverse training data")
-        
+
         # Check F1 score
-        if latest['metrics']['f1_score'] < 0.80:
+        if (latest.get('f1_score') or 0) < 0.80:
             recommendations.append("⚖️ Model may need better class balance handling")
-        
+
         # Check CV score
-        if latest['metrics']['cv_std'] > 0.05:
+        if (latest.get('cv_std') or 0) > 0.05:
             recommendations.append("🔄 High variance suggests need for more training data")
-        
+
         # Check training frequency
-        if len(sessions) < 3:
+        if state['count'] < 3:
             recommendations.append("📈 Train more frequently to improve performance")
-        
+
         if not recommendations:
             recommendations.append("✅ Model performance looks good! Continue regular training")
-        
+
         return recommendations
 
 # Global instance
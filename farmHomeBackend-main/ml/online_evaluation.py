@@ -0,0 +1,361 @@
+"""
+GrainHero Online Evaluation
+===========================
+Production accuracy of the spoilage models, measured against inspection
+results that arrive days after the prediction was made.
+
+Everything lives in ml/online_evaluation.db (stdlib sqlite3):
+
+  predictions  the prediction log: silo, time, grain, model version,
+               predicted class, confidence; indexed by (silo, time)
+  labels       inspection results: silo, inspection time, observed class,
+               and whether a prediction has been matched to them yet
+               (pending / matched / unmatched)
+  confusion    confusion-matrix counts per (grain, model version, day of
+               the prediction, actual, predicted)
+
+join_labels() takes the pending labels and, with one pandas merge_asof per
+batch, matches each to the latest prediction for the same silo made at or
+before the inspection (at most max_lag earlier). Matches are added to the
+daily confusion counts, so each label is joined exactly once and the
+prediction log is never rescanned. Labels with no prediction yet stay
+pending and are retried on the next join until the most recently logged
+prediction is more than max_lag past the inspection; they are then marked
+unmatched, so the range of the log a join reads stays bounded (predictions
+back-filled later than that are not matched to them).
+
+smartbin_predict.py logs every prediction made for a reading that carries
+a silo_id; other sources can append through log_predictions() or the CLI.
+Timestamps are seconds since the epoch or ISO strings; strings without a
+UTC offset are taken as UTC.
+
+Window metrics (accuracy, macro F1, per-class recall and the confusion
+matrix per grain and model version) are sums of daily counts: a window
+costs O(days), not O(predictions), and rolling_metrics() slides a window
+over months with one cumulative sum.
+
+  python online_evaluation.py --log-predictions predictions.csv
+          (columns silo_id, timestamp, grain, model_version, prediction[, confidence])
+  python online_evaluation.py --add-labels inspections.csv
+          (columns silo_id, timestamp, label)
+  python online_evaluation.py [--grain wheat] [--window-days 30] [--step-days 7] [--json]
+"""
+import json
+import os
+import sqlite3
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.path.join(ML_DIR, 'online_evaluation.db')
+DEFAULT_MAX_LAG_DAYS = 14
+DAY = 86400.0
+CLASSES = ['Safe', 'Risky', 'Spoiled']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    silo_id TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    grain TEXT NOT NULL,
+    model_version TEXT NOT NULL,
+    prediction TEXT NOT NULL,
+    confidence REAL
+);
+CREATE INDEX IF NOT EXISTS predictions_silo_time ON predictions (silo_id, timestamp);
+CREATE TABLE IF NOT EXISTS labels (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    silo_id TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    label TEXT NOT NULL,
+    prediction_id INTEGER,
+    status TEXT NOT NULL DEFAULT 'pending'
+);
+CREATE INDEX IF NOT EXISTS labels_status ON labels (status);
+CREATE TABLE IF NOT EXISTS confusion (
+    grain TEXT NOT NULL,
+    model_version TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    actual TEXT NOT NULL,
+    predicted TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (grain, model_version, day, actual, predicted)
+);
+"""
+
+
+def _epoch(values):
+    """Seconds since the epoch for ISO strings, datetimes or numbers, in any mix (vectorized)."""
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(np.float64).to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(values):
+        seconds = pd.Series(np.nan, index=values.index)
+        dates = values.notna()
+    else:
+        # Mixed columns: numbers (and numeric strings) are epoch seconds, the rest ISO
+        seconds = pd.to_numeric(values, errors='coerce').astype(np.float64)
+        dates = seconds.isna() & values.notna()
+    if dates.any():
+        stamps = pd.to_datetime(values[dates], format='ISO8601', utc=True)
+        seconds[dates] = (stamps - pd.Timestamp(0, tz='UTC')).dt.total_seconds()
+    return seconds.to_numpy()
+
+
+def _day_iso(day):
+    return (datetime(1970, 1, 1) + timedelta(days=int(day))).date().isoformat()
+
+
+def scores(matrix, classes):
+    """Accuracy, macro F1 and per-class recall from a confusion matrix (rows: actual)."""
+    total = int(matrix.sum())
+    if total == 0:
+        return {'samples': 0, 'accuracy': None, 'f1_macro': None, 'recall': {}}
+    tp = np.diag(matrix).astype(np.float64)
+    actual, predicted = matrix.sum(axis=1), matrix.sum(axis=0)
+    precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+    recall = np.divide(tp, actual, out=np.zeros_like(tp), where=actual > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall,
+                   out=np.zeros_like(tp), where=(precision + recall) > 0)
+    present = (actual + predicted) > 0
+    return {
+        'samples': total,
+        'accuracy': round(float(tp.sum() / total), 4),
+        'f1_macro': round(float(f1[present].mean()), 4),
+        'recall': {c: round(float(r), 4) for c, r, n in zip(classes, recall, actual) if n},
+    }
+
+
+class OnlineEvaluator:
+    def __init__(self, db_path=DEFAULT_DB, max_lag_days=DEFAULT_MAX_LAG_DAYS):
+        self.db_path = db_path
+        self.max_lag = max_lag_days * DAY
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self, write=False):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            if not self._initialized:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.executescript(SCHEMA)
+                self._initialized = True
+            if write:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    yield conn
+                    conn.execute('COMMIT')
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+            else:
+                yield conn
+        finally:
+            conn.close()
+
+    def log_predictions(self, predictions):
+        """
+        Append predictions: a DataFrame or list of dicts with silo_id,
+        timestamp, grain, model_version, prediction and optionally confidence.
+        """
+        df = pd.DataFrame(predictions)
+        if df.empty:
+            return 0
+        confidence = df['confidence'] if 'confidence' in df else pd.Series(np.nan, index=df.index)
+        rows = zip(df['silo_id'].astype(str), _epoch(df['timestamp']).tolist(),
+                   df['grain'].astype(str).str.lower(), df['model_version'].astype(str),
+                   df['prediction'].astype(str),
+                   confidence.astype(np.float64).where(confidence.notna(), None).tolist())
+        with self._connect(write=True) as conn:
+            conn.executemany('INSERT INTO predictions (silo_id, timestamp, grain, model_version, prediction, '
+                             'confidence) VALUES (?, ?, ?, ?, ?, ?)', rows)
+        return len(df)
+
+    def add_labels(self, labels, join=True):
+        """Append inspection results (silo_id, timestamp, label) and, by default, join them."""
+        df = pd.DataFrame(labels)
+        if not df.empty:
+            rows = zip(df['silo_id'].astype(str), _epoch(df['timestamp']).tolist(), df['label'].astype(str))
+            with self._connect(write=True) as conn:
+                conn.executemany('INSERT INTO labels (silo_id, timestamp, label) VALUES (?, ?, ?)', rows)
+        return self.join_labels() if join else {'labels': len(df)}
+
+    def join_labels(self):
+        """Match pending labels to predictions and add them to the daily confusion counts."""
+        with self._connect(write=True) as conn:
+            labels = pd.read_sql_query(
+                "SELECT id AS label_id, silo_id, timestamp, label FROM labels WHERE status = 'pending'", conn)
+            if labels.empty:
+                return {'matched': 0, 'pending': 0, 'unmatched': 0}
+            silos = labels['silo_id'].unique().tolist()
+            lo, hi = labels['timestamp'].min() - self.max_lag, labels['timestamp'].max()
+            predictions = pd.concat([
+                pd.read_sql_query(
+                    'SELECT id AS prediction_id, silo_id, timestamp, grain, model_version, prediction '
+                    f'FROM predictions WHERE timestamp BETWEEN ? AND ? AND silo_id IN ({",".join("?" * len(chunk))})',
+                    conn, params=[lo, hi, *chunk])
+                for chunk in (silos[i:i + 500] for i in range(0, len(silos), 500))
+            ], ignore_index=True)
+
+            matched = pd.DataFrame()
+            if not predictions.empty:
+                predictions['prediction_time'] = predictions['timestamp']
+                joined = pd.merge_asof(
+                    labels.sort_values('timestamp'), predictions.sort_values('timestamp'),
+                    on='timestamp', by='silo_id', direction='backward', tolerance=self.max_lag,
+                )
+                matched = joined.dropna(subset=['prediction_id'])
+            if not matched.empty:
+                matched = matched.assign(day=(matched['prediction_time'] // DAY).astype(np.int64))
+                counts = matched.groupby(['grain', 'model_version', 'day', 'label', 'prediction']).size()
+                conn.executemany(
+                    'INSERT INTO confusion VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (grain, model_version, day, '
+                    'actual, predicted) DO UPDATE SET count = count + excluded.count',
+                    [(g, v, int(d), a, p, int(n)) for (g, v, d, a, p), n in counts.items()])
+                conn.executemany("UPDATE labels SET status = 'matched', prediction_id = ? WHERE id = ?",
+                                 zip(matched['prediction_id'].astype(int).tolist(),
+                                     matched['label_id'].astype(int).tolist()))
+
+            # The log has moved past these labels' windows: stop retrying them
+            # Last inserted row (O(1) by rowid; MAX(timestamp) would scan the log)
+            latest = conn.execute('SELECT timestamp FROM predictions ORDER BY id DESC LIMIT 1').fetchone()
+            latest = latest[0] if latest else None
+            unmatched = labels[~labels['label_id'].isin(matched.get('label_id', []))]
+            if latest is not None:
+                unmatched = unmatched[unmatched['timestamp'] + self.max_lag < latest]
+                conn.executemany("UPDATE labels SET status = 'unmatched' WHERE id = ?",
+                                 ((int(i),) for i in unmatched['label_id']))
+            else:
+                unmatched = unmatched.iloc[:0]
+        return {'matched': len(matched), 'pending': len(labels) - len(matched) - len(unmatched),
+                'unmatched': len(unmatched)}
+
+    def _daily_counts(self, grain=None, model_version=None, first_day=None, last_day=None):
+        clauses, params = [], []
+        for column, value in (('grain', grain), ('model_version', model_version)):
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        if first_day is not None:
+            clauses.append('day >= ?')
+            params.append(first_day)
+        if last_day is not None:
+            clauses.append('day <= ?')
+            params.append(last_day)
+        where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+        with self._connect() as conn:
+            return pd.read_sql_query(f'SELECT * FROM confusion{where}', conn, params=params)
+
+    @staticmethod
+    def _classes(counts):
+        seen = set(counts['actual']) | set(counts['predicted'])
+        return [c for c in CLASSES if c in seen] + sorted(seen - set(CLASSES))
+
+    def window_metrics(self, grain=None, model_version=None, window_days=30, end=None):
+        """Metrics per (grain, model version) for predictions in the `window_days` days up to `end`."""
+        last_day = int(_epoch([end or datetime.now(timezone.utc)])[0] // DAY)
+        counts = self._daily_counts(grain, model_version, last_day - window_days + 1, last_day)
+        report = {}
+        if counts.empty:
+            return report
+        classes = self._classes(counts)
+        index = {c: i for i, c in enumerate(classes)}
+        for (g, v), group in counts.groupby(['grain', 'model_version']):
+            matrix = np.zeros((len(classes), len(classes)), dtype=np.int64)
+            np.add.at(matrix, (group['actual'].map(index).to_numpy(), group['predicted'].map(index).to_numpy()),
+                      group['count'].to_numpy())
+            report[f'{g}/{v}'] = dict(scores(matrix, classes), grain=g, model_version=v,
+                                      window_days=window_days, end=_day_iso(last_day),
+                                      classes=classes, confusion_matrix=matrix.tolist())
+        return report
+
+    def rolling_metrics(self, grain=None, model_version=None, window_days=30, step_days=7):
+        """
+        Metrics over a `window_days` window sliding by `step_days` across the
+        whole log, per (grain, model version): one cumulative sum over the
+        daily confusion matrices.
+        """
+        counts = self._daily_counts(grain, model_version)
+        series = {}
+        if counts.empty:
+            return series
+        classes = self._classes(counts)
+        index = {c: i for i, c in enumerate(classes)}
+        first, last = int(counts['day'].min()), int(counts['day'].max())
+        for (g, v), group in counts.groupby(['grain', 'model_version']):
+            daily = np.zeros((last - first + 2, len(classes), len(classes)), dtype=np.int64)
+            np.add.at(daily, (group['day'].to_numpy() - first + 1, group['actual'].map(index).to_numpy(),
+                              group['predicted'].map(index).to_numpy()), group['count'].to_numpy())
+            cumulative = daily.cumsum(axis=0)  # cumulative[k] = days first .. first + k - 1
+            points = []
+            for end in range(last, first - 1, -step_days)[::-1]:
+                start = max(first, end - window_days + 1)
+                matrix = cumulative[end - first + 1] - cumulative[start - first]
+                if matrix.sum():
+                    points.append(dict(scores(matrix, classes), start=_day_iso(start), end=_day_iso(end)))
+            series[f'{g}/{v}'] = points
+        return series
+
+    def status(self):
+        with self._connect() as conn:
+            predictions = conn.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+            labels = dict(conn.execute('SELECT status, COUNT(*) FROM labels GROUP BY status').fetchall())
+        return {'predictions': predictions, 'labels_matched': labels.get('matched', 0),
+                'labels_pending': labels.get('pending', 0), 'labels_unmatched': labels.get('unmatched', 0)}
+
+
+# Global instance
+online_evaluator = OnlineEvaluator()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Evaluate logged predictions against delayed inspection labels.')
+    parser.add_argument('--log-predictions', metavar='CSV', help='append predictions from a CSV')
+    parser.add_argument('--add-labels', metavar='CSV', help='append inspection labels from a CSV and join them')
+    parser.add_argument('--grain')
+    parser.add_argument('--model-version')
+    parser.add_argument('--window-days', type=int, default=30)
+    parser.add_argument('--step-days', type=int, help='also print metrics for a window sliding by this many days')
+    parser.add_argument('--max-lag-days', type=float, default=DEFAULT_MAX_LAG_DAYS,
+                        help='a label matches predictions made at most this long before the inspection')
+    parser.add_argument('--db', default=DEFAULT_DB)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+
+    evaluator = OnlineEvaluator(args.db, args.max_lag_days)
+    if args.log_predictions:
+        print(f"Logged {evaluator.log_predictions(pd.read_csv(args.log_predictions))} predictions")
+    if args.add_labels:
+        print(f"Labels: {evaluator.add_labels(pd.read_csv(args.add_labels))}")
+
+    report = {
+        'status': evaluator.status(),
+        'window': evaluator.window_metrics(args.grain, args.model_version, args.window_days),
+    }
+    if args.step_days:
+        report['rolling'] = evaluator.rolling_metrics(args.grain, args.model_version,
+                                                      args.window_days, args.step_days)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    status = report['status']
+    print(f"{status['predictions']} predictions, {status['labels_matched']} labels matched, "
+          f"{status['labels_pending']} pending, {status['labels_unmatched']} unmatched")
+    print(f"\nLast {args.window_days} days:")
+    for key, m in report['window'].items():
+        print(f"   {key:30s} n={m['samples']:7d}  acc={m['accuracy']:.4f}  F1={m['f1_macro']:.4f}")
+    for key, points in report.get('rolling', {}).items():
+        print(f"\n{key} ({args.window_days}-day window every {args.step_days} days):")
+        for p in points:
+            print(f"   {p['start']} .. {p['end']}  n={p['samples']:7d}  acc={p['accuracy']:.4f}  F1={p['f1_macro']:.4f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,332 @@
+"""
+GrainHero Out-of-Core Training Data
+===================================
+Streams a spoilage dataset once from disk and prepares everything the
+ensemble needs without holding the full table in memory:
+
+  - train/test rows spilled to float32 memory-mapped .npy files
+  - XGBoost fed through an external-memory DataIter (ExtMemQuantileDMatrix)
+  - LightGBM Dataset built from a batched Sequence over the memmap
+  - a stratified reservoir sample (bounded size) for RandomForest and tuning
+
+Missing values are filled with the dataset medians (feature_stats) in every
+path: XGBoost and LightGBM batches, the sample, and the holdout batches.
+
+The XGBoost booster is loaded back into an XGBClassifier and the LightGBM
+booster wrapped in BoosterClassifier (predict_proba over the public Booster
+API). The fitted members are combined by SoftVotingEnsemble, the soft-voting
+model smartbin_predict.py loads (predict_proba, named_estimators_).
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+import lightgbm as lgb
+from xgboost import XGBClassifier
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.utils import Bunch
+
+from dataset_loader import ChunkReader, DEFAULT_CHUNKSIZE
+from feature_stats import FeatureStats
+
+DEFAULT_SAMPLE_SIZE = 200_000
+BATCH_ROWS = 100_000
+
+
+class StratifiedReservoir:
+    """
+    Uniform sample without replacement per class, kept by random priority:
+    every row draws a key and each class keeps its `capacity` smallest keys.
+    The final sample is cut back to class proportions (at least one row per
+    class).
+    """
+
+    def __init__(self, capacity, n_features, seed):
+        self.capacity = capacity
+        self.n_features = n_features
+        self.rng = np.random.default_rng(seed)
+        self.classes = {}
+        self.seen = {}
+
+    def add(self, X, codes):
+        keys = self.rng.random(len(codes))
+        for code in np.unique(codes):
+            mask = codes == code
+            self.seen[code] = self.seen.get(code, 0) + int(mask.sum())
+            held = self.classes.get(code)
+            if held is None:
+                held = (np.empty((0, self.n_features), dtype=np.float32), np.empty(0))
+            X_all = np.concatenate([held[0], X[mask]])
+            keys_all = np.concatenate([held[1], keys[mask]])
+            if len(keys_all) > self.capacity:
+                keep = np.argpartition(keys_all, self.capacity)[:self.capacity]
+                X_all, keys_all = X_all[keep], keys_all[keep]
+            self.classes[code] = (X_all, keys_all)
+
+    def sample(self):
+        total = sum(self.seen.values())
+        X_parts, y_parts = [], []
+        for code, (X, keys) in self.classes.items():
+            share = max(1, int(round(self.capacity * self.seen[code] / total)))
+            keep = np.argsort(keys)[:share]
+            X_parts.append(X[keep])
+            y_parts.append(np.full(len(keep), code, dtype=np.int8))
+        order = self.rng.permutation(sum(len(y) for y in y_parts))
+        return np.concatenate(X_parts)[order], np.concatenate(y_parts)[order]
+
+
+class SpilledDataset:
+    """Train/test split of a streamed dataset, memory-mapped from workdir."""
+
+    def __init__(self, workdir, features):
+        self.workdir = workdir
+        self.features = list(features)
+        self.n_train = 0
+        self.n_test = 0
+        self.classes = None
+        self.sample_X = None
+        self.sample_y = None
+        self.feature_stats = FeatureStats(self.features)
+        self.chunks = 0
+
+    def _open(self, name, shape, dtype):
+        return np.lib.format.open_memmap(os.path.join(self.workdir, name), mode='w+',
+                                         dtype=dtype, shape=shape)
+
+    @property
+    def X_train(self):
+        return self._X_train[:self.n_train]
+
+    @property
+    def y_train(self):
+        return self._y_train[:self.n_train]
+
+    @property
+    def X_test(self):
+        return self._X_test[:self.n_test]
+
+    @property
+    def y_test(self):
+        return self._y_test[:self.n_test]
+
+    def fill_values(self):
+        """Median per feature (NaN where a column has no values), in feature order."""
+        defaults = self.feature_stats.defaults(self.features)
+        return np.array([defaults.get(f, np.nan) for f in self.features], dtype=np.float32)
+
+    def sample_frame(self):
+        """Reservoir sample as (DataFrame, labels), NaNs filled with the dataset medians."""
+        X = pd.DataFrame(_filled(self.sample_X, self.fill_values()), columns=self.features, copy=False)
+        return X, self.sample_y
+
+    def test_batches(self, batch_rows=BATCH_ROWS, fill=None):
+        for start in range(0, self.n_test, batch_rows):
+            X = pd.DataFrame(np.asarray(self.X_test[start:start + batch_rows]), columns=self.features)
+            yield X.fillna(fill) if fill is not None else X
+
+
+def spill_dataset(path, features, workdir, chunksize=DEFAULT_CHUNKSIZE, test_size=0.2,
+                  sample_size=DEFAULT_SAMPLE_SIZE, seed=42):
+    """
+    One streaming pass over `path`: assigns each labelled row to train or
+    test (Bernoulli(test_size), seeded), appends it to the matching memmap
+    and offers train rows to the reservoir, and accumulates feature_stats over
+    all rows. Label codes are remapped to sorted class order at the end,
+    matching LabelEncoder.
+    """
+    reader = ChunkReader(path, features, chunksize)
+    capacity = reader.capacity()
+    n_features = len(reader.features)
+    data = SpilledDataset(workdir, reader.features)
+    data._X_train = data._open('X_train.npy', (capacity, n_features), np.float32)
+    data._y_train = data._open('y_train.npy', (capacity,), np.int8)
+    data._X_test = data._open('X_test.npy', (capacity, n_features), np.float32)
+    data._y_test = data._open('y_test.npy', (capacity,), np.int8)
+
+    rng = np.random.default_rng(seed)
+    reservoir = StratifiedReservoir(sample_size, n_features, seed)
+    for X, codes in reader:
+        data.feature_stats.update_block(X, reader.features)
+        test = rng.random(len(codes)) < test_size
+        for is_test in (False, True):
+            mask = test == is_test
+            rows = int(mask.sum())
+            if is_test:
+                data._X_test[data.n_test:data.n_test + rows] = X[mask]
+                data._y_test[data.n_test:data.n_test + rows] = codes[mask]
+                data.n_test += rows
+            else:
+                data._X_train[data.n_train:data.n_train + rows] = X[mask]
+                data._y_train[data.n_train:data.n_train + rows] = codes[mask]
+                data.n_train += rows
+                reservoir.add(X[mask], codes[mask])
+    data.chunks = reader.chunks
+
+    # Category order -> sorted class order (what LabelEncoder.fit would give)
+    categories = np.asarray(reader.categories, dtype=object)
+    present = np.array(sorted(set(np.unique(data.y_train)) | set(np.unique(data.y_test))), dtype=np.int64)
+    data.classes = np.sort(categories[present])
+    lookup = np.full(len(categories), -1, dtype=np.int8)
+    lookup[present] = np.searchsorted(data.classes, categories[present])
+    for y, n in ((data._y_train, data.n_train), (data._y_test, data.n_test)):
+        for start in range(0, n, BATCH_ROWS):
+            y[start:start + BATCH_ROWS] = lookup[y[start:start + BATCH_ROWS]]
+        y.flush()
+    data._X_train.flush()
+    data._X_test.flush()
+    data.sample_X, sample_codes = reservoir.sample()
+    data.sample_y = lookup[sample_codes].astype(np.int64)
+    return data
+
+
+def _filled(X, fill):
+    """Copy of a float32 block with NaNs replaced by the per-column `fill`."""
+    X = np.array(X, dtype=np.float32)
+    missing = np.isnan(X)
+    if missing.any():
+        X[missing] = np.broadcast_to(fill, X.shape)[missing]
+    return X
+
+
+class MemmapBatchIter(xgb.DataIter):
+    """Feeds memmapped rows (NaNs filled) to XGBoost in fixed-size batches."""
+
+    def __init__(self, X, y, features, cache_prefix, fill, batch_rows=BATCH_ROWS):
+        self.X = X
+        self.y = y
+        self.features = features
+        self.fill = fill
+        self.batch_rows = batch_rows
+        self._start = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._start >= len(self.X):
+            return False
+        end = self._start + self.batch_rows
+        input_data(data=_filled(self.X[self._start:end], self.fill), label=np.asarray(self.y[self._start:end]),
+                   feature_names=self.features)
+        self._start = end
+        return True
+
+    def reset(self):
+        self._start = 0
+
+
+class MemmapSequence(lgb.Sequence):
+    """Random-access, batched view of the memmap (NaNs filled) for LightGBM Dataset construction."""
+
+    def __init__(self, X, fill, batch_rows=BATCH_ROWS):
+        self.X = X
+        self.fill = fill
+        self.batch_size = batch_rows
+
+    def __getitem__(self, idx):
+        # LightGBM samples Sequence rows as float64; upcast one batch at a time
+        return _filled(self.X[idx], self.fill).astype(np.float64)
+
+    def __len__(self):
+        return len(self.X)
+
+
+def train_xgboost(data, params, n_classes, seed):
+    """Train XGBoost over external memory; returns a fitted XGBClassifier."""
+    params = dict(params)
+    num_rounds = params.pop('n_estimators')
+    params.update(objective='multi:softprob', num_class=n_classes, tree_method='hist',
+                  seed=seed, verbosity=0)
+    batches = MemmapBatchIter(data.X_train, data.y_train, data.features,
+                              cache_prefix=os.path.join(data.workdir, 'xgb_cache'), fill=data.fill_values())
+    dtrain = xgb.ExtMemQuantileDMatrix(batches)
+    booster = xgb.train(params, dtrain, num_boost_round=num_rounds)
+    model = XGBClassifier(n_estimators=num_rounds, random_state=seed, verbosity=0,
+                          num_class=n_classes, objective='multi:softprob')
+    model.load_model(bytearray(booster.save_raw('ubj')))
+    return model
+
+
+class BoosterClassifier(ClassifierMixin, BaseEstimator):
+    """
+    Fitted multiclass lgb.Booster behind the classifier interface the
+    ensemble needs (predict_proba, predict, classes_, feature_importances_),
+    using only the public Booster API.
+    """
+
+    def __init__(self, booster=None):
+        self.booster = booster
+
+    @property
+    def booster_(self):
+        return self.booster
+
+    @property
+    def classes_(self):
+        # One tree per class per iteration for the multiclass objective
+        return np.arange(self.booster.num_model_per_iteration())
+
+    @property
+    def n_features_in_(self):
+        return self.booster.num_feature()
+
+    @property
+    def feature_importances_(self):
+        # Split counts, as LGBMClassifier reports by default
+        return self.booster.feature_importance(importance_type='split')
+
+    def fit(self, X, y):
+        raise NotImplementedError('BoosterClassifier wraps an already trained booster')
+
+    def predict_proba(self, X):
+        return self.booster.predict(np.asarray(X, dtype=np.float64))
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def train_lightgbm(data, params, n_classes, seed):
+    """Train LightGBM on a Dataset built batch by batch; returns a fitted BoosterClassifier."""
+    params = dict(params)
+    num_rounds = params.pop('n_estimators')
+    train_params = dict(params, objective='multiclass', num_class=n_classes,
+                        seed=seed, verbosity=-1, num_threads=1)
+    dataset = lgb.Dataset([MemmapSequence(data.X_train, data.fill_values())], label=np.asarray(data.y_train),
+                          feature_name=data.features, params={'verbose': -1})
+    booster = lgb.train(train_params, dataset, num_boost_round=num_rounds)
+    return BoosterClassifier(booster)
+
+
+class SoftVotingEnsemble(ClassifierMixin, BaseEstimator):
+    """
+    Soft voting over already fitted members: predict_proba is the mean of
+    the members' predict_proba (what VotingClassifier(voting='soft') gives),
+    without setting any of VotingClassifier's private fitted state.
+
+    `estimators` is a list of (name, fitted model) pairs whose predict_proba
+    columns are the label-encoded classes 0..n_classes-1.
+    """
+
+    def __init__(self, estimators=None):
+        self.estimators = estimators
+
+    @property
+    def named_estimators_(self):
+        return Bunch(**dict(self.estimators))
+
+    @property
+    def estimators_(self):
+        return [model for _, model in self.estimators]
+
+    @property
+    def classes_(self):
+        return np.asarray(self.estimators[0][1].classes_)
+
+    def fit(self, X, y):
+        raise NotImplementedError('SoftVotingEnsemble combines already fitted members; '
+                                  'use VotingClassifier to fit from scratch')
+
+    def predict_proba(self, X):
+        return np.mean([model.predict_proba(X) for model in self.estimators_], axis=0)
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
@@ -0,0 +1,316 @@
+"""
+GrainHero Prediction Logger
+===========================
+Optional record of every prediction: when, which grain, which model (a hash
+of the model file), the feature vector the model saw and the class
+probabilities it returned, so a bad alert can be traced to the model
+version and inputs behind it.
+
+Switched on by GRAINHERO_PREDICTION_LOG=<dir> (smartbin_predict.py and the
+ML service; main.py also takes --prediction-log). log() only copies the
+batch into a pending buffer; a background thread appends the buffer every
+FLUSH_INTERVAL seconds (or sooner when it is large) and at exit, so the
+request path never touches the disk.
+
+Format: fixed-width little-endian binary records after a small JSON header,
+
+  b'GHPL' | u32 header length | header JSON (features, classes, grains, dtype)
+  records: timestamp f8 | grain u1 | model 8 bytes (sha256 prefix)
+           | features f4[n_features] | probabilities f4[n_classes]
+
+65 bytes per reading for the 9-feature models, readable as one numpy
+structured array (read_log() memory-maps it). Processes append to
+<dir>/predictions-<n_features>f.ghpl under a file lock, so the 9-feature
+backend models and the 4-feature ML service can share a directory without
+rotating each other's file; when it would exceed max_bytes it is renamed to
+predictions-<n_features>f-<time>.ghpl and only the newest max_files rotated
+files of that layout are kept.
+
+  python prediction_logger.py <dir> [--grain wheat] [--model HASH] [--tail 20] [--csv out.csv]
+"""
+import atexit
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from file_lock import file_lock, atomic_write_json
+
+LOG_DIR_ENV = 'GRAINHERO_PREDICTION_LOG'
+MAGIC = b'GHPL'
+FORMAT_VERSION = 1
+HASH_CACHE_NAME = 'model_hashes.json'
+CLASSES = ['Safe', 'Risky', 'Spoiled']
+GRAINS = ['unknown', 'rice', 'wheat', 'maize', 'sorghum', 'barley', 'other']
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_FILES = 50
+FLUSH_INTERVAL = 1.0
+MAX_PENDING = 10_000        # rows that trigger an early flush
+MAX_BUFFERED = 1_000_000    # rows kept if the disk falls behind; older rows are dropped
+
+_fingerprints = {}
+
+
+def record_dtype(n_features, n_classes):
+    return np.dtype([
+        ('timestamp', '<f8'), ('grain', 'u1'), ('model', 'S8'),
+        ('features', '<f4', (n_features,)), ('probabilities', '<f4', (n_classes,)),
+    ])
+
+
+def model_fingerprint(path, cache_dir=None):
+    """
+    First 16 hex digits of the model file's SHA-256. Cached per (path, size,
+    mtime) in this process and, with cache_dir, in <cache_dir>/model_hashes.json
+    so short-lived processes do not re-hash the model.
+    """
+    if not path or not os.path.exists(path):
+        return '0' * 16
+    st = os.stat(path)
+    key = f'{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}'
+    if key in _fingerprints:
+        return _fingerprints[key]
+    cache_path = os.path.join(cache_dir, HASH_CACHE_NAME) if cache_dir else None
+    cache = {}
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+    if key not in cache:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        cache[key] = digest.hexdigest()[:16]
+        if cache_path:
+            os.makedirs(cache_dir, exist_ok=True)
+            atomic_write_json(cache_path, cache, indent=2)
+    _fingerprints[key] = cache[key]
+    return cache[key]
+
+
+def _read_header(f):
+    if f.read(4) != MAGIC:
+        raise ValueError('not a GrainHero prediction log')
+    (length,) = struct.unpack('<I', f.read(4))
+    return json.loads(f.read(length)), 8 + length
+
+
+def read_log(path):
+    """(header, records) for one log file; records is a read-only structured array."""
+    with open(path, 'rb') as f:
+        header, offset = _read_header(f)
+    dtype = record_dtype(len(header['features']), len(header['classes']))
+    # A crash mid-append can leave a partial last record; it is ignored
+    count = (os.path.getsize(path) - offset) // dtype.itemsize
+    if count == 0:
+        return header, np.empty(0, dtype)
+    return header, np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+
+
+def current_name(n_features):
+    return f'predictions-{n_features}f.ghpl'
+
+
+def log_files(directory, n_features=None):
+    """
+    Rotated files oldest first, then the current file, for one feature
+    layout, or for every layout (including predictions.ghpl files written
+    before per-layout names) when n_features is None.
+    """
+    prefix = f'predictions-{n_features}f' if n_features else 'predictions'
+    # '-' sorts before '.', so each layout's rotated files come before its current file
+    names = sorted(n for n in os.listdir(directory)
+                   if n.endswith('.ghpl') and n.startswith(prefix)
+                   and (n_features is None or n[len(prefix)] in '-.'))
+    return [os.path.join(directory, n) for n in names]
+
+
+def to_frame(header, records):
+    """Records as a DataFrame (one column per feature and class probability)."""
+    import pandas as pd
+    df = pd.DataFrame({
+        'timestamp': pd.to_datetime(records['timestamp'], unit='s'),
+        'grain': np.asarray(header['grains'], dtype=object)[records['grain']],
+        # Hashes are stored as 8 raw bytes ('S8' drops trailing zero bytes on access)
+        'model': [bytes(m).ljust(8, b'\0').hex() for m in records['model']],
+    })
+    for j, feature in enumerate(header['features']):
+        df[feature] = records['features'][:, j]
+    for j, label in enumerate(header['classes']):
+        df[f'p_{label}'] = records['probabilities'][:, j]
+    return df
+
+
+class PredictionLogger:
+    def __init__(self, directory, features, classes=CLASSES, max_bytes=DEFAULT_MAX_BYTES,
+                 max_files=DEFAULT_MAX_FILES, flush_interval=FLUSH_INTERVAL):
+        self.directory = directory
+        self.features = list(features)
+        self.classes = list(classes)
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.flush_interval = flush_interval
+        self.dtype = record_dtype(len(self.features), len(self.classes))
+        self.header = {
+            'format': FORMAT_VERSION, 'features': self.features, 'classes': self.classes,
+            'grains': GRAINS, 'record_bytes': self.dtype.itemsize,
+        }
+        self.written = 0
+        self.dropped = 0
+        self._grain_codes = {g: i for i, g in enumerate(GRAINS)}
+        self._pending = []
+        self._pending_rows = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def log(self, grain, model_hash, X, probabilities, class_labels):
+        """Queue a batch: X (n, features) and probabilities (n, len(class_labels))."""
+        X = np.atleast_2d(X)
+        probabilities = np.atleast_2d(probabilities)
+        rows = np.empty(len(X), self.dtype)
+        rows['timestamp'] = time.time()
+        grain = (grain or 'unknown').lower()
+        rows['grain'] = self._grain_codes.get(grain, self._grain_codes['other'])
+        rows['model'] = bytes.fromhex(model_hash)
+        rows['features'] = X
+        # Probabilities in self.classes order whatever order the model's classes are in
+        labels = [str(c) for c in class_labels]
+        rows['probabilities'] = np.nan
+        for j, label in enumerate(self.classes):
+            if label in labels:
+                rows['probabilities'][:, j] = probabilities[:, labels.index(label)]
+
+        with self._lock:
+            self._pending.append(rows)
+            self._pending_rows += len(rows)
+            while self._pending_rows > MAX_BUFFERED and len(self._pending) > 1:
+                dropped = self._pending.pop(0)
+                self._pending_rows -= len(dropped)
+                self.dropped += len(dropped)
+            if self._thread is None:
+                self._start()
+        if self._pending_rows >= MAX_PENDING:
+            self._wake.set()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name='prediction-log-flusher', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except OSError as exc:
+                print(f"prediction_logger: flush failed: {exc}", file=sys.stderr)
+
+    def flush(self):
+        """Append everything queued so far to the current log file."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending, self._pending_rows = self._pending, [], 0
+            if not pending:
+                return 0
+            data = np.concatenate(pending).tobytes()
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, current_name(len(self.features)))
+            with file_lock(path + '.lock'):
+                self._rotate_if_needed(path, len(data))
+                with open(path, 'ab') as f:
+                    if f.tell() == 0:
+                        header = json.dumps(self.header).encode()
+                        f.write(MAGIC + struct.pack('<I', len(header)) + header)
+                    f.write(data)
+            self.written += len(data) // self.dtype.itemsize
+            return len(data) // self.dtype.itemsize
+
+    def _rotate_if_needed(self, path, incoming):
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+        try:
+            with open(path, 'rb') as f:
+                header, offset = _read_header(f)
+            compatible = (header['features'] == self.features and header['classes'] == self.classes
+                          and header['grains'] == GRAINS)
+        except (ValueError, struct.error):
+            compatible, offset = False, 0
+        size = os.path.getsize(path)
+        if compatible and (size + incoming <= self.max_bytes or size <= offset):
+            return
+        n_features = len(self.features)
+        os.replace(path, os.path.join(self.directory,
+                                      f'predictions-{n_features}f-{datetime.now():%Y%m%d-%H%M%S-%f}.ghpl'))
+        rotated = [p for p in log_files(self.directory, n_features) if p != path]
+        for old in rotated[:max(0, len(rotated) - self.max_files)]:
+            os.remove(old)
+
+    def close(self):
+        """Stop the flusher and write what is left."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+
+
+def from_env(features, **kwargs):
+    """A PredictionLogger writing to $GRAINHERO_PREDICTION_LOG, or None when it is unset."""
+    directory = os.environ.get(LOG_DIR_ENV)
+    return PredictionLogger(directory, features, **kwargs) if directory else None
+
+
+def main(argv=None):
+    import argparse
+    import pandas as pd
+    parser = argparse.ArgumentParser(description='Inspect a GrainHero prediction log directory.')
+    parser.add_argument('directory', nargs='?', default=os.environ.get(LOG_DIR_ENV))
+    parser.add_argument('--grain')
+    parser.add_argument('--model', help='model hash (prefix)')
+    parser.add_argument('--tail', type=int, default=10, help='print the last N matching records')
+    parser.add_argument('--csv', help='write the matching records to this CSV')
+    args = parser.parse_args(argv)
+    if not args.directory or not os.path.isdir(args.directory):
+        parser.error('no log directory (pass one or set GRAINHERO_PREDICTION_LOG)')
+
+    frames = []
+    for path in log_files(args.directory):
+        header, records = read_log(path)
+        print(f"{os.path.basename(path)}: {len(records)} records, {os.path.getsize(path) / 1024:.1f} KiB")
+        df = to_frame(header, records)
+        if args.grain:
+            df = df[df['grain'] == args.grain.lower()]
+        if args.model:
+            df = df[df['model'].str.startswith(args.model.lower())]
+        frames.append(df)
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if df.empty:
+        print("No matching records")
+        return 0
+
+    print(f"\n{len(df)} records, {df['timestamp'].min()} .. {df['timestamp'].max()}")
+    print(df.groupby(['grain', 'model']).size().rename('records').to_string())
+    if args.tail:
+        print(f"\nLast {args.tail}:")
+        print(df.tail(args.tail).to_string(index=False))
+    if args.csv:
+        df.to_csv(args.csv, index=False)
+        print(f"\nWritten: {args.csv}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""
+GrainHero Profiling Hooks
+=========================
+Opt-in cProfile + tracemalloc capture around the prediction and training
+hot paths (predict_single, predict_batch, load_model,
+GrainEnsembleTrainer.train and the ML service handlers).
+
+Switched on by GRAINHERO_PROFILE_DIR=<dump dir> (or enable(dir), which the
+--profile-dir CLI flags call). Each profiled call writes three files:
+
+  <name>.<time>.<pid>.<seq>.pstats      cProfile stats (python -m pstats, snakeviz)
+  <name>.<time>.<pid>.<seq>.collapsed   collapsed stacks for flamegraph.pl /
+                                        speedscope, derived from cProfile's
+                                        caller edges (so approximate)
+  <name>.<time>.<pid>.<seq>.alloc.txt   top allocation sites (tracemalloc)
+
+plus one JSON line in <dump dir>/index.jsonl. GRAINHERO_PROFILE_EVERY=N
+profiles only every Nth call per hook (default 1), for busy services.
+
+When the switch is off @profiled returns the function itself, so there is no
+wrapper and no per-call cost. enable() instruments already-imported hooks
+in place (module globals and class attributes); references taken earlier
+with `from module import name` keep the unprofiled function.
+"""
+import cProfile
+import functools
+import itertools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+PROFILE_DIR_ENV = 'GRAINHERO_PROFILE_DIR'
+PROFILE_EVERY_ENV = 'GRAINHERO_PROFILE_EVERY'
+TOP_ALLOCATIONS = 25
+MAX_STACK_DEPTH = 64
+# Stack shares below this fraction of the profiled time are dropped (the
+# caller graph has exponentially many paths)
+MIN_STACK_SHARE = 1e-4
+
+_hooks = []
+_counters = {}
+# One profiled call at a time per process: tracemalloc is process-wide and
+# cProfile cannot nest, so concurrent and nested calls run unprofiled
+_profiling = threading.Lock()
+
+
+def dump_dir():
+    """The dump directory, or None when profiling is off."""
+    return os.environ.get(PROFILE_DIR_ENV) or None
+
+
+def _label(func):
+    filename, line, name = func
+    if filename == '~':
+        return name  # built-in, e.g. <method 'predict' of ...>
+    return f'{os.path.basename(filename)}:{name}:{line}'
+
+
+def collapsed_stacks(stats):
+    """
+    Flamegraph 'collapsed' lines (frame;frame;... microseconds) from cProfile
+    stats. cProfile keeps caller->callee totals, not full stacks, so each
+    function's time is split between its callers in proportion to the calls'
+    cumulative time. Paths worth less than MIN_STACK_SHARE of the total are
+    dropped.
+    """
+    children = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, (_, _, _, edge_ct) in callers.items():
+            if caller != func:
+                children.setdefault(caller, []).append((func, edge_ct))
+    roots = [f for f, (_, _, _, _, callers) in stats.stats.items()
+             if not any(c != f for c in callers)]
+    lines = {}
+    cutoff = sum(stats.stats[root][3] for root in roots) * MIN_STACK_SHARE
+
+    def walk(func, share, stack):
+        _, _, tt, ct, _ = stats.stats[func]
+        if ct <= 0 or share <= cutoff:
+            return
+        stack = stack + [_label(func)]
+        scale = share / ct
+        self_us = int(tt * scale * 1e6)
+        if self_us:
+            key = ';'.join(stack)
+            lines[key] = lines.get(key, 0) + self_us
+        if len(stack) >= MAX_STACK_DEPTH:
+            return
+        for child, edge_ct in children.get(func, ()):
+            if _label(child) not in stack:
+                walk(child, edge_ct * scale, stack)
+
+    for root in roots:
+        walk(root, stats.stats[root][3], [])
+    return [f'{stack} {us}' for stack, us in sorted(lines.items())]
+
+
+def _write_dump(directory, name, seq, profiler, snapshot, wall, peak, error):
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, f"{name}.{datetime.now():%Y%m%d-%H%M%S}.{os.getpid()}.{seq}")
+    profiler.dump_stats(stem + '.pstats')
+    stats = pstats.Stats(profiler)
+    with open(stem + '.collapsed', 'w') as f:
+        f.write('\n'.join(collapsed_stacks(stats)) + '\n')
+
+    top = snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+    with open(stem + '.alloc.txt', 'w') as f:
+        f.write(f"{name}: wall {wall * 1000:.1f} ms, traced peak {peak / 1024:.1f} KiB\n")
+        for i, stat in enumerate(top, 1):
+            frame = stat.traceback[0]
+            f.write(f"{i:3d}. {frame.filename}:{frame.lineno}  {stat.size / 1024:.1f} KiB  "
+                    f"({stat.count} blocks)\n")
+
+    record = {
+        'hook': name, 'seq': seq, 'pid': os.getpid(), 'timestamp': datetime.now().isoformat(),
+        'wall_ms': round(wall * 1000, 3), 'traced_peak_kb': round(peak / 1024, 1),
+        'total_calls': stats.total_calls, 'error': error, 'files': os.path.basename(stem) + '.*',
+    }
+    with open(os.path.join(directory, 'index.jsonl'), 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def _run_profiled(name, fn, args, kwargs):
+    directory = dump_dir()
+    counter = _counters.setdefault(name, itertools.count(1))
+    seq = next(counter)
+    every = max(1, int(os.environ.get(PROFILE_EVERY_ENV, 1) or 1))
+    # Nested hooks (predict_single -> load_model) are covered by the outer profile
+    if directory is None or (seq - 1) % every or not _profiling.acquire(blocking=False):
+        return fn(*args, **kwargs)
+
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    else:
+        tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    error = None
+    start = time.perf_counter()
+    try:
+        return profiler.runcall(fn, *args, **kwargs)
+    except BaseException as exc:
+        error = type(exc).__name__
+        raise
+    finally:
+        wall = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        if started_tracing:
+            tracemalloc.stop()
+        _profiling.release()
+        try:
+            _write_dump(directory, name, seq, profiler, snapshot, wall, peak, error)
+        except OSError as exc:
+            print(f"profiling_hooks: could not write dump for {name}: {exc}", file=sys.stderr)
+
+
+def _wrap(fn, name):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return _run_profiled(name, fn, args, kwargs)
+    wrapper.__profiled__ = True
+    return wrapper
+
+
+def profiled(name=None):
+    """
+    Decorator for a profiling hook. Returns `fn` unchanged when profiling is
+    off (enable() can still instrument it later).
+    """
+    def decorate(fn):
+        hook_name = name or fn.__qualname__
+        _hooks.append((fn.__module__, fn.__qualname__, hook_name))
+        return _wrap(fn, hook_name) if dump_dir() else fn
+    return decorate
+
+
+def enable(directory):
+    """Turn profiling on for this process and instrument the hooks already imported."""
+    os.environ[PROFILE_DIR_ENV] = os.path.abspath(directory)
+    for module_name, qualname, hook_name in _hooks:
+        owner = sys.modules.get(module_name)
+        *path, attr = qualname.split('.')
+        for part in path:
+            owner = getattr(owner, part, None)
+        current = getattr(owner, attr, None) if owner is not None else None
+        if current is None or getattr(current, '__profiled__', False):
+            continue
+        setattr(owner, attr, _wrap(current, hook_name))
+    return os.environ[PROFILE_DIR_ENV]
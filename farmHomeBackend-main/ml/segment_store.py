@@ -0,0 +1,310 @@
+"""
+GrainHero Segment Store
+=======================
+Append-only storage for manually added training records.
+
+Every add_new_data batch is written as its own CSV segment, and a manifest
+keeps the row count and columns of each segment, so appending costs
+O(batch) and counting rows is O(1) (no re-parsing of earlier data).
+The manifest also carries mergeable feature statistics of all stored rows
+(feature_stats.py), updated from each new batch alone.
+Compaction merges the oldest small segments into one file; it only ever
+rewrites a prefix of the segment list, so rows keep their order and
+row offsets (used by incremental training) stay valid.
+
+Safe across processes: manifest updates hold manifest.lock (file_lock.py)
+and replace the manifest atomically, so concurrent appenders never lose a
+segment. Readers hold segments.lock shared while they read segment files;
+merged-away files are only deleted while nobody holds it (otherwise they are
+kept as 'retired' until a later compaction), and at most one compaction
+runs at a time (compact.lock).
+
+Layout:
+  new_data_segments/manifest.json
+  new_data_segments/{manifest,segments,compact}.lock
+  new_data_segments/seg-000001.csv
+  new_data_segments/seg-000002.csv ...
+
+Compact manually:
+  python segment_store.py compact
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from file_lock import file_lock, atomic_write_json
+from feature_stats import FeatureStats
+from dataset_loader import LABEL_COLUMN, CLASS_COLUMN
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+SEGMENT_DIR = os.path.join(ML_DIR, 'new_data_segments')
+LEGACY_PATH = os.path.join(ML_DIR, 'new_training_data.csv')
+
+# Compact once this many segments exist; merged segments stop at this size
+COMPACT_THRESHOLD = 32
+TARGET_SEGMENT_ROWS = 100_000
+
+
+class SegmentStore:
+    """Append-only CSV segments with a manifest of row counts and schema."""
+
+    def __init__(self, root=SEGMENT_DIR, legacy_path=LEGACY_PATH):
+        self.root = root
+        self.legacy_path = legacy_path
+        self.manifest_path = os.path.join(root, 'manifest.json')
+        self._compactor = None
+
+    def _lock(self, name='manifest', **kwargs):
+        return file_lock(os.path.join(self.root, f'{name}.lock'), **kwargs)
+
+    # -- manifest -------------------------------------------------------
+    def _empty_manifest(self):
+        return {'schema': [], 'segments': [], 'total_rows': 0, 'next_id': 1}
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return self._empty_manifest()
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest):
+        # Compact: the feature statistics carry sketch centroids
+        atomic_write_json(self.manifest_path, manifest, separators=(',', ':'))
+
+    def _reserve_name(self, manifest):
+        name = f"seg-{manifest['next_id']:06d}.csv"
+        manifest['next_id'] += 1
+        return name
+
+    def _write_file(self, name, df):
+        """Write `df` to segment file `name` and return its manifest entry."""
+        path = os.path.join(self.root, name)
+        df.to_csv(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+        return {'file': name, 'rows': len(df), 'columns': list(df.columns), 'created': time.time()}
+
+    def _write_segment(self, manifest, df):
+        """Write `df` as a new segment file and return its manifest entry."""
+        return self._write_file(self._reserve_name(manifest), df)
+
+    def _migrate_legacy(self, manifest):
+        """Adopt an existing new_training_data.csv as the first segment."""
+        if manifest['segments'] or not self.legacy_path or not os.path.exists(self.legacy_path):
+            return manifest
+        legacy = pd.read_csv(self.legacy_path)
+        if len(legacy):
+            self._add_entry(manifest, self._write_segment(manifest, legacy), legacy)
+            self._save_manifest(manifest)
+        os.replace(self.legacy_path, self.legacy_path + '.migrated')
+        return manifest
+
+    @staticmethod
+    def _batch_stats(df):
+        """Statistics of the numeric feature columns over the labelled rows."""
+        if LABEL_COLUMN in df.columns:
+            df = df[df[LABEL_COLUMN].notna()]
+        stats = FeatureStats()
+        stats.update_frame(df, [c for c in df.columns
+                                if c != CLASS_COLUMN and pd.api.types.is_numeric_dtype(df[c])])
+        return stats
+
+    def _add_entry(self, manifest, entry, df=None):
+        manifest['segments'].append(entry)
+        manifest['total_rows'] += entry['rows']
+        manifest['schema'] += [c for c in entry['columns'] if c not in manifest['schema']]
+        if df is not None and ('stats' in manifest or len(manifest['segments']) == 1):
+            manifest['stats'] = FeatureStats.merged([manifest.get('stats'), self._batch_stats(df)]).to_dict()
+
+    def _manifest(self):
+        os.makedirs(self.root, exist_ok=True)
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            with self._lock():
+                return self._migrate_legacy(self._load_manifest())
+        return self._load_manifest()
+
+    # -- public API -----------------------------------------------------
+    def append(self, df):
+        """Store `df` as a new segment. Cost is proportional to len(df)."""
+        if len(df) == 0:
+            return 0
+        self._manifest()
+        with self._lock():
+            manifest = self._load_manifest()
+            self._add_entry(manifest, self._write_segment(manifest, df), df)
+            self._save_manifest(manifest)
+            return manifest['total_rows']
+
+    def count(self):
+        """Total stored rows, read from the manifest."""
+        if os.path.exists(self.manifest_path):
+            return self._load_manifest()['total_rows']
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            return self._manifest()['total_rows']
+        return 0
+
+    def stats(self):
+        """
+        FeatureStats of all stored rows, from the manifest. Stores written
+        before statistics were tracked are scanned once and backfilled.
+        """
+        manifest = self._manifest()
+        if 'stats' not in manifest and manifest['segments']:
+            with self._lock():
+                manifest = self._load_manifest()
+                if 'stats' not in manifest:
+                    with self.reading():
+                        manifest['stats'] = FeatureStats.merged(
+                            self._batch_stats(pd.read_csv(os.path.join(self.root, e['file'])))
+                            for e in manifest['segments']).to_dict()
+                    self._save_manifest(manifest)
+        return FeatureStats.from_dict(manifest.get('stats'))
+
+    def get_meta(self, key, default=None):
+        return self._load_manifest().get('meta', {}).get(key, default)
+
+    def set_meta(self, key, value):
+        """Store a JSON value alongside the segments in the manifest."""
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock():
+            manifest = self._load_manifest()
+            manifest.setdefault('meta', {})[key] = value
+            self._save_manifest(manifest)
+
+    @contextmanager
+    def reading(self):
+        """
+        Keep compaction from deleting segment files for the duration of the
+        block; wrap any code that resolves segment_paths() and then opens them.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock('segments', shared=True, timeout=None):
+            yield
+
+    def segment_paths(self, start_row=0):
+        """
+        (path, rows_to_skip) for the segments holding rows >= start_row, in
+        order, so callers can stream them without reading earlier segments.
+        """
+        manifest = self._manifest()
+        paths = []
+        offset = 0
+        for entry in manifest['segments']:
+            end = offset + entry['rows']
+            if end > start_row:
+                paths.append((os.path.join(self.root, entry['file']), max(0, start_row - offset)))
+            offset = end
+        return paths
+
+    def read(self, start_row=0):
+        """All rows from `start_row` on as one DataFrame (schema order)."""
+        manifest = self._manifest()
+        with self.reading():
+            frames = [pd.read_csv(path).iloc[skip:] for path, skip in self.segment_paths(start_row)]
+        if not frames:
+            return pd.DataFrame(columns=manifest['schema'])
+        return pd.concat(frames, ignore_index=True).reindex(columns=manifest['schema'])
+
+    def compact(self, target_rows=TARGET_SEGMENT_ROWS):
+        """
+        Merge runs of consecutive small segments (up to `target_rows` rows
+        each). Appends may continue while the merge is written; the manifest
+        is only swapped under the lock. Returns 0 without waiting if another
+        process is already compacting.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock('compact', blocking=False) as acquired:
+            if not acquired:
+                return 0
+            return self._compact(target_rows)
+
+    def _compact(self, target_rows):
+        self._purge_retired()
+        manifest = self._manifest()
+        runs, run, run_rows = [], [], 0
+        for entry in manifest['segments']:
+            if run and run_rows + entry['rows'] > target_rows:
+                runs.append(run)
+                run, run_rows = [], 0
+            run.append(entry)
+            run_rows += entry['rows']
+        runs.append(run)
+        runs = [r for r in runs if len(r) > 1]
+        if not runs:
+            return 0
+
+        merged = {}
+        for r in runs:
+            df = pd.concat([pd.read_csv(os.path.join(self.root, e['file'])) for e in r], ignore_index=True)
+            # Only the file name is reserved under the lock; the merge is
+            # written outside it so appenders are not held up
+            with self._lock():
+                current = self._load_manifest()
+                name = self._reserve_name(current)
+                self._save_manifest(current)
+            entry = self._write_file(name, df)
+            merged[r[0]['file']] = (entry, {e['file'] for e in r})
+
+        with self._lock():
+            current = self._load_manifest()
+            segments, replaced = [], set()
+            for entry in current['segments']:
+                if entry['file'] in merged:
+                    new_entry, files = merged[entry['file']]
+                    segments.append(new_entry)
+                    replaced |= files
+                elif entry['file'] not in replaced:
+                    segments.append(entry)
+            current['segments'] = segments
+            current['retired'] = sorted(set(current.get('retired', [])) | replaced)
+            self._save_manifest(current)
+
+        self._purge_retired()
+        return len(replaced)
+
+    def _purge_retired(self):
+        """
+        Delete merged-away segment files once no reader holds segments.lock.
+        If one does, they stay listed under 'retired' for the next compaction,
+        so a steady stream of readers cannot stall compaction.
+        """
+        with self._lock('segments', blocking=False) as acquired:
+            if not acquired:
+                return
+            with self._lock():
+                current = self._load_manifest()
+                for name in current.get('retired', []):
+                    try:
+                        os.remove(os.path.join(self.root, name))
+                    except OSError:
+                        pass
+                current['retired'] = []
+                self._save_manifest(current)
+
+    def maybe_compact(self, threshold=COMPACT_THRESHOLD):
+        """Start a background compaction once `threshold` segments exist."""
+        if len(self._load_manifest()['segments']) < threshold:
+            return None
+        if self._compactor is not None and self._compactor.is_alive():
+            return self._compactor
+        # Not a daemon thread: a short-lived CLI process waits for it on exit
+        self._compactor = threading.Thread(target=self.compact, name='segment-compaction')
+        self._compactor.start()
+        return self._compactor
+
+
+# Global instance
+segment_store = SegmentStore()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'compact':
+        merged = segment_store.compact()
+        print(f"Merged {merged} segment(s); {segment_store.count()} rows stored")
+    else:
+        manifest = segment_store._manifest()
+        print(f"{len(manifest['segments'])} segment(s), {manifest['total_rows']} rows")
@@ -0,0 +1,265 @@
+"""
+GrainHero Silo Trajectory Simulator
+===================================
+Per-silo sensor time series, as opposed to the i.i.d. rows of
+generate_per_grain.py. Every silo stores one grain from
+generate_per_grain.GRAINS and evolves hour by hour:
+
+  - Temperature:    silo baseline + diurnal cycle + AR(1) noise
+  - Humidity:       mean-reverting random walk, dipping when it is warm
+  - Grain_Moisture: relaxes towards the equilibrium moisture of the air
+  - Pest_Presence:  switches on at a random onset, sooner in warm, moist grain
+  - Storage_Days:   grows with elapsed time from a per-silo start age
+  - Airflow, Ambient_Light, Rainfall, Dew_Point as in the per-grain datasets
+
+Labels come from the per-grain thresholds (generate_per_grain.danger_score).
+Silos are simulated in vectorized blocks; each block of silos is a shard
+with its own random stream (SeedSequence keyed by seed and shard index), so
+shards run on a process pool and the output does not depend on the number
+of workers. Rows are time-major within a shard (all silos at hour t, then
+t + 1), i.e. in arrival order, and are streamed to CSV in chunks.
+
+This is the standard workload for throughput and latency benchmarks:
+standard_workload(rows) returns the first `rows` readings in memory.
+
+  python silo_simulator.py [--silos 5000] [--days 90] [--step-hours 1] [--workers 4]
+"""
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from generate_per_grain import GRAINS, LABELS, BASE_SEED, dew_point, danger_score, classify_codes, _rows_tag
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SILOS_PER_SHARD = 1000
+CHUNK_STEPS = 48
+START_TIME = np.datetime64('2025-01-01T00:00:00', 's')
+# Keeps simulator streams apart from the per-grain generator's (grain id, shard) keys
+STREAM_KEY = 100
+
+COLUMNS = ['Silo_ID', 'Timestamp', 'Temperature', 'Humidity', 'Storage_Days', 'Spoilage_Label', 'Grain_Type',
+           'Airflow', 'Dew_Point', 'Ambient_Light', 'Pest_Presence', 'Grain_Moisture', 'Rainfall']
+GRAIN_NAMES = list(GRAINS)
+
+
+def _grain_array(key):
+    return np.array([GRAINS[name][key] for name in GRAIN_NAMES], dtype=np.float64)
+
+
+class SiloBlock:
+    """State of a block of silos, advanced one time step at a time."""
+
+    def __init__(self, rng, first_silo, n_silos, step_hours=1.0):
+        self.rng = rng
+        self.step_hours = step_hours
+        self.silo_ids = np.arange(first_silo, first_silo + n_silos)
+        n = n_silos
+
+        self.grain = rng.integers(0, len(GRAIN_NAMES), n)
+        temp_range = np.array([GRAINS[name]['temp_range'] for name in GRAIN_NAMES], dtype=np.float64)
+        self.temp_lo, self.temp_hi = temp_range[self.grain, 0], temp_range[self.grain, 1]
+        self.temp_risky = _grain_array('temp_risky')[self.grain]
+        self.temp_base = rng.uniform(self.temp_lo + 5, self.temp_hi - 8)
+        self.temp_amp = rng.uniform(2, 7, n)
+        self.temp_noise = np.zeros(n)
+
+        self.hum_mean = rng.uniform(45, 85, n)
+        self.humidity = np.clip(self.hum_mean + rng.normal(0, 5, n), 10, 100)
+
+        self.moisture_safe = _grain_array('moisture_safe')[self.grain]
+        self.moisture = rng.uniform(self.moisture_safe - 3, _grain_array('moisture_risky')[self.grain])
+        # Hourly moisture exchange rate with the air
+        self.moisture_rate = rng.uniform(0.001, 0.004, n)
+
+        self.storage_start = rng.uniform(1, _grain_array('storage_max')[self.grain] / 2)
+        self.grain_type = _grain_array('grain_type_id')[self.grain].astype(np.int64)
+        self.airflow_base = rng.uniform(0.05, 1.5, n)
+        self.light_peak = rng.uniform(120, 200, n)
+        # Unit-rate exponential clock; pests appear once the accumulated hazard exceeds it
+        self.pest_clock = rng.exponential(1.0, n)
+        self.pest_hazard = np.zeros(n)
+
+        self.hours = 0.0
+
+    def step(self):
+        """Advance one step and return the readings as a dict of columns."""
+        rng, n, dt = self.rng, len(self.silo_ids), self.step_hours
+        self.hours += dt
+        hour_of_day = self.hours % 24
+        diurnal = np.sin(2 * math.pi * (hour_of_day - 9) / 24)
+
+        self.temp_noise = 0.9 * self.temp_noise + rng.normal(0, 0.4, n)
+        temperature = np.clip(self.temp_base + self.temp_amp * diurnal + self.temp_noise,
+                              self.temp_lo - 5, self.temp_hi + 5)
+
+        self.humidity += (0.02 * (self.hum_mean - self.humidity) - 0.8 * diurnal * dt
+                          + rng.normal(0, 0.6 * math.sqrt(dt), n))
+        self.humidity = np.clip(self.humidity, 10, 100)
+
+        # Equilibrium moisture content of cereal grain at this relative humidity
+        emc = 6 + 0.12 * self.humidity
+        self.moisture += self.moisture_rate * dt * (emc - self.moisture)
+
+        # Mean onset ~120 days, up to 5x sooner when warm and moist
+        warm = temperature > self.temp_risky
+        hazard_rate = (1 / (24 * 120)) * (1 + 2 * warm + 2 * (self.moisture > self.moisture_safe))
+        self.pest_hazard += hazard_rate * dt
+        pests = (self.pest_hazard >= self.pest_clock).astype(np.int64)
+
+        airflow = np.clip(self.airflow_base * (1 + rng.normal(0, 0.1, n)), 0.05, 1.5)
+        light = np.clip(20 + np.maximum(diurnal, 0) * self.light_peak, 20, 200)
+        raining = rng.random(n) < 0.03 * dt
+        rainfall = np.where(raining, rng.exponential(2, n), 0.0)
+
+        cols = {
+            'Silo_ID': self.silo_ids,
+            'Timestamp': np.full(n, START_TIME + np.timedelta64(int(self.hours * 3600), 's')),
+            'Temperature': np.round(temperature, 2),
+            'Humidity': np.round(self.humidity, 2),
+            'Storage_Days': (self.storage_start + self.hours / 24).astype(np.int64),
+            'Grain_Type': self.grain_type,
+            'Airflow': np.round(airflow, 3),
+            'Ambient_Light': np.round(light, 1),
+            'Pest_Presence': pests,
+            'Grain_Moisture': np.round(self.moisture, 2),
+            'Rainfall': np.round(rainfall, 2),
+        }
+        cols['Dew_Point'] = dew_point(cols['Temperature'], cols['Humidity'])
+
+        codes = np.zeros(n, dtype=np.int8)
+        for g, name in enumerate(GRAIN_NAMES):
+            mask = self.grain == g
+            if mask.any():
+                codes[mask] = classify_codes(danger_score({k: v[mask] for k, v in cols.items()},
+                                                          GRAINS[name]))
+        cols['Spoilage_Label'] = codes
+        return cols
+
+
+def shard_rng(shard, seed=BASE_SEED):
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(STREAM_KEY, shard)))
+
+
+def shard_bounds(n_silos, silos_per_shard=SILOS_PER_SHARD):
+    """(shard index, first silo, silos) for every shard."""
+    return [(shard, first, min(silos_per_shard, n_silos - first))
+            for shard, first in enumerate(range(0, n_silos, silos_per_shard))]
+
+
+def iter_shard(shard, first_silo, n_silos, steps, step_hours=1.0, seed=BASE_SEED, chunk_steps=CHUNK_STEPS):
+    """Yield one shard's readings as DataFrames of chunk_steps time steps."""
+    block = SiloBlock(shard_rng(shard, seed), first_silo, n_silos, step_hours)
+    for start in range(0, steps, chunk_steps):
+        batch = [block.step() for _ in range(min(chunk_steps, steps - start))]
+        frame = {col: np.concatenate([b[col] for b in batch]) for col in COLUMNS}
+        frame['Spoilage_Label'] = pd.Categorical.from_codes(frame['Spoilage_Label'], categories=LABELS)
+        yield pd.DataFrame(frame, columns=COLUMNS)
+
+
+def iter_readings(n_silos=SILOS_PER_SHARD, steps=24, step_hours=1.0, seed=BASE_SEED,
+                  silos_per_shard=SILOS_PER_SHARD):
+    """All readings of a simulation, shard after shard, as DataFrames."""
+    for shard, first, count in shard_bounds(n_silos, silos_per_shard):
+        yield from iter_shard(shard, first, count, steps, step_hours, seed)
+
+
+def standard_workload(rows=100_000, n_silos=SILOS_PER_SHARD, seed=BASE_SEED):
+    """
+    The first `rows` readings of an hourly simulation of n_silos silos: the
+    shared input for throughput and latency benchmarks.
+    """
+    steps = -(-rows // n_silos)
+    frames, total = [], 0
+    for df in iter_readings(n_silos, steps, seed=seed):
+        frames.append(df)
+        total += len(df)
+        if total >= rows:
+            break
+    return pd.concat(frames, ignore_index=True).iloc[:rows]
+
+
+def _write_shard(task):
+    """Pool worker: simulate one shard and stream it to `path`."""
+    shard, first, n_silos, steps, step_hours, seed, path = task
+    counts = np.zeros(len(LABELS), dtype=np.int64)
+    rows = 0
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', newline='') as f:
+        for i, df in enumerate(iter_shard(shard, first, n_silos, steps, step_hours, seed)):
+            counts += np.bincount(df['Spoilage_Label'].cat.codes, minlength=len(LABELS))
+            rows += len(df)
+            df.to_csv(f, index=False, header=(i == 0))
+    os.replace(tmp_path, path)
+    return shard, rows, counts
+
+
+def write_simulation(n_silos, days, step_hours=1.0, out_dir=SCRIPT_DIR, workers=1,
+                     silos_per_shard=SILOS_PER_SHARD, seed=BASE_SEED):
+    """
+    Simulate n_silos silos for `days` days into
+    silo_trajectories_<silos>_<days>d/part-NNNNN.csv (+ manifest.json).
+    Returns (directory, manifest).
+    """
+    steps = int(round(days * 24 / step_hours))
+    directory = os.path.join(out_dir, f'silo_trajectories_{_rows_tag(n_silos)}_{days}d')
+    os.makedirs(directory, exist_ok=True)
+    shards = shard_bounds(n_silos, silos_per_shard)
+    tasks = [(shard, first, count, steps, step_hours, seed, os.path.join(directory, f'part-{shard:05d}.csv'))
+             for shard, first, count in shards]
+
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_write_shard, tasks))
+    else:
+        results = [_write_shard(task) for task in tasks]
+
+    counts = sum(r[2] for r in results)
+    manifest = {
+        'silos': n_silos, 'days': days, 'step_hours': step_hours, 'steps': steps, 'seed': seed,
+        'rows': int(sum(r[1] for r in results)),
+        'shards': [{'path': os.path.basename(task[-1]), 'first_silo': task[1], 'silos': task[2],
+                    'rows': rows, 'counts': dict(zip(LABELS, shard_counts.tolist()))}
+                   for task, (_, rows, shard_counts) in zip(tasks, results)],
+        'counts': dict(zip(LABELS, counts.tolist())),
+    }
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return directory, manifest
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate per-silo sensor time series.')
+    parser.add_argument('--silos', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--step-hours', type=float, default=1.0)
+    parser.add_argument('--out-dir', default=SCRIPT_DIR)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='simulation processes (output is identical for any count)')
+    parser.add_argument('--silos-per-shard', type=int, default=SILOS_PER_SHARD)
+    parser.add_argument('--seed', type=int, default=BASE_SEED)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print(f"Simulating {args.silos:,} silos for {args.days} days "
+          f"({args.step_hours}h steps, {args.workers} worker(s))")
+    start = time.perf_counter()
+    directory, manifest = write_simulation(args.silos, args.days, args.step_hours, args.out_dir,
+                                           args.workers, args.silos_per_shard, args.seed)
+    elapsed = time.perf_counter() - start
+    total = manifest['rows']
+    for label, count in manifest['counts'].items():
+        print(f"  {label + ':':8s} {count:>10,}  ({count / total * 100:.1f}%)")
+    print(f"  ✅ {total:,} readings in {len(manifest['shards'])} shard(s): {directory} "
+          f"({elapsed:.1f}s, {total / elapsed:,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,12 @@ import numpy as np
 import json
 import os
 import sys
+import time
+
+from profiling_hooks import profiled
+from drift_monitor import drift_monitor
+import prediction_logger
+from model_footprint import estimator_memory, import_model_libraries
 
 ML_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -18,37 +24,57 @@ FEATURE_NAMES = [
     'Grain_Moisture', 'Rainfall'
 ]
 
+GRAIN_TYPES = ['rice', 'wheat', 'maize', 'sorghum', 'barley']
+
+# Set when GRAINHERO_PREDICTION_LOG is (see prediction_logger.py)
+prediction_log = prediction_logger.from_env(FEATURE_NAMES)
 
-def load_model(grain_type='rice'):
-    """Load ensemble model and label encoder for the given grain type."""
+
+def model_path(grain_type='rice', legacy=False):
+    """
+    The model file load_model() would use: (path, is_legacy), or (None, False)
+    if there is none.
+    """
     grain = grain_type.lower()
-    
-    # Try grain-specific model first, then fall back to default
+
+    # Try grain-specific model first, then fall back to the shared one
     ensemble_path = os.path.join(ML_DIR, f'{grain}_ensemble_model.pkl')
+    if not os.path.exists(ensemble_path):
+        ensemble_path = os.path.join(ML_DIR, 'ensemble_model.pkl')
+    if not legacy and os.path.exists(ensemble_path):
+        return ensemble_path, False
+
+    # Fall back to old model if ensemble doesn't exist yet
+    fallback_path = os.path.join(ML_DIR, 'smartbin_model.pkl')
+    if os.path.exists(fallback_path):
+        return fallback_path, True
+    return None, False
+
+
+@profiled()
+def load_model(grain_type='rice', legacy=False):
+    """
+    Load ensemble model and label encoder for the given grain type.
+    legacy=True loads smartbin_model.pkl even when an ensemble exists.
+    """
+    grain = grain_type.lower()
+    path, is_legacy = model_path(grain, legacy)
+    if path is None:
+        return None, None, None, False
+
     encoder_path = os.path.join(ML_DIR, f'{grain}_label_encoder.pkl')
     metadata_path = os.path.join(ML_DIR, f'{grain}_model_metadata.json')
 
     # Fallback to non-prefixed files
-    if not os.path.exists(ensemble_path):
-        ensemble_path = os.path.join(ML_DIR, 'ensemble_model.pkl')
     if not os.path.exists(encoder_path):
         encoder_path = os.path.join(ML_DIR, 'label_encoder.pkl')
     if not os.path.exists(metadata_path):
         metadata_path = os.path.join(ML_DIR, 'model_metadata.json')
 
-    # Fall back to old model if ensemble doesn't exist yet
-    if not os.path.exists(ensemble_path):
-        fallback_path = os.path.join(ML_DIR, 'smartbin_model.pkl')
-        if os.path.exists(fallback_path):
-            model = joblib.load(fallback_path)
-            encoder = None
-            if os.path.exists(encoder_path):
-                encoder = joblib.load(encoder_path)
-            return model, encoder, None, True  # True = legacy mode
-        return None, None, None, False
-
-    model = joblib.load(ensemble_path)
+    model = joblib.load(path)
     encoder = joblib.load(encoder_path) if os.path.exists(encoder_path) else None
+    if is_legacy:
+        return model, encoder, None, True  # True = legacy mode
 
     metadata = None
     if os.path.exists(metadata_path):
@@ -58,6 +84,133 @@ def load_model(grain_type='rice'):
     return model, encoder, metadata, False
 
 
+def memory_report(grain_types=GRAIN_TYPES, legacy=False):
+    """
+    Load each grain's model (keeping earlier ones resident, as a service
+    holding every grain would) and report its serialized size, the measured
+    RSS growth of this process on load, and the per-estimator breakdown.
+    Grains that share a model file are loaded once.
+    """
+    from training_profiler import current_rss_mb
+    import_model_libraries()
+
+    resident, report = {}, {}
+    for grain in grain_types:
+        path, is_legacy = model_path(grain, legacy)
+        if path is None:
+            report[grain] = {'error': 'no model file'}
+            continue
+        entry = {'model_file': os.path.basename(path), 'legacy': is_legacy,
+                 'serialized_bytes': os.path.getsize(path)}
+        if path in resident:
+            entry['shared_with'] = resident[path]['grain']
+            entry['rss_delta_bytes'] = 0
+        else:
+            rss_before = current_rss_mb()
+            start = time.perf_counter()
+            model = joblib.load(path)
+            entry['load_seconds'] = round(time.perf_counter() - start, 3)
+            entry['rss_delta_bytes'] = int(max(0.0, current_rss_mb() - rss_before) * 1024 * 1024)
+            entry['estimators'] = estimator_memory(model)
+            resident[path] = {'grain': grain, 'model': model}
+        report[grain] = entry
+    report['process_rss_bytes'] = int(current_rss_mb() * 1024 * 1024)
+    return report
+
+
+def feature_matrix(records, metadata=None):
+    """
+    Build the (n, 9) feature array in FEATURE_NAMES order; missing readings
+    get the training-set medians recorded with the model (0 for older models).
+    """
+    defaults = (metadata or {}).get('feature_defaults', {})
+    fills = [float(defaults.get(f, 0.0)) for f in FEATURE_NAMES]
+    X = np.empty((len(records), len(FEATURE_NAMES)), dtype=np.float64)
+    for i, record in enumerate(records):
+        for j, f in enumerate(FEATURE_NAMES):
+            val = record.get(f)
+            X[i, j] = float(val) if val is not None else fills[j]
+    return X
+
+
+def observe_drift(grain_type, X, metadata):
+    """Count readings into the grain's drift histograms (models with a drift reference)."""
+    drift_monitor.update(grain_type.lower(), X, (metadata or {}).get('drift_reference'), FEATURE_NAMES)
+
+
+def log_predictions(grain_type, is_legacy, X, proba, class_labels, records=None):
+    """
+    Queue readings and probabilities for the prediction log, tagged with the
+    model file's hash, and add the predictions for `records` that carry a
+    silo_id to the online evaluation log (online_evaluation.py).
+    """
+    silos = [r.get('silo_id') for r in records or []]
+    if prediction_log is None and not any(silos):
+        return
+    path, _ = model_path(grain_type, legacy=is_legacy)
+    model_hash = prediction_logger.model_fingerprint(
+        path, cache_dir=prediction_log.directory if prediction_log else None)
+    if prediction_log is not None:
+        prediction_log.log(grain_type, model_hash, X, proba, class_labels)
+    if any(silos):
+        log_for_evaluation(grain_type, model_hash, silos, np.atleast_2d(proba), class_labels)
+
+
+def log_for_evaluation(grain_type, model_version, silos, proba, class_labels):
+    """Append predictions for the readings with a silo id, to be matched to inspection labels later."""
+    import sqlite3
+    # Imported here: pandas is only needed when there is something to log
+    from online_evaluation import online_evaluator
+    best = proba.argmax(axis=1)
+    now = time.time()
+    try:
+        online_evaluator.log_predictions([{
+            'silo_id': str(silo), 'timestamp': now, 'grain': grain_type, 'model_version': model_version,
+            'prediction': str(class_labels[best[i]]), 'confidence': float(proba[i, best[i]]),
+        } for i, silo in enumerate(silos) if silo])
+    except (OSError, sqlite3.Error) as exc:
+        print(f"online evaluation log failed: {exc}", file=sys.stderr)
+
+
+@profiled()
+def predict_batch(records, grain_type='rice', legacy=False, loaded=None):
+    """
+    Predict spoilage for many readings with one model load and one
+    predict_proba call. `loaded` is a load_model() result to reuse.
+
+    Returns a list of dicts with prediction, confidence and probabilities
+    (no per-model breakdown).
+    """
+    model, encoder, metadata, is_legacy = loaded or load_model(grain_type, legacy)
+    if model is None:
+        raise FileNotFoundError(f'No model found for {grain_type}. Please retrain the model first.')
+    if len(records) == 0:
+        return []
+
+    X = feature_matrix(records, metadata)
+    observe_drift(grain_type, X, metadata)
+    proba = model.predict_proba(X)
+    if encoder is not None:
+        class_labels = [str(c) for c in encoder.classes_]
+    elif hasattr(model, 'classes_'):
+        class_labels = [str(c) for c in model.classes_]
+    else:
+        class_labels = ['Safe', 'Risky', 'Spoiled']
+    log_predictions(grain_type, is_legacy, X, proba, class_labels, records)
+    best = proba.argmax(axis=1)
+    confidence = np.round(proba.max(axis=1) * 100, 1)
+    percent = np.round(proba * 100, 1)
+    model_type = 'legacy_single' if is_legacy else 'ensemble'
+
+    return [{
+        'prediction': class_labels[best[i]],
+        'confidence': float(confidence[i]),
+        'model_type': model_type,
+        'probabilities': dict(zip(class_labels, percent[i].tolist())),
+    } for i in range(len(X))]
+
+
+@profiled()
 def predict_single(features_dict, grain_type='rice'):
     """
     Predict spoilage for a single reading.
@@ -80,23 +233,26 @@ def predict_single(features_dict, grain_type='rice'):
             'grain_type': grain_type
         }
 
-    # Build the feature array in correct order
-    feature_values = []
-    for f in FEATURE_NAMES:
-        val = features_dict.get(f, 0)
-        feature_values.append(float(val) if val is not None else 0.0)
-
-    X = np.array([feature_values])
+    X = feature_matrix([features_dict], metadata)
+    observe_drift(grain_type, X, metadata)
 
     if is_legacy:
         # Old single-model path
         pred = model.predict(X)
         pred_label = pred[0] if isinstance(pred[0], str) else str(pred[0])
+        proba = None
         try:
             proba = model.predict_proba(X)[0]
             confidence = float(np.max(proba))
         except:
             confidence = 0.0
+        if proba is not None:
+            # Class names in predict_proba column order, as in predict_batch
+            if encoder is not None:
+                class_labels = [str(c) for c in encoder.classes_]
+            else:
+                class_labels = [str(c) for c in getattr(model, 'classes_', ['Safe', 'Risky', 'Spoiled'])]
+            log_predictions(grain_type, is_legacy, X, proba, class_labels, [features_dict])
 
         return {
             'prediction': pred_label,
@@ -113,11 +269,12 @@ def predict_single(features_dict, grain_type='rice'):
     proba = model.predict_proba(X)[0]
     class_labels = list(encoder.classes_) if encoder else ['Safe', 'Risky', 'Spoiled']
     confidence = float(np.max(proba))
+    log_predictions(grain_type, is_legacy, X, proba, class_labels, [features_dict])
 
     # Get per-model breakdown
     model_breakdown = []
     model_names = ['XGBoost', 'RandomForest', 'LightGBM']
-    for i, (name, estimator) in enumerate(model.estimators_):
+    for i, (name, estimator) in enumerate(model.named_estimators_.items()):
         est_proba = estimator.predict_proba(X)[0]
         est_pred_idx = int(np.argmax(est_proba))
         est_pred_label = encoder.inverse_transform([est_pred_idx])[0] if encoder else str(est_pred_idx)
@@ -152,6 +309,37 @@ def get_model_info():
 
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='GrainHero ensemble predictor.')
+    parser.add_argument('reading', nargs='?',
+                        help='JSON object of feature values: print its prediction as JSON and exit '
+                             '(how services/aiSpoilageService.js calls this script)')
+    parser.add_argument('--grain', default='rice', choices=GRAIN_TYPES,
+                        help='grain model used for READING (default: rice)')
+    parser.add_argument('--memory', nargs='*', metavar='GRAIN',
+                        help='print the resident memory report for these grains (default: all) and exit')
+    parser.add_argument('--legacy', action='store_true', help='report smartbin_model.pkl instead')
+    parser.add_argument('--drift', nargs='*', metavar='GRAIN',
+                        help='print the feature drift scores for these grains (default: all) and exit')
+    args = parser.parse_args()
+
+    if args.drift is not None:
+        print(json.dumps(drift_monitor.stored_scores(args.drift), indent=2))
+        sys.exit(0)
+
+    if args.memory is not None:
+        report = memory_report(args.memory or GRAIN_TYPES, legacy=args.legacy)
+        print(json.dumps(report, indent=2))
+        sys.exit(0)
+
+    if args.reading is not None:
+        try:
+            reading = json.loads(args.reading)
+        except ValueError as e:
+            parser.error(f'READING is not valid JSON: {e}')
+        print(json.dumps(predict_single(reading, args.grain)))
+        sys.exit(0)
+
     # Quick test
     test_reading = {
         'Temperature': 32.5,
@@ -0,0 +1,118 @@
+"""
+GrainHero Ingestion Stress Test
+===============================
+Runs many DataManager appenders in parallel, each as its own Python process
+started the way the Node routes start them (`python -c "from data_manager
+import ..."`), plus readers that stream the segments while background
+compaction runs. Afterwards every record must be present exactly once and
+data_log.json must hold one entry per batch.
+
+Works in a scratch directory; the real ml/ data files are not touched.
+
+  python stress_ingest.py [--workers 16] [--batches 10] [--batch-size 25] [--readers 2]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WRITER = """
+import sys
+from data_manager import DataManager
+root, worker, batches, size = sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4])
+dm = DataManager(root)
+for b in range(batches):
+    records = [{
+        'Record_ID': f'{worker}-{b}-{i}', 'Temperature': 25.0 + i % 7, 'Humidity': 60.0,
+        'Grain_Moisture': 13.0, 'Dew_Point': 16.0, 'Storage_Days': float(b), 'Airflow': 1.2,
+        'Ambient_Light': 100.0, 'Pest_Presence': 0, 'Rainfall': 0.0, 'Spoilage_Label': 'Safe',
+    } for i in range(size)]
+    if not dm.add_new_data(records):
+        sys.exit(1)
+"""
+
+READER = """
+import sys, time
+from data_manager import DataManager
+root, seconds = sys.argv[1], float(sys.argv[2])
+dm = DataManager(root)
+deadline = time.time() + seconds
+reads = last = 0
+while time.time() < deadline:
+    df = dm.segments.read()
+    ids = df['Record_ID'] if 'Record_ID' in df.columns else []
+    if len(set(ids)) != len(ids) or len(df) < last:
+        print(f'inconsistent read: {len(df)} rows, {len(set(ids))} unique, previous {last}')
+        sys.exit(1)
+    last = len(df)
+    reads += 1
+print(f'reads={reads}')
+"""
+
+
+def _spawn(code, *args):
+    return subprocess.Popen([sys.executable, '-c', code, *map(str, args)], cwd=ML_DIR,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+
+def run(workers, batches, batch_size, readers, root):
+    from data_manager import DataManager
+
+    start = time.perf_counter()
+    procs = [_spawn(WRITER, root, w, batches, batch_size) for w in range(workers)]
+    procs += [_spawn(READER, root, 5) for _ in range(readers)]
+    failed = []
+    for proc in procs:
+        output, _ = proc.communicate()
+        if proc.returncode != 0:
+            failed.append(output.strip().splitlines()[-5:])
+    elapsed = time.perf_counter() - start
+
+    dm = DataManager(root)
+    df = dm.segments.read()
+    expected = {f'{w}-{b}-{i}' for w in range(workers) for b in range(batches) for i in range(batch_size)}
+    ids = df['Record_ID'].tolist()
+    with open(dm.data_log_path) as f:
+        additions = json.load(f)['additions']
+    manifest = dm.segments._load_manifest()
+
+    checks = {
+        'processes_ok': not failed,
+        'manifest_total': manifest['total_rows'] == len(expected),
+        'rows_read': len(ids) == len(expected),
+        'no_duplicates': len(set(ids)) == len(ids),
+        'no_lost_records': set(ids) == expected,
+        'log_entries': len(additions) == workers * batches,
+        'log_final_total': max(a['total_new_records'] for a in additions) == len(expected),
+        'stats_rows': dm.segments.stats().rows == len(expected),
+    }
+    print(f"{workers} writers x {batches} batches x {batch_size} rows, {readers} reader(s): "
+          f"{elapsed:.1f}s, {len(manifest['segments'])} segment(s) left after compaction")
+    for name, ok in checks.items():
+        print(f"   {'PASS' if ok else 'FAIL'}  {name}")
+    for output in failed:
+        print("   process failed:\n      " + "\n      ".join(output))
+    return all(checks.values())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Concurrent ingestion stress test for DataManager.')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--batches', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=25)
+    parser.add_argument('--readers', type=int, default=2)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ML_DIR)
+    root = tempfile.mkdtemp(prefix='grainhero_stress_')
+    try:
+        ok = run(args.workers, args.batches, args.batch_size, args.readers, root)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    sys.exit(0 if ok else 1)
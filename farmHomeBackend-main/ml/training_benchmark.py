@@ -0,0 +1,271 @@
+"""
+GrainHero Training Benchmark
+============================
+How retraining cost scales with data size. Runs GrainEnsembleTrainer
+('ensemble') and SmartBinModelTrainer ('smartbin') with fixed seeds and a
+fixed Optuna trial count on datasets of 1k, 10k, 100k and 1M rows, and
+records per-phase wall time, CPU time and peak RSS (training_profiler) plus
+the final holdout accuracy.
+
+Datasets are derived from {grain}_spoilage_10k.csv with --seed: smaller
+sizes are a random subsample; larger sizes keep every base row and are
+topped up with rows from the vectorized generator (generate_per_grain),
+rather than repeating rows, which would leak duplicates into the holdout.
+Every case runs in its own Python process (so peak memory is per case) and
+in a scratch directory; the published models and the column cache under
+ml/ are not touched.
+
+Results are written as JSON together with a log-log scaling exponent per
+trainer (1.0 = linear in rows). --baseline compares against a stored run and
+exits with status 1 when a case's total wall time or peak RSS grows by more
+than --threshold, or its accuracy drops by more than --accuracy-drop.
+
+  python training_benchmark.py [--trainers ensemble smartbin] [--sizes 1000 10000]
+                               [--trials 5] [--baseline benchmark_results/training_baseline.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from inference_benchmark import RESULTS_DIR, environment
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+TRAINERS = ['ensemble', 'smartbin']
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+DEFAULT_OUTPUT = os.path.join(RESULTS_DIR, 'training.json')
+DEFAULT_SEED = 42
+RESULT_MARKER = '__TRAINING_CASE_JSON__'
+
+
+def build_dataset(grain, rows, path, seed=DEFAULT_SEED):
+    """Write a `rows`-row dataset for `grain` to `path` (see module docstring)."""
+    from generate_per_grain import GRAINS, COLUMNS, generate_grain_dataset
+
+    base_path = os.path.join(ML_DIR, f'{grain}_spoilage_10k.csv')
+    base = pd.read_csv(base_path) if os.path.exists(base_path) else pd.DataFrame(columns=COLUMNS)
+    if rows <= len(base):
+        rng = np.random.default_rng(seed)
+        df = base.iloc[np.sort(rng.choice(len(base), size=rows, replace=False))]
+    else:
+        extra = generate_grain_dataset(grain, GRAINS[grain], rows - len(base), seed=seed)
+        df = pd.concat([base, extra[base.columns] if len(base) else extra], ignore_index=True)
+    df.to_csv(path, index=False)
+    return len(df)
+
+
+def _train_ensemble(path, grain, trials):
+    from ensemble_train import GrainEnsembleTrainer
+    trainer = GrainEnsembleTrainer(grain_type=grain, dataset_path=path)
+    with trainer.phase('load_data'):
+        X_train, X_test, y_train, y_test = trainer.load_data()
+    metrics, _ = trainer.train(X_train, X_test, y_train, y_test, n_tuning_trials=trials)
+    return trainer, metrics['Ensemble'], len(X_train)
+
+
+def _train_smartbin(path, grain, trials):
+    from sklearn.model_selection import train_test_split
+    from columnar_cache import columnar_cache
+    from dataset_loader import encode_labels
+    from enhanced_train import SmartBinModelTrainer
+    trainer = SmartBinModelTrainer()
+    with trainer.phase('load_data'):
+        # Same split as load_and_preprocess_data, minus the DataManager sources
+        X, labels, _ = columnar_cache.load(path, trainer.feature_names, verbose=False)
+        y = encode_labels(trainer.label_encoder, labels)
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=0.2, random_state=trainer.random_state, stratify=y
+        )
+    with trainer.phase('tuning_XGBoost'):
+        best_params = trainer.hyperparameter_tuning(X_train, y_train, n_trials=trials)
+    metrics = trainer.train_model(X_train, X_test, y_train, y_test, best_params)
+    return trainer, metrics, len(X_train)
+
+
+def run_case(trainer_name, grain, rows, trials, seed=DEFAULT_SEED):
+    """Train once in a scratch directory (in this process) and return the measurements."""
+    import optuna
+    from columnar_cache import columnar_cache
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+    workdir = tempfile.mkdtemp(prefix='grainhero_train_bench_')
+    columnar_cache.root = os.path.join(workdir, 'column_cache')
+    try:
+        path = os.path.join(workdir, f'{grain}_{rows}.csv')
+        build_start = time.perf_counter()
+        build_dataset(grain, rows, path, seed)
+        build_seconds = time.perf_counter() - build_start
+
+        train = _train_ensemble if trainer_name == 'ensemble' else _train_smartbin
+        start = time.perf_counter()
+        trainer, metrics, train_rows = train(path, grain, trials)
+        wall = time.perf_counter() - start
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    phases = trainer.profiler.phases
+    return {
+        'trainer': trainer_name,
+        'grain': grain,
+        'rows': rows,
+        'train_rows': train_rows,
+        'trials': trials,
+        'dataset_build_s': round(build_seconds, 3),
+        'total_wall_s': round(wall, 3),
+        'total_cpu_s': round(sum(p['cpu_s'] for p in phases.values()), 3),
+        'peak_rss_mb': max((p['peak_rss_mb'] for p in phases.values()), default=None),
+        'accuracy': round(float(metrics['accuracy']), 4),
+        'f1_score': round(float(metrics['f1_score']), 4),
+        'cv_mean': metrics.get('cv_mean'),
+        'phases': phases,
+    }
+
+
+def _spawn_case(trainer_name, grain, rows, trials, seed, timeout=None):
+    cmd = [sys.executable, os.path.abspath(__file__), '--case', trainer_name, grain, str(rows),
+           '--trials', str(trials), '--seed', str(seed)]
+    try:
+        proc = subprocess.run(cmd, cwd=ML_DIR, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return None, f'timed out after {timeout}s'
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):]), None
+    tail = (proc.stderr or proc.stdout).strip().splitlines()[-5:]
+    return None, 'failed:\n      ' + '\n      '.join(tail)
+
+
+def scaling_exponents(results):
+    """Slope of log(total wall time) against log(rows) per trainer."""
+    exponents = {}
+    for trainer_name in sorted({r['trainer'] for r in results.values()}):
+        points = sorted((r['rows'], r['total_wall_s']) for r in results.values()
+                        if r['trainer'] == trainer_name and r['total_wall_s'] > 0)
+        if len(points) >= 2:
+            rows, wall = np.log(np.array(points, dtype=np.float64)).T
+            exponents[trainer_name] = round(float(np.polyfit(rows, wall, 1)[0]), 3)
+    return exponents
+
+
+def run(trainers, grain, sizes, trials, seed=DEFAULT_SEED, case_timeout=None):
+    results, skipped = {}, []
+    for trainer_name in trainers:
+        for rows in sizes:
+            key = f'{trainer_name}/{grain}/{rows}'
+            print(f"{key} ...", flush=True)
+            result, error = _spawn_case(trainer_name, grain, rows, trials, seed, case_timeout)
+            if result is None:
+                skipped.append(f'{key}: {error}')
+                print(f"   {error}")
+                continue
+            results[key] = result
+            print(f"   wall={result['total_wall_s']:9.2f}s  cpu={result['total_cpu_s']:9.2f}s  "
+                  f"peak={result['peak_rss_mb']:8.1f}MB  acc={result['accuracy']:.4f}")
+            for name, p in result['phases'].items():
+                print(f"      {name:22s} wall={p['wall_s']:8.2f}s  peak={p['peak_rss_mb']:8.1f}MB")
+    return results, skipped
+
+
+def compare(results, baseline, threshold=0.2, accuracy_drop=0.01):
+    """Cases whose wall time or peak RSS grew, or accuracy fell, beyond the limits."""
+    regressions = []
+    for key, current in results.items():
+        before = baseline.get('results', {}).get(key)
+        if before is None:
+            continue
+        reasons = []
+        for field in ('total_wall_s', 'peak_rss_mb'):
+            if before.get(field) and current.get(field) and current[field] / before[field] - 1 > threshold:
+                reasons.append(f"{field} {before[field]} -> {current[field]}")
+        if before['accuracy'] - current['accuracy'] > accuracy_drop:
+            reasons.append(f"accuracy {before['accuracy']} -> {current['accuracy']}")
+        if reasons:
+            regressions.append({'case': key, 'reasons': reasons})
+    return regressions
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark GrainHero training cost against dataset size.')
+    parser.add_argument('--trainers', nargs='+', default=TRAINERS, choices=TRAINERS)
+    parser.add_argument('--grain', default='wheat',
+                        choices=['rice', 'wheat', 'maize', 'sorghum', 'barley'])
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES)
+    parser.add_argument('--trials', type=int, default=5, help='Optuna trials per tuned model')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='dataset sampling/generation seed')
+    parser.add_argument('--case-timeout', type=float, metavar='SECONDS',
+                        help='give up on a single case after this long')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='where to write the results JSON')
+    parser.add_argument('--baseline', metavar='PATH', help='compare against this results JSON')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='also write the results to --baseline (default benchmark_results/training_baseline.json)')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative wall-time/peak-RSS growth counted as a regression')
+    parser.add_argument('--accuracy-drop', type=float, default=0.01,
+                        help='absolute accuracy drop counted as a regression')
+    parser.add_argument('--case', nargs=3, metavar=('TRAINER', 'GRAIN', 'ROWS'), help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.case:
+        trainer_name, grain, rows = args.case
+        result = run_case(trainer_name, grain, int(rows), args.trials, args.seed)
+        print(RESULT_MARKER + json.dumps(result, default=str))
+        return 0
+
+    results, skipped = run(args.trainers, args.grain, args.sizes, args.trials, args.seed, args.case_timeout)
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'config': {
+            'trainers': args.trainers, 'grain': args.grain, 'sizes': args.sizes,
+            'trials': args.trials, 'seed': args.seed,
+        },
+        'environment': environment(),
+        'results': results,
+        'scaling_exponent': scaling_exponents(results),
+        'skipped': skipped,
+    }
+    for trainer_name, exponent in report['scaling_exponent'].items():
+        print(f"\n{trainer_name}: wall time ~ rows^{exponent}")
+
+    status = 0
+    if args.baseline and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.accuracy_drop)
+        report['baseline'] = {'path': args.baseline, 'threshold': args.threshold,
+                              'accuracy_drop': args.accuracy_drop,
+                              'timestamp': baseline.get('timestamp'), 'regressions': regressions}
+        print(f"\nCompared with {args.baseline} ({baseline.get('timestamp')}):")
+        for r in regressions:
+            print(f"   REGRESSION {r['case']}: {'; '.join(r['reasons'])}")
+        if not regressions:
+            print("   no regressions")
+        status = 1 if regressions else 0
+
+    _write_json(args.output, report)
+    print(f"\nResults: {args.output}")
+    if args.save_baseline:
+        path = args.baseline or os.path.join(RESULTS_DIR, 'training_baseline.json')
+        _write_json(path, report)
+        print(f"Baseline: {path}")
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+GrainHero Training Budget
+=========================
+Wall-clock budget for a training run (--time-budget SECONDS).
+
+A fixed fraction of the budget is reserved for final fits and publishing the
+model; the rest is shared by the tuning phases. Tuning time a phase does not
+use rolls over to the phases after it. Every phase records how much time it
+was allotted and how much it used, for the model metadata.
+
+Phases that the deadline skipped or stopped early are recorded with
+cut_short(); a run that was cut short is published but not stored in the
+training cache, so the next retrain on the same data finishes the work.
+"""
+import time
+from contextlib import contextmanager
+
+
+class TimeBudget:
+    """Tracks a wall-clock deadline and per-phase usage."""
+
+    def __init__(self, seconds, reserve=0.3):
+        self.seconds = float(seconds)
+        self.reserve = reserve
+        self.start = time.monotonic()
+        self.deadline = self.start + self.seconds
+        self.tuning_deadline = self.start + self.seconds * (1 - reserve)
+        self.phases = {}
+        self.truncated = []
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+    def tuning_allowance(self, phases_left):
+        """Seconds the next tuning phase may use, sharing what is left evenly."""
+        left = max(0.0, self.tuning_deadline - time.monotonic())
+        return left / max(1, phases_left)
+
+    def can_afford(self, seconds):
+        """True if `seconds` of work still fits before the deadline."""
+        return self.remaining() >= seconds
+
+    @contextmanager
+    def phase(self, name, allotted=None):
+        """Time a named phase; `allotted` is the share it was given, if any."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = {
+                'allotted': round(allotted, 2) if allotted is not None else None,
+                'used': round(time.monotonic() - start, 2),
+            }
+
+    def skip(self, name, reason):
+        self.phases[name] = {'allotted': None, 'used': 0.0, 'skipped': reason}
+
+    def cut_short(self, name, reason):
+        """Record that the deadline skipped phase `name` or stopped it early."""
+        entry = self.phases.setdefault(name, {'allotted': None, 'used': 0.0, 'skipped': reason})
+        entry['cut_short'] = reason
+        self.truncated.append(name)
+
+    @property
+    def complete(self):
+        """True if no phase was skipped or stopped early because of the deadline."""
+        return not self.truncated
+
+    def report(self):
+        used = self.elapsed()
+        return {
+            'seconds': self.seconds,
+            'used': round(used, 2),
+            'used_fraction': round(used / self.seconds, 3) if self.seconds else None,
+            'phases': self.phases,
+            'cut_short': self.truncated,
+        }
+
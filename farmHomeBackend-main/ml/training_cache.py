@@ -0,0 +1,136 @@
+"""
+GrainHero Training Cache
+========================
+Content-addressed store of trained model artifacts under ml/model_store/.
+
+The cache key is a SHA-256 over the training dataset bytes, the feature list,
+the random seed and the training parameters. When a retrain is requested with
+inputs identical to a previous run, the stored artifacts are published
+directly instead of re-running tuning and training.
+
+Layout:
+  model_store/<key>/model.pkl
+  model_store/<key>/label_encoder.pkl
+  model_store/<key>/metadata.json
+  model_store/index.json            (hit/miss counters + last-used times)
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_DIR = os.path.join(ML_DIR, 'model_store')
+CHUNK_SIZE = 1 << 20
+
+
+class TrainingCache:
+    """Content-addressed artifact store keyed by training inputs."""
+
+    def __init__(self, root=STORE_DIR, max_entries=20):
+        self.root = root
+        self.max_entries = max_entries
+        self.index_path = os.path.join(root, 'index.json')
+
+    def compute_key(self, dataset_paths, features, seed, params):
+        """Hash dataset contents plus the training configuration."""
+        digest = hashlib.sha256()
+        for path in dataset_paths:
+            digest.update(os.path.basename(path).encode())
+            if not os.path.exists(path):
+                digest.update(b'<missing>')
+                continue
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+        config = {'features': list(features), 'seed': seed, 'params': params}
+        digest.update(json.dumps(config, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def _load_index(self):
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path) as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return {'hits': 0, 'misses': 0, 'entries': {}}
+
+    def _save_index(self, index):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def lookup(self, key):
+        """
+        Return the stored artifact paths for `key`, or None on a miss.
+        Hit/miss counters are updated either way.
+        """
+        index = self._load_index()
+        entry_dir = self._entry_dir(key)
+        files = index['entries'].get(key, {}).get('files')
+        hit = bool(files) and all(os.path.exists(os.path.join(entry_dir, name)) for name in files.values())
+
+        if hit:
+            index['hits'] += 1
+            index['entries'][key]['last_used'] = time.time()
+        else:
+            index['misses'] += 1
+            index['entries'].pop(key, None)
+        self._save_index(index)
+
+        if not hit:
+            return None
+        return {role: os.path.join(entry_dir, name) for role, name in files.items()}
+
+    def stats(self):
+        index = self._load_index()
+        return {'hits': index['hits'], 'misses': index['misses'], 'entries': len(index['entries'])}
+
+    def store(self, key, artifacts):
+        """Copy `artifacts` ({role: path}) into the store under `key`."""
+        entry_dir = self._entry_dir(key)
+        tmp_dir = entry_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        files = {}
+        for role, path in artifacts.items():
+            name = role + os.path.splitext(path)[1]
+            shutil.copyfile(path, os.path.join(tmp_dir, name))
+            files[role] = name
+
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+
+        index = self._load_index()
+        index['entries'][key] = {'files': files, 'created': time.time(), 'last_used': time.time()}
+        self._evict(index)
+        self._save_index(index)
+
+    def _evict(self, index):
+        """Drop least recently used entries beyond max_entries."""
+        entries = sorted(index['entries'].items(), key=lambda kv: kv[1]['last_used'], reverse=True)
+        for key, _ in entries[self.max_entries:]:
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            del index['entries'][key]
+
+    def publish(self, cached, targets):
+        """Copy cached artifacts to their published locations ({role: [paths]})."""
+        for role, paths in targets.items():
+            if role not in cached:
+                continue
+            for path in paths:
+                tmp_path = path + '.tmp'
+                shutil.copyfile(cached[role], tmp_path)
+                os.replace(tmp_path, path)
+
+
+# Global instance
+training_cache = TrainingCache()
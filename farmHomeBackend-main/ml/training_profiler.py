@@ -0,0 +1,137 @@
+"""
+GrainHero Training Profiler
+===========================
+Per-phase wall time, CPU time and peak RSS for a training run.
+
+Phases can nest and repeat (repeats are accumulated). On Linux the peak RSS of
+each phase is measured exactly by resetting the kernel high-water mark
+(/proc/self/clear_refs) when a phase starts; elsewhere psutil is used if
+installed, otherwise the process-lifetime peak from getrusage().
+
+The report goes into {grain}_model_metadata.json under 'profile'; an optional
+JSONL trace (one line per phase per run) can be appended for tracking
+training-cost regressions over time.
+"""
+import json
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+TRACE_ENV = 'GRAINHERO_PROFILE_TRACE'
+_PROC_STATUS = '/proc/self/status'
+_PROC_CLEAR_REFS = '/proc/self/clear_refs'
+
+
+def _read_status_kb(field):
+    try:
+        with open(_PROC_STATUS) as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB."""
+    kb = _read_status_kb('VmRSS')
+    if kb is not None:
+        return kb / 1024
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    return peak_rss_mb()
+
+
+def peak_rss_mb():
+    """Peak RSS since the last reset (Linux) or since process start."""
+    kb = _read_status_kb('VmHWM')
+    if kb is not None:
+        return kb / 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS, kilobytes on Linux
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        return None
+
+
+def _reset_peak_rss():
+    """Reset the kernel RSS high-water mark; returns False if unsupported."""
+    try:
+        with open(_PROC_CLEAR_REFS, 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class PhaseProfiler:
+    """Records wall time, CPU time and peak RSS per named phase."""
+
+    def __init__(self, trace_path=None):
+        self.trace_path = trace_path or os.environ.get(TRACE_ENV)
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = datetime.now().isoformat()
+        self.phases = {}
+        self._stack = []
+
+    @contextmanager
+    def phase(self, name):
+        if self._stack:
+            # Fold the parent's peak so far in before resetting the mark
+            self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak_rss_mb() or 0)
+        frame = {'peak': 0.0}
+        self._stack.append(frame)
+        _reset_peak_rss()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            peak = max(frame['peak'], peak_rss_mb() or 0)
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+
+            entry = self.phases.setdefault(name, {
+                'wall_s': 0.0, 'cpu_s': 0.0, 'peak_rss_mb': 0.0, 'calls': 0,
+            })
+            entry['wall_s'] = round(entry['wall_s'] + wall, 3)
+            entry['cpu_s'] = round(entry['cpu_s'] + cpu, 3)
+            entry['peak_rss_mb'] = round(max(entry['peak_rss_mb'], peak), 1)
+            entry['rss_end_mb'] = round(current_rss_mb() or 0, 1)
+            entry['calls'] += 1
+
+    def report(self):
+        return {
+            'run_id': self.run_id,
+            'started': self.started,
+            'phases': self.phases,
+        }
+
+    def write_trace(self, **context):
+        """Append one JSON line per phase to the trace file, if configured."""
+        if not self.trace_path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.trace_path))
+        os.makedirs(directory, exist_ok=True)
+        timestamp = datetime.now().isoformat()
+        with open(self.trace_path, 'a') as f:
+            for name, entry in self.phases.items():
+                record = dict(context, run_id=self.run_id, timestamp=timestamp, phase=name, **entry)
+                f.write(json.dumps(record, default=str) + '\n')
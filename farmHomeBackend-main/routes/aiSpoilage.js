@@ -431,6 +431,8 @@ router.post('/retrain', [
 ], async (req, res) => {
     try {
         const adminId = req.user.admin_id || req.user._id;
+        // incremental: continue the published model on newly added rows, full retrain if rejected
+        const incremental = req.body?.incremental === true;
         const trainingData = await trainingDataService.prepareTrainingData({ adminId });
         const exportedPath = await trainingDataService.exportToCSV(trainingData, path.join(__dirname, '../ml/combined_training_data.csv'));
         const python = spawn('python', ['-c', `
@@ -438,11 +440,17 @@ import sys, json
 sys.path.append('${path.join(__dirname, '../ml')}')
 from enhanced_train import SmartBinModelTrainer
 trainer = SmartBinModelTrainer()
-trainer.incremental_training('combined_training_data.csv')
-X_train, X_test, y_train, y_test, df = trainer.load_and_preprocess_data()
-best_params = trainer.hyperparameter_tuning(X_train, y_train, n_trials=10)
-metrics = trainer.train_model(X_train, X_test, y_train, y_test, best_params)
-trainer.save_model(metrics, best_params)
+if ${incremental ? 'True' : 'False'}:
+    report = trainer.incremental_training()
+    if report.get('published'):
+        print(json.dumps({"success": True, "incremental": report}))
+        sys.exit(0)
+metrics = trainer.publish_cached(n_trials=10)
+if metrics is None:
+    X_train, X_test, y_train, y_test, df = trainer.load_and_preprocess_data()
+    best_params = trainer.hyperparameter_tuning(X_train, y_train, n_trials=10)
+    metrics = trainer.train_model(X_train, X_test, y_train, y_test, best_params)
+    trainer.save_model(metrics, best_params)
 print(json.dumps({"success": True, "metrics": metrics}))
         `], { stdio: ['ignore', 'pipe', 'pipe'] });
         let output = '';
@@ -452,7 +460,12 @@ print(json.dumps({"success": True, "metrics": metrics}))
         python.on('close', (code) => {
             if (code === 0) {
                 try {
-                    const result = JSON.parse(output);
+                    // The trainer prints progress lines; the result is the last line
+                    const lines = output.trim().split('\n');
+                    const result = JSON.parse(lines[lines.length - 1]);
+                    if (result.incremental) {
+                        return res.json({ message: 'Model updated incrementally', data_file: exportedPath, incremental: result.incremental });
+                    }
                     return res.json({ message: 'Model retrained', data_file: exportedPath, metrics: result.metrics });
                 } catch {
                     return res.json({ message: 'Model retrained', data_file: exportedPath, raw_output: output });
@@ -748,8 +761,9 @@ router.post('/retrain', [
 
         const pythonScript = path.join(__dirname, '../ml/enhanced_train.py');
 
-        // Start the training process
-        const python = spawn('python', [pythonScript], {
+        // Start the training process; the time budget keeps it well inside the
+        // 5 minute kill timeout so a valid model is always published
+        const python = spawn('python', [pythonScript, '--time-budget', '270'], {
             stdio: ['pipe', 'pipe', 'pipe']
         });
 
@@ -767,6 +781,8 @@ router.post('/retrain', [
         });
 
         python.on('close', async (code) => {
+            clearTimeout(killTimer);
+            if (res.headersSent) return;
             if (code === 0) {
                 try {
                     // Load the performance tracker
@@ -822,9 +838,9 @@ router.post('/retrain', [
         });
 
         // Handle timeout
-        setTimeout(() => {
+        const killTimer = setTimeout(() => {
             python.kill();
-            res.status(408).json({ error: 'Training timeout' });
+            if (!res.headersSent) res.status(408).json({ error: 'Training timeout' });
         }, 300000); // 5 minutes timeout
 
     } catch (error) {
@@ -1834,12 +1850,14 @@ router.post('/retrain-public', async (req, res) => {
 
         console.log(`Starting ensemble retraining for ${grainType.toUpperCase()}...`);
         const pythonScript = path.join(__dirname, '../ml/ensemble_train.py');
-        const python = spawn('python', [pythonScript, grainType], { stdio: ['pipe', 'pipe', 'pipe'] });
+        // Budget leaves a margin under the 10 min kill timeout below
+        const python = spawn('python', [pythonScript, grainType, '--time-budget', '540'], { stdio: ['pipe', 'pipe', 'pipe'] });
         let output = '';
         let error = '';
         python.stdout.on('data', (d) => { output += d.toString(); console.log('[Ensemble] ' + d.toString().trim()); });
         python.stderr.on('data', (d) => { error += d.toString(); });
         python.on('close', (code) => {
+            clearTimeout(killTimer);
             if (code === 0) {
                 const metrics = parseTrainingOutput(output);
                 console.log(`Ensemble retrain completed for ${grainType}:`, JSON.stringify({
@@ -1859,7 +1877,7 @@ router.post('/retrain-public', async (req, res) => {
                 res.status(500).json({ error: 'Ensemble retrain failed', grain_type: grainType, details: error || output });
             }
         });
-        setTimeout(() => { python.kill(); }, 600000); // 10 min timeout
+        const killTimer = setTimeout(() => { python.kill(); }, 600000); // 10 min timeout
     } catch (error) {
         console.error('Public retrain error:', error);
         res.status(500).json({ error: 'Retrain failed', details: error.message });